@@ -17,4 +17,7 @@ python manage.py collectstatic --noinput || echo "⚠️ Static files collection
 echo "🗄️ Running database migrations..."
 python manage.py migrate --noinput || echo "⚠️ Migration had issues, check logs"
 
+# Cache table (only used with CACHE_BACKEND=db; a no-op if it exists)
+python manage.py createcachetable
+
 echo "✅ Build completed successfully!"
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 import dj_database_url
 
@@ -25,6 +26,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.activity.ActivityMiddleware',             # After auth: throttled last_activity
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +73,11 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock at BEGIN: a transaction that reads then writes
+            # (complaint + rollup) can't fail upgrading its lock mid-way
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+            # File-backed test database: the concurrency tests' threads need real connections
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'civic_test.sqlite3')},
         }
     }
 
@@ -86,6 +93,123 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored once per distinct content, named by their sha256 (core/media.py)
+STORAGES = {
+    'default': {'BACKEND': 'core.media.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Media is served by core.views.media_file to logged-in users. Set
+# MEDIA_SENDFILE to 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect'
+# (nginx, with an internal location at MEDIA_ACCEL_PREFIX aliasing
+# MEDIA_ROOT) to let the front server send the bytes after the auth check.
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# ============================
+# IMAGES
+# ============================
+
+# Uploaded photos are re-encoded by core/images.py: EXIF removed, longest side
+# capped, WebP (JPEG without WebP support) plus srcset thumbnails. Raw uploads
+# wait outside MEDIA_ROOT until a worker has processed them.
+IMAGE_STAGING_ROOT = os.getenv('IMAGE_STAGING_ROOT', os.path.join(BASE_DIR, 'image_staging'))
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_UPLOAD_BYTES', str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50_000_000)))  # Rejects decompression bombs
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '1920'))
+IMAGE_THUMBNAIL_WIDTHS = (320, 640, 1280)
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '80'))
+# Encoding holds the GIL for most of its work: more threads only help with spare cores and I/O-bound storage
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '1'))
+
+# ============================
+# CACHE
+# ============================
+
+# CACHE_BACKEND: locmem (per process, default), file (shared by the workers on
+# one machine) or db (shared by every instance; run `manage.py createcachetable`)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'civic-cache'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.getenv('CACHE_DIR', '/tmp/civic_cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'civic_cache'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': CACHE_BACKENDS[CACHE_BACKEND][1],
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000'))},
+    }
+}
+
+# Seconds the admin analytics/department/feedback stats are cached (core/caching.py);
+# complaint changes invalidate them sooner
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '300'))
+
+# ============================
+# AI CLASSIFICATION
+# ============================
+
+# True: submit_complaint saves with keyword triage and the ML model runs from a
+# DB-backed queue (core/tasks.py), so submit latency doesn't include the model
+AI_ASYNC_CLASSIFICATION = os.getenv('AI_ASYNC_CLASSIFICATION', 'False') == 'True'
+AI_CLASSIFICATION_WORKERS = int(os.getenv('AI_CLASSIFICATION_WORKERS', '1'))
+# A task still Running this long (its worker died) is claimed again, or Failed after 3 attempts
+AI_CLASSIFICATION_LEASE_SECONDS = int(os.getenv('AI_CLASSIFICATION_LEASE_SECONDS', '300'))
+
+# Near-duplicate detection (core/similarity.py): minimum TF-IDF cosine
+# similarity, how far back open complaints are compared, index refresh seconds
+SIMILAR_COMPLAINT_THRESHOLD = float(os.getenv('SIMILAR_COMPLAINT_THRESHOLD', '0.5'))
+SIMILAR_COMPLAINT_DAYS = int(os.getenv('SIMILAR_COMPLAINT_DAYS', '30'))
+SIMILAR_INDEX_TTL = int(os.getenv('SIMILAR_INDEX_TTL', '300'))
+
+# ============================
+# TICKETS
+# ============================
+
+# Ticket numbers each process reserves per counter UPDATE (see core.models.TicketCounter)
+TICKET_ID_BLOCK_SIZE = int(os.getenv('TICKET_ID_BLOCK_SIZE', '20'))
+
+# Most complaints one bulk_action request may change (owners notified in batches)
+BULK_ACTION_LIMIT = int(os.getenv('BULK_ACTION_LIMIT', '5000'))
+
+# ============================
+# NOTIFICATIONS
+# ============================
+
+# prune_notifications deletes notifications older than this
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+
+# ============================
+# SLA
+# ============================
+
+# Hours a ticket may stay Pending before it counts as breached, per priority;
+# SLA_DEPARTMENT_HOURS overrides them per department. Still Pending after
+# SLA_ESCALATION_FACTOR x the deadline: escalated. See core/sla.py.
+SLA_HOURS = {'High': 24, 'Medium': 72, 'Low': 168}
+SLA_DEPARTMENT_HOURS = {
+    'Fire': {'High': 2, 'Medium': 12, 'Low': 48},
+    'Health': {'High': 12},
+    'Electricity': {'High': 12},
+    'Police': {'High': 12},
+}
+SLA_ESCALATION_FACTOR = float(os.getenv('SLA_ESCALATION_FACTOR', '2'))
+# Seconds between sweeps of `sla_sweep --watch`
+SLA_SWEEP_INTERVAL = int(os.getenv('SLA_SWEEP_INTERVAL', '300'))
+
+# ============================
+# USER ACTIVITY
+# ============================
+
+# last_activity is written at most once per ACTIVITY_UPDATE_INTERVAL seconds per
+# user, buffered and flushed in batches (core/activity.py)
+ACTIVITY_UPDATE_INTERVAL = int(os.getenv('ACTIVITY_UPDATE_INTERVAL', '300'))
+ACTIVITY_FLUSH_SIZE = int(os.getenv('ACTIVITY_FLUSH_SIZE', '100'))
+ACTIVITY_FLUSH_SECONDS = int(os.getenv('ACTIVITY_FLUSH_SECONDS', '30'))
+# Windows (minutes) of the admin "active users" counts
+ACTIVE_USER_WINDOWS = (5, 15, 60)
+
 # ============================
 # OTHER SETTINGS
 # ============================
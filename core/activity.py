@@ -0,0 +1,149 @@
+"""
+User.last_activity tracking with write coalescing.
+
+ActivityMiddleware records a logged-in user's activity at most once per
+ACTIVITY_UPDATE_INTERVAL seconds. The check is free: the user row loaded by
+AuthenticationMiddleware already carries last_activity, and users recorded
+but not yet written are remembered in this process. Recorded timestamps are
+buffered and written with one bulk_update once ACTIVITY_FLUSH_SIZE users are
+waiting or the oldest has waited ACTIVITY_FLUSH_SECONDS (and at exit), so a
+page view costs no write at all most of the time. The age limit holds without
+further requests too: a timer thread flushes ACTIVITY_FLUSH_SECONDS after the
+first user is buffered.
+
+active_counts() answers "active in the last 5/15/60 minutes" with one COUNT
+over a range of the last_activity index - only recently active users are
+read, not the whole table. Counts are as fresh as the update interval.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+_pending = {}  # user id -> activity time not yet written
+_pending_since = None  # monotonic time of the oldest pending entry
+_timer = None  # Flushes the buffer once its oldest entry is due
+_lock = threading.Lock()
+
+
+def _start_timer():
+    """Arm the flush timer for a buffer that just got its first entry (caller holds _lock)"""
+    global _timer
+    _timer = threading.Timer(settings.ACTIVITY_FLUSH_SECONDS, _flush_in_thread)
+    _timer.daemon = True
+    _timer.start()
+
+
+def _flush_in_thread():
+    try:
+        flush()
+    finally:
+        connection.close()  # The timer thread owns its connection
+
+
+def record(user, now=None):
+    """Note user's activity; returns True if it was due (older than the update interval)"""
+    now = now or timezone.now()
+    interval = timedelta(seconds=settings.ACTIVITY_UPDATE_INTERVAL)
+    if user.last_activity and now - user.last_activity < interval:
+        return False
+    global _pending_since
+    with _lock:
+        seen = _pending.get(user.pk)
+        if seen is not None and now - seen < interval:
+            return False
+        _pending[user.pk] = now
+        if _pending_since is None:
+            _pending_since = time.monotonic()
+            _start_timer()
+    return True
+
+
+def flush_due():
+    with _lock:
+        return bool(_pending) and (
+            len(_pending) >= settings.ACTIVITY_FLUSH_SIZE
+            or time.monotonic() - _pending_since >= settings.ACTIVITY_FLUSH_SECONDS
+        )
+
+
+def flush():
+    """Write buffered activity times (one bulk_update per batch); returns users written"""
+    global _pending, _pending_since, _timer
+    with _lock:
+        batch, _pending, _pending_since = _pending, {}, None
+        if _timer is not None:
+            _timer.cancel()  # No-op when called from the timer itself
+            _timer = None
+    if not batch:
+        return 0
+    try:
+        User.objects.bulk_update(
+            [User(pk=pk, last_activity=seen) for pk, seen in batch.items()], ['last_activity'],
+            batch_size=settings.ACTIVITY_FLUSH_SIZE,
+        )
+    except DatabaseError:
+        logger.exception('Could not write activity of %d users; retrying with the next flush', len(batch))
+        with _lock:
+            for pk, seen in batch.items():
+                _pending.setdefault(pk, seen)
+            if _pending_since is None:
+                _pending_since = time.monotonic()
+                _start_timer()
+        return 0
+    return len(batch)
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:  # The database may already be gone at interpreter exit
+        pass
+    finally:
+        connection.close()
+
+
+atexit.register(_flush_at_exit)
+
+
+def active_counts(windows=None):
+    """
+    Args:
+        windows: Minutes (default ACTIVE_USER_WINDOWS)
+
+    Returns:
+        dict: {minutes: users active within that many minutes}
+    """
+    windows = sorted(windows or settings.ACTIVE_USER_WINDOWS)
+    flush()  # This process's buffered activity counts too
+    now = timezone.now()
+    counts = User.objects.filter(last_activity__gte=now - timedelta(minutes=windows[-1])).aggregate(**{
+        f'm{m}': Count('id', filter=Q(last_activity__gte=now - timedelta(minutes=m))) for m in windows
+    })
+    return {m: counts[f'm{m}'] for m in windows}
+
+
+class ActivityMiddleware:
+    """Records request.user's activity (place after AuthenticationMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            record(user)
+            if flush_due():
+                flush()
+        return response
@@ -0,0 +1,192 @@
+"""
+Versioned model artifacts for the CIVIC AI engine.
+
+Layout (one directory per trained version, plus a pointer file):
+
+    artifacts/
+        CURRENT                      -> name of the active version
+        20261018T120000123456/
+            manifest.json            -> format, library versions, dataset hash,
+                                        label classes, training metrics
+            bundle.joblib            -> model + vectorizer + label_encoder
+
+bundle.joblib is written uncompressed so it can be loaded with
+mmap_mode='r': its numpy arrays are mapped from the page cache and shared by
+every process instead of being read into each worker. sklearn's Tree copies
+node arrays into its own buffers on unpickle, so for the forest itself the
+sharing comes from loading once in the gunicorn master (gunicorn.conf.py).
+"""
+import hashlib
+import json
+import os
+import platform
+import shutil
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_DIR = os.path.join(BASE_DIR, 'artifacts')
+CURRENT_FILE = os.path.join(ARTIFACT_DIR, 'CURRENT')
+BUNDLE_NAME = 'bundle.joblib'
+MANIFEST_NAME = 'manifest.json'
+
+ARTIFACT_FORMAT = 1
+KEEP_VERSIONS = 3
+
+# Held while a process trains a fallback model; older than this = its owner died
+TRAINING_LOCK = os.path.join(ARTIFACT_DIR, '.training.lock')
+TRAINING_LOCK_STALE_SECONDS = 2 * 3600
+
+
+class ArtifactError(Exception):
+    """Artifact is missing, unreadable or incompatible with this runtime"""
+
+
+def dataset_sha256(csv_path):
+    h = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def runtime_versions():
+    import numpy
+    import sklearn
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def _release(version, parts):
+    return '.'.join(version.split('.')[:parts])
+
+
+def check_compatible(manifest):
+    """Raise ArtifactError if the artifact can't be safely unpickled here"""
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ArtifactError(f"format {manifest.get('format')} != {ARTIFACT_FORMAT}")
+    built, running = manifest.get('versions', {}), runtime_versions()
+    # sklearn only guarantees pickles within a minor release; numpy within a major
+    for lib, parts in (('sklearn', 2), ('numpy', 1)):
+        if _release(built.get(lib, ''), parts) != _release(running[lib], parts):
+            raise ArtifactError(f"built with {lib} {built.get(lib)}, running {running[lib]}")
+
+
+def current_version():
+    try:
+        with open(CURRENT_FILE) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_artifact(version=None, mmap_mode='r'):
+    """
+    Load and validate an artifact.
+
+    Returns:
+        tuple: (bundle dict, manifest dict)
+    """
+    import joblib
+
+    version = version or current_version()
+    if not version:
+        raise ArtifactError("no artifact published")
+    path = os.path.join(ARTIFACT_DIR, version)
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"unreadable manifest for {version}: {e}")
+    check_compatible(manifest)
+    try:
+        bundle = joblib.load(os.path.join(path, BUNDLE_NAME), mmap_mode=mmap_mode)
+    except Exception as e:
+        raise ArtifactError(f"unreadable bundle for {version}: {e}")
+    return bundle, manifest
+
+
+def save_artifact(model, vectorizer, label_encoder, dataset_hash, metrics):
+    """
+    Write a new artifact version and atomically make it CURRENT.
+
+    Returns:
+        dict: the manifest that was written
+    """
+    import joblib
+
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'versions': runtime_versions(),
+        'dataset_sha256': dataset_hash,
+        'label_classes': [str(c) for c in label_encoder.classes_],
+        'metrics': metrics,
+    }
+
+    # Build in a temp dir, then rename: readers never see a half-written version
+    tmp = os.path.join(ARTIFACT_DIR, f'.tmp-{version}-{os.getpid()}')
+    os.makedirs(tmp)
+    try:
+        joblib.dump(
+            {'model': model, 'vectorizer': vectorizer, 'label_encoder': label_encoder},
+            os.path.join(tmp, BUNDLE_NAME),
+        )
+        with open(os.path.join(tmp, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp, os.path.join(ARTIFACT_DIR, version))
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    pointer_tmp = f'{CURRENT_FILE}.{os.getpid()}'
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, CURRENT_FILE)
+
+    _prune(keep=version)
+    return manifest
+
+
+def _prune(keep):
+    """Drop old versions (mapped files stay valid for processes still using them)"""
+    versions = sorted(
+        name for name in os.listdir(ARTIFACT_DIR)
+        if not name.startswith('.') and os.path.isdir(os.path.join(ARTIFACT_DIR, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(ARTIFACT_DIR, name), ignore_errors=True)
+
+
+def acquire_training_lock():
+    """True if this process may train: no other process using this ARTIFACT_DIR is training"""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(TRAINING_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(TRAINING_LOCK) < TRAINING_LOCK_STALE_SECONDS:
+                    return False
+                os.remove(TRAINING_LOCK)  # Left behind by a process that died while training
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def release_training_lock():
+    try:
+        os.remove(TRAINING_LOCK)
+    except FileNotFoundError:
+        pass
@@ -1,24 +1,189 @@
-import pandas as pd
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import numpy as np
 import os
 import re
-import pickle
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
+import threading
 import warnings
 warnings.filterwarnings('ignore')
 
+from . import artifact
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_PATH = os.path.join(BASE_DIR, 'dataset.csv')
-MODEL_PATH = os.path.join(BASE_DIR, 'model_cache.pkl')
-VECTORIZER_PATH = os.path.join(BASE_DIR, 'vectorizer_cache.pkl')
+
+# How often a running process checks artifacts/CURRENT for a newer model
+RELOAD_CHECK_SECONDS = float(os.getenv('AI_RELOAD_CHECK_SECONDS', '30'))
+
+# Map dataset names to system names
+DEPT_MAPPING = {
+    'Municipality': 'Municipal',
+    'Electricity': 'Electricity',
+    'Water': 'Water',
+    'Police/Traffic': 'Police',
+    'Police': 'Police',
+    'PWD': 'PWD',
+    'Health': 'Health',
+    'Health Department': 'Health',
+    'Fire': 'Fire',
+    'Municipal': 'Municipal'
+}
+
+
+def train_and_publish(extra_texts=(), extra_labels=(), n_jobs=-1):
+    """
+    Train a new model from dataset.csv plus optional extra labelled samples
+    (e.g. admin-confirmed production complaints) and publish it as the
+    CURRENT artifact. Running processes pick it up via CivicAI._maybe_reload.
+    
+    Args:
+        extra_texts: Additional complaint descriptions
+        extra_labels: Department for each extra text (system or dataset names)
+        n_jobs: Cores used by RandomForest (keep at 1 inside web workers)
+    
+    Returns:
+        dict: Published manifest, or None if training failed
+    """
+    try:
+        if not os.path.exists(CSV_PATH):
+            print("[WARNING] Dataset not found.")
+            return None
+
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import LabelEncoder
+
+        started = time.perf_counter()
+        dataset_hash = artifact.dataset_sha256(CSV_PATH)
+
+        # Read dataset (+ production labels)
+        data = pd.read_csv(CSV_PATH)
+        texts = list(data['text']) + list(extra_texts)
+        labels = list(data['label']) + list(extra_labels)
+        labels = [DEPT_MAPPING.get(label, label) for label in labels]  # One class per department
+
+        # Encode labels
+        label_encoder = LabelEncoder()
+        y = label_encoder.fit_transform(labels)
+
+        # Build vectorizer with improved parameters
+        vectorizer = TfidfVectorizer(
+            max_features=5000,
+            ngram_range=(1, 2),
+            min_df=2,
+            max_df=0.95,
+            lowercase=True,
+            stop_words='english',
+            sublinear_tf=True
+        )
+        X = vectorizer.fit_transform(texts)
+
+        # Train RandomForest (better than Naive Bayes for this use case)
+        model = RandomForestClassifier(
+            n_estimators=100,
+            max_depth=20,
+            min_samples_split=5,
+            random_state=42,
+            n_jobs=n_jobs
+        )
+        model.fit(X, y)
+
+        metrics = {
+            'training_samples': len(texts),
+            'production_samples': len(extra_texts),
+            'features': len(vectorizer.vocabulary_),
+            'train_accuracy': round(float(model.score(X, y)), 4),
+            'training_seconds': round(time.perf_counter() - started, 2),
+        }
+        manifest = artifact.save_artifact(model, vectorizer, label_encoder, dataset_hash, metrics)
+
+        print(f"[OK] AI Engine Trained & Published artifact {manifest['version']}")
+        print(f"   - TF-IDF Vectorizer: 5000 features, bigrams enabled")
+        print(f"   - RandomForest: 100 trees, max_depth=20")
+        print(f"   - Training samples: {len(texts)} ({len(extra_texts)} from production)")
+        return manifest
+
+    except Exception as e:
+        print(f"[ERROR] Training Error: {e}")
+        return None
+
+
+class KeywordIndex:
+    """
+    Single-pass keyword matcher built once from the keyword dictionaries.
+
+    All phrases are compiled into one alternation regex wrapped in a lookahead,
+    so one finditer() visits every word boundary of the text and reports the
+    longest phrase starting there. Each phrase carries the tags of every shorter
+    keyword that is a word-prefix of it ('street light' also tags 'street'), so
+    the result is the same set of keywords the per-word re.search loop finds.
+    """
+
+    def __init__(self, groups):
+        """
+        Args:
+            groups: dict of {group_name: {tag: [keywords]}}, tags kept in order
+        """
+        self.tag_order = {name: list(tags) for name, tags in groups.items()}
+        phrase_tags = {}
+        for name, tags in groups.items():
+            for tag, words in tags.items():
+                for word in words:
+                    phrase_tags.setdefault(word, set()).add((name, tag))
+
+        # A keyword matching at a position is always a word-prefix of the
+        # longest keyword matching there, so fold prefix tags into each phrase.
+        word_prefix = {
+            phrase: re.compile(re.escape(phrase) + r'\b') for phrase in phrase_tags
+        }
+        self.phrase_tags = {}
+        for phrase in phrase_tags:
+            tags = set()
+            for other, other_tags in phrase_tags.items():
+                if word_prefix[other].match(phrase):
+                    tags |= other_tags
+            self.phrase_tags[phrase] = tags
+
+        alternation = '|'.join(
+            re.escape(p) for p in sorted(phrase_tags, key=len, reverse=True)
+        )
+        self.pattern = re.compile(r'(?=\b(' + alternation + r')\b)')
+
+    def match(self, text_lower):
+        """
+        Scan text once.
+
+        Returns:
+            dict: {group_name: [matched tags in declaration order]}
+        """
+        found = set()
+        for m in self.pattern.finditer(text_lower):
+            found |= self.phrase_tags[m.group(1)]
+        return {
+            name: [tag for tag in order if (name, tag) in found]
+            for name, order in self.tag_order.items()
+        }
+
 
 class CivicAI:
-    def __init__(self):
-        self.model = None
-        self.vectorizer = None
-        self.label_encoder = None
+    def __init__(self, lazy=False):
+        """
+        Args:
+            lazy: Defer loading/training the ML model until the first prediction
+                  (or an explicit load() call, e.g. in the gunicorn master)
+        """
+        # {'model', 'vectorizer', 'label_encoder', 'manifest'}, replaced as a whole
+        self.bundle = None
         self.model_confidence = 0.0
+        self.loaded = False
+        self._load_lock = threading.Lock()
+        self._train_lock = threading.Lock()
+        self._training_thread = None
+        self._reload_thread = None
+        self._next_reload_check = 0.0
+        self.stats = {'import_ms': None, 'load_ms': None, 'loaded_pid': None}
         
         # Enhanced Priority Keywords with variations
         self.priority_keywords = {
@@ -89,74 +254,110 @@ class CivicAI:
             ]
         }
 
+        # Compile keyword dictionaries once (single scan per prediction)
+        self.keyword_index = KeywordIndex({
+            'priority': self.priority_keywords,
+            'dept': self.dept_keywords,
+        })
+
         # Load or train ML model
-        self._load_or_train_model()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        """Load the ML model once per process (thread-safe, idempotent)"""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if self.loaded:
+                return
+            started = time.perf_counter()
+            self._load_or_train_model()
+            self.stats['load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            self.stats['loaded_pid'] = os.getpid()
+            self.loaded = True
+            print(f"[OK] AI Engine ready in {self.stats['load_ms']} ms (pid {os.getpid()})")
+
+    @property
+    def model(self):
+        return self.bundle['model'] if self.bundle else None
+
+    @property
+    def vectorizer(self):
+        return self.bundle['vectorizer'] if self.bundle else None
+
+    @property
+    def label_encoder(self):
+        return self.bundle['label_encoder'] if self.bundle else None
 
     def _load_or_train_model(self):
-        """Load cached model or train from scratch"""
+        """Load the published artifact, or train one in the background"""
         try:
-            if os.path.exists(MODEL_PATH) and os.path.exists(VECTORIZER_PATH):
-                with open(MODEL_PATH, 'rb') as f:
-                    self.model = pickle.load(f)
-                with open(VECTORIZER_PATH, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
-                print("[OK] AI Engine Loaded from Cache (Improved v2.0)")
-            else:
-                self._train_model()
-        except Exception as e:
-            print(f"[WARNING] Cache Load Error: {e}, Training from scratch...")
-            self._train_model()
+            bundle, manifest = artifact.load_artifact()
+        except artifact.ArtifactError as e:
+            # Keyword matching serves predictions until training finishes
+            print(f"[WARNING] Artifact Load Error: {e}, Training in background...")
+            self.train_in_background()
+            return
+
+        self.bundle = dict(bundle, manifest=manifest)
+        self._next_reload_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        print(f"[OK] AI Engine Loaded artifact {manifest['version']} (mmap)")
+        if os.path.exists(CSV_PATH) and artifact.dataset_sha256(CSV_PATH) != manifest['dataset_sha256']:
+            print("[WARNING] dataset.csv changed since artifact was built, retraining in background...")
+            self.train_in_background()
+
+    def train_in_background(self):
+        """Start (at most one) daemon thread that trains and swaps in a new model"""
+        with self._train_lock:
+            if self._training_thread and self._training_thread.is_alive():
+                return self._training_thread
+            self._training_thread = threading.Thread(target=self._train_model, name='civic-ai-train', daemon=True)
+            self._training_thread.start()
+            return self._training_thread
 
     def _train_model(self):
-        """Train model from dataset"""
+        """
+        Train in-process (single core, so web requests aren't starved) and swap in.
+        Only one process per artifacts directory trains; the others keep using
+        keywords and pick the result up through _maybe_reload.
+        """
+        if not artifact.acquire_training_lock():
+            print(f"[OK] Another process is training the model; keywords until it publishes (pid {os.getpid()})")
+            return
         try:
-            if not os.path.exists(CSV_PATH):
-                print("[WARNING] Dataset not found.")
-                return
+            manifest = train_and_publish(n_jobs=1)
+        finally:
+            artifact.release_training_lock()
+        if manifest:
+            self._swap_to(manifest['version'])
 
-            # Read dataset
-            self.data = pd.read_csv(CSV_PATH)
-            
-            # Encode labels
-            self.label_encoder = LabelEncoder()
-            y = self.label_encoder.fit_transform(self.data['label'])
-            
-            # Build vectorizer with improved parameters
-            self.vectorizer = TfidfVectorizer(
-                max_features=5000,
-                ngram_range=(1, 2),
-                min_df=2,
-                max_df=0.95,
-                lowercase=True,
-                stop_words='english',
-                sublinear_tf=True
-            )
-            X = self.vectorizer.fit_transform(self.data['text'])
-            
-            # Train RandomForest (better than Naive Bayes for this use case)
-            self.model = RandomForestClassifier(
-                n_estimators=100,
-                max_depth=20,
-                min_samples_split=5,
-                random_state=42,
-                n_jobs=-1
-            )
-            self.model.fit(X, y)
-            
-            # Cache the model
-            with open(MODEL_PATH, 'wb') as f:
-                pickle.dump(self.model, f)
-            with open(VECTORIZER_PATH, 'wb') as f:
-                pickle.dump(self.vectorizer, f)
-            
-            print("[OK] AI Engine Trained & Cached (Improved v2.0)")
-            print(f"   - TF-IDF Vectorizer: 5000 features, bigrams enabled")
-            print(f"   - RandomForest: 100 trees, max_depth=20")
-            print(f"   - Training samples: {len(self.data)}")
-            
-        except Exception as e:
-            print(f"[ERROR] Training Error: {e}")
+    def _swap_to(self, version):
+        """Load a published artifact and replace the in-memory model in one assignment"""
+        try:
+            bundle, manifest = artifact.load_artifact(version)
+        except artifact.ArtifactError as e:
+            print(f"[WARNING] Artifact Swap Error: {e}")
+            return
+        self.bundle = dict(bundle, manifest=manifest)
+        print(f"[OK] AI Engine swapped to artifact {version} (pid {os.getpid()})")
 
+    def _maybe_reload(self):
+        """
+        Hot-swap check: every RELOAD_CHECK_SECONDS re-read artifacts/CURRENT and,
+        if another process published a newer version, load it off the request path.
+        """
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + RELOAD_CHECK_SECONDS
+        version = artifact.current_version()
+        loaded = self.bundle['manifest']['version'] if self.bundle else None
+        if version and version != loaded and not (self._reload_thread and self._reload_thread.is_alive()):
+            self._reload_thread = threading.Thread(
+                target=self._swap_to, args=(version,), name='civic-ai-reload', daemon=True
+            )
+            self._reload_thread.start()
 
     def predict(self, text, confidence_threshold=0.3):
         """
@@ -169,70 +370,97 @@ class CivicAI:
         Returns:
             tuple: (predicted_dept, predicted_prio, confidence_score)
         """
-        text_lower = text.lower()
-        predicted_dept = "Municipal"  # Default
-        predicted_prio = "Low"        # Default
-        confidence = 0.0
+        depts, prios, confidences = self.predict_batch([text], confidence_threshold)
+        return depts[0], prios[0], confidences[0]
+
+    def predict_keywords(self, text):
+        """
+        Keyword-only prediction (never touches the ML model, so it can't block on
+        loading). Used for provisional triage before full classification.
         
-        # 1. PRIORITY DETECTION (Keyword-based - highest accuracy)
-        for word in self.priority_keywords['High']:
-            if re.search(r'\b' + re.escape(word) + r'\b', text_lower):
-                predicted_prio = "High"
-                break
+        Returns:
+            tuple: (predicted_dept, predicted_prio, confidence_score)
+        """
+        m = self.keyword_index.match((text or '').lower())
+        predicted_prio = "Low"
+        if 'High' in m['priority']:
+            predicted_prio = "High"
+        elif 'Medium' in m['priority']:
+            predicted_prio = "Medium"
+        if m['dept']:
+            return m['dept'][0], predicted_prio, 0.5
+        return "Municipal", predicted_prio, 0.0
+
+    def predict_batch(self, texts, confidence_threshold=0.3):
+        """
+        Predict many complaints at once (one TF-IDF transform + one predict_proba)
         
-        if predicted_prio == "Low":  # If not High, check Medium
-            for word in self.priority_keywords['Medium']:
-                if re.search(r'\b' + re.escape(word) + r'\b', text_lower):
-                    predicted_prio = "Medium"
-                    break
+        Args:
+            texts: List of complaint descriptions
+            confidence_threshold: Minimum confidence for ML prediction (0.0-1.0)
         
+        Returns:
+            tuple: (depts, prios, confidences) lists aligned with texts
+        """
+        self.load()
+        self._maybe_reload()
+        texts = [text or '' for text in texts]
+        n = len(texts)
+        predicted_depts = ["Municipal"] * n  # Default
+        predicted_prios = ["Low"] * n        # Default
+        confidences = [0.0] * n
+
+        matches = [self.keyword_index.match(text.lower()) for text in texts]
+
+        # 1. PRIORITY DETECTION (Keyword-based - highest accuracy)
+        for i, m in enumerate(matches):
+            if 'High' in m['priority']:
+                predicted_prios[i] = "High"
+            elif 'Medium' in m['priority']:  # If not High, check Medium
+                predicted_prios[i] = "Medium"
+
         # 2. ML-BASED DEPARTMENT DETECTION with confidence scoring
-        ml_dept = None
-        ml_confidence = 0.0
-        
-        if self.model and self.vectorizer and self.label_encoder:
+        ml_confidences = np.zeros(n)
+        bundle = self.bundle  # May be hot-swapped by a training thread
+
+        if n and bundle:
             try:
-                X = self.vectorizer.transform([text])
-                probabilities = self.model.predict_proba(X)[0]
-                max_prob_idx = probabilities.argmax()
-                ml_confidence = probabilities[max_prob_idx]
-                
-                if ml_confidence >= confidence_threshold:
-                    ml_dept = self.label_encoder.inverse_transform([max_prob_idx])[0]
-                    confidence = ml_confidence
-                    
-                    # Map dataset names to system names
-                    dept_mapping = {
-                        'Municipality': 'Municipal',
-                        'Electricity': 'Electricity',
-                        'Water': 'Water',
-                        'Police/Traffic': 'Police',
-                        'Police': 'Police',
-                        'PWD': 'PWD',
-                        'Health': 'Health',
-                        'Health Department': 'Health',
-                        'Fire': 'Fire',
-                        'Municipal': 'Municipal'
-                    }
-                    predicted_dept = dept_mapping.get(ml_dept, "Municipal")
+                X = bundle['vectorizer'].transform(texts)
+                probabilities = bundle['model'].predict_proba(X)
+                max_prob_idx = probabilities.argmax(axis=1)
+                top = probabilities[np.arange(n), max_prob_idx]
+                ml_depts = bundle['label_encoder'].inverse_transform(max_prob_idx)
             except Exception as e:
-                pass  # Fall back to keyword matching
-        
+                # Nothing from the model is kept: the whole batch falls back to keyword matching
+                print(f"[WARNING] AI Prediction Error: {e!r}, using keywords for {n} complaints")
+            else:
+                ml_confidences = top
+                for i in np.flatnonzero(ml_confidences >= confidence_threshold):
+                    predicted_depts[i] = DEPT_MAPPING.get(ml_depts[i], "Municipal")
+                    confidences[i] = float(ml_confidences[i])
+
         # 3. FALLBACK KEYWORD CHECK (If ML didn't provide confident prediction)
-        if ml_confidence < confidence_threshold:
-            found_keyword = False
-            for dept, keywords in self.dept_keywords.items():
-                for word in keywords:
-                    if re.search(r'\b' + re.escape(word) + r'\b', text_lower):
-                        if not found_keyword:
-                            predicted_dept = dept
-                            found_keyword = True
-                            confidence = 0.5  # Lower confidence for keyword match
-                        break
-                if found_keyword:
-                    break
+        for i, m in enumerate(matches):
+            if ml_confidences[i] < confidence_threshold and m['dept']:
+                predicted_depts[i] = m['dept'][0]  # First department in declaration order
+                confidences[i] = 0.5  # Lower confidence for keyword match
+
+        return predicted_depts, predicted_prios, [round(c, 3) for c in confidences]
+
+    def embed(self, texts):
+        """
+        TF-IDF vectors for texts (rows are L2-normalised, so a dot product is cosine similarity)
         
-        return predicted_dept, predicted_prio, round(confidence, 3)
+        Returns:
+            tuple: (vectorizer used, sparse matrix), or (None, None) while no model is loaded
+        """
+        self.load()
+        self._maybe_reload()
+        bundle = self.bundle  # May be hot-swapped by a training thread
+        if not bundle:
+            return None, None
+        return bundle['vectorizer'], bundle['vectorizer'].transform([text or '' for text in texts])
 
-# Initialize AI bot
-ai_bot = CivicAI()
\ No newline at end of file
+# Initialize AI bot (model is loaded on first predict, or preloaded by gunicorn.conf.py)
+ai_bot = CivicAI(lazy=True)
+ai_bot.stats['import_ms'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
@@ -0,0 +1,110 @@
+"""
+Cache for the admin statistics views.
+
+analytics_view, department_stats and feedback_dashboard aggregate a whole
+department's complaints on every request. Their results are cached per
+(view, department, city) for STATS_CACHE_TTL seconds in the configured
+Django cache (local memory, file or database - see CACHES in settings).
+
+Invalidation is write-through: any change to a complaint deletes the entries
+of the department/city it belongs to - from Complaint signals for save() and
+delete(), and by explicit invalidate() calls on the .update() paths
+(bulk_action, background classification) that bypass signals. Deletes run on
+transaction commit, so a request can't re-cache the pre-commit numbers.
+
+Views with open-ended parameters (trends) cache one entry per variant; those
+can't be listed for deletion, so their keys carry a per-scope version token
+that invalidate() deletes (the next request starts a new one).
+
+Hits and misses per view are counted in the cache itself, so with a shared
+backend (file/database) they add up across worker processes.
+"""
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import normalize_city
+
+VIEWS = ('analytics', 'department_stats', 'feedback', 'trends')
+ALL_CITIES = '*'  # department_stats covers every city of a department
+
+
+def _key(view, department, city):
+    return 'stats:' + ':'.join(quote(part or '', safe='') for part in (view, department, city))
+
+
+def _count(view, outcome):
+    key = f'stats-{outcome}:{view}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First one (or evicted): add() loses the race harmlessly to another worker
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _version_key(department, city):
+    return _key('version', department, city)
+
+
+def cached(view, department, city, compute, variant=None):
+    """
+    Args:
+        view: One of VIEWS
+        department: Department name
+        city: City as entered (normalized here), or ALL_CITIES
+        compute: Zero-argument callable producing the (picklable) value on a miss
+        variant: Optional string identifying the request parameters
+
+    Returns:
+        The cached or freshly computed value
+    """
+    city = city if city == ALL_CITIES else normalize_city(city)
+    key = _key(view, department, city)
+    if variant is not None:
+        version = cache.get_or_set(_version_key(department, city), lambda: uuid.uuid4().hex, timeout=None)
+        key = f'{key}:{quote(variant, safe="")}:{version}'
+    value = cache.get(key)
+    if value is not None:
+        _count(view, 'hits')
+        return value
+    _count(view, 'misses')
+    value = compute()
+    cache.set(key, value, settings.STATS_CACHE_TTL)
+    return value
+
+
+def invalidate(department, city):
+    """Drop cached stats for a department/city (after the current transaction commits)"""
+    city = normalize_city(city)
+    keys = [_key(view, department, c) for view in VIEWS for c in (city, ALL_CITIES)]
+    versions = [_version_key(department, c) for c in (city, ALL_CITIES)]
+
+    def drop():
+        cache.delete_many(keys + versions)  # Variant keys become unreachable and expire
+
+    transaction.on_commit(drop)
+
+
+def invalidate_scopes(scopes):
+    """invalidate() for each distinct (department, city) pair"""
+    for department, city in set(scopes):
+        invalidate(department, city)
+
+
+def counters():
+    """{view: {'hits', 'misses', 'hit_rate'}} for monitoring"""
+    values = cache.get_many([f'stats-{o}:{v}' for v in VIEWS for o in ('hits', 'misses')])
+    result = {}
+    for view in VIEWS:
+        hits = values.get(f'stats-hits:{view}', 0)
+        misses = values.get(f'stats-misses:{view}', 0)
+        result[view] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return result
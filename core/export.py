@@ -0,0 +1,207 @@
+"""
+Streaming complaint export.
+
+Rows come from `.values_list(...).iterator(chunk_size=...)` - tuples, not model
+instances - and are encoded one chunk at a time, so memory stays flat however
+many rows a department has. On PostgreSQL `.iterator()` uses a server-side
+cursor; SQLite steps its cursor in chunks.
+
+Formats: csv, csv.gz (gzip-compressed as it streams), jsonl (one object per
+line) and parquet (one row group per chunk, needs pyarrow).
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+CHUNK_SIZE = 2000
+
+# key -> (CSV header, model field, kind)
+EXPORT_COLUMNS = {
+    'ticket_id': ('Ticket ID', 'ticket_id', 'int'),
+    'description': ('Description', 'description', 'text'),
+    'location': ('Location', 'location_name', 'text'),
+    'status': ('Status', 'status', 'text'),
+    'priority': ('Priority', 'priority', 'text'),
+    'created': ('Created', 'created_at', 'datetime'),
+    'resolved': ('Resolved', 'solved_at', 'datetime'),
+    'feedback': ('Feedback', 'feedback', 'text'),
+    'rating': ('Rating', 'rating', 'int'),
+    # Opt-in via ?columns=
+    'department': ('Department', 'department', 'text'),
+    'category': ('Category', 'category', 'text'),
+    'city': ('City', 'city', 'text'),
+    'pincode': ('Pincode', 'pincode', 'text'),
+    'resolution': ('Resolution', 'resolution', 'text'),
+    'closed': ('Closed', 'closed_at', 'datetime'),
+    'latitude': ('Latitude', 'latitude', 'float'),
+    'longitude': ('Longitude', 'longitude', 'float'),
+}
+DEFAULT_COLUMNS = ['ticket_id', 'description', 'location', 'status', 'priority', 'created', 'resolved', 'feedback', 'rating']
+
+# format -> (content type, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def available_formats():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return [f for f in FORMATS if f != 'parquet']
+    return list(FORMATS)
+
+
+def parse_columns(value):
+    """'ticket_id,status' -> ['ticket_id', 'status']; unknown keys are dropped, empty -> DEFAULT_COLUMNS"""
+    columns = [c.strip() for c in (value or '').split(',') if c.strip() in EXPORT_COLUMNS]
+    return list(dict.fromkeys(columns)) or DEFAULT_COLUMNS
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value) if value else None
+    except ValueError:  # Well formed but not a date (2024-02-30)
+        return None
+
+
+def filter_dates(complaints, date_from=None, date_to=None):
+    """Limit to created_at within [date_from, date_to] (YYYY-MM-DD local days, both inclusive, bad values ignored)"""
+    start, end = _parse_day(date_from), _parse_day(date_to)
+    # Bounds at local midnight, like the dates shown in the export
+    if start:
+        complaints = complaints.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        complaints = complaints.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    return complaints
+
+
+def _rows(complaints, columns, chunk_size):
+    """Yield lists of value tuples, chunk_size rows at a time"""
+    fields = [EXPORT_COLUMNS[c][1] for c in columns]
+    rows = complaints.order_by('created_at', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _csv(complaints, columns, chunk_size):
+    kinds = [EXPORT_COLUMNS[c][2] for c in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([EXPORT_COLUMNS[c][0] for c in columns])
+    for chunk in _rows(complaints, columns, chunk_size):
+        for row in chunk:
+            writer.writerow([
+                '' if value is None else timezone.localtime(value).strftime('%Y-%m-%d %H:%M') if kind == 'datetime' else value
+                for value, kind in zip(row, kinds)
+            ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # Header only (no rows)
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for data in chunks:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _jsonl(complaints, columns, chunk_size):
+    kinds = [EXPORT_COLUMNS[c][2] for c in columns]
+    for chunk in _rows(complaints, columns, chunk_size):
+        lines = []
+        for row in chunk:
+            record = {c: timezone.localtime(v).isoformat() if v is not None and kind == 'datetime' else v
+                      for c, v, kind in zip(columns, row, kinds)}
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+class _Drain:
+    """Write-only file object whose bytes are collected and handed out by take()"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet(complaints, columns, chunk_size):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {'int': pa.int64(), 'text': pa.string(), 'datetime': pa.timestamp('us', tz='UTC'), 'float': pa.float64()}
+    schema = pa.schema([(c, types[EXPORT_COLUMNS[c][2]]) for c in columns])
+    drain = _Drain()
+    with pq.ParquetWriter(pa.PythonFile(drain, mode='w'), schema) as writer:
+        for chunk in _rows(complaints, columns, chunk_size):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+                schema=schema,
+            ))
+            yield drain.take()
+    yield drain.take()  # Footer
+
+
+def stream_export(complaints, fmt='csv', columns=None, chunk_size=CHUNK_SIZE):
+    """
+    Args:
+        complaints: Complaint queryset (already scoped and filtered)
+        fmt: One of FORMATS
+        columns: Keys of EXPORT_COLUMNS (default DEFAULT_COLUMNS)
+
+    Returns:
+        Iterator of bytes for a StreamingHttpResponse
+
+    Raises:
+        ValueError: Unknown or unavailable format
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+    columns = columns or DEFAULT_COLUMNS
+    if fmt == 'csv':
+        return _csv(complaints, columns, chunk_size)
+    if fmt == 'csv.gz':
+        return _gzip(_csv(complaints, columns, chunk_size))
+    if fmt == 'jsonl':
+        return _jsonl(complaints, columns, chunk_size)
+    return _parquet(complaints, columns, chunk_size)
@@ -0,0 +1,131 @@
+"""
+Spatial grid cells and server-side map clustering.
+
+Every geotagged complaint stores `geo_cell`: its position on a 2^26 x 2^26
+lon/lat grid (square ~0.6 m cells) as a Morton (Z-order) code - the x and y bits
+interleaved. Two useful properties:
+
+- Dropping the low 2k bits gives the enclosing cell k levels up, so
+  clustering at any zoom is a bit shift.
+- All cells inside a bbox fall between the codes of its SW and NE corners,
+  so a bbox query is one index range scan on (department, city, geo_cell).
+
+clusters() groups in SQL at a fine level (at most 16 sub-cells per cluster,
+each with its count and mean position) and NumPy merges those into per-zoom
+clusters with count-weighted centroids, so the response stays a few KB however many rows are in view.
+"""
+import numpy as np
+from django.db.models import Avg, BigIntegerField, Count, F, Q, Value
+from django.db.models.expressions import ExpressionWrapper
+
+GRID_BITS = 26
+GRID_SIZE = 1 << GRID_BITS
+CLUSTER_BINS_PER_TILE = 2  # 2^2 = 4 clusters across a 256px tile (~64px apart)
+SUB_LEVELS = 2  # SQL groups 2 levels finer than the clusters
+POINT_LIMIT = 100  # Few enough rows in view -> send the points themselves
+
+
+def _spread(v):
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    return (v | (v << 1)) & 0x5555555555555555
+
+
+def grid_xy(lat, lng):
+    x = int((float(lng) + 180.0) / 360.0 * GRID_SIZE)
+    y = int((float(lat) + 180.0) / 360.0 * GRID_SIZE)  # Same degrees per cell as x (top half unused)
+    return min(max(x, 0), GRID_SIZE - 1), min(max(y, 0), GRID_SIZE - 1)
+
+
+def cell_xy(lat, lng, level):
+    """Grid (x, y) of the cell containing (lat, lng) at `level` bits per axis"""
+    x, y = grid_xy(lat, lng)
+    return x >> (GRID_BITS - level), y >> (GRID_BITS - level)
+
+
+def cell_range(x, y, level):
+    """(first, last) geo_cell inside cell (x, y) at `level` - one contiguous range on the Z-order curve"""
+    shift = 2 * (GRID_BITS - level)
+    code = _spread(x) | (_spread(y) << 1)
+    return code << shift, ((code + 1) << shift) - 1
+
+
+def encode(lat, lng):
+    """Morton code of the grid cell containing (lat, lng); None if either is missing"""
+    if lat is None or lng is None:
+        return None
+    x, y = grid_xy(lat, lng)
+    return _spread(x) | (_spread(y) << 1)
+
+
+def parse_bbox(value):
+    """'west,south,east,north' -> tuple of floats, or None"""
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if west > east or south > north:
+        return None
+    return west, south, east, north
+
+
+def cluster_level(zoom):
+    """Grid bits per axis for clusters at a Leaflet/OSM zoom level"""
+    return max(1, min(GRID_BITS - SUB_LEVELS, zoom + CLUSTER_BINS_PER_TILE))
+
+
+def in_bbox(complaints, bbox=None):
+    """Geotagged complaints inside (west, south, east, north); all geotagged ones if bbox is None"""
+    complaints = complaints.filter(geo_cell__isnull=False)
+    if bbox:
+        west, south, east, north = bbox
+        complaints = complaints.filter(
+            geo_cell__range=(encode(south, west), encode(north, east)),
+            latitude__range=(south, north), longitude__range=(west, east),
+        )
+    return complaints
+
+
+def clusters(complaints, zoom, bbox=None):
+    """
+    Args:
+        complaints: Complaint queryset (already scoped/filtered)
+        zoom: Map zoom level (0-20)
+        bbox: (west, south, east, north) or None for everything
+
+    Returns:
+        dict: total (rows in view), clusters ([lat, lng, count, high_priority]),
+        bounds ([[south, west], [north, east]] of the data, or None)
+    """
+    complaints = in_bbox(complaints, bbox)
+    level = cluster_level(zoom)
+    sub_shift = 2 * (GRID_BITS - level - SUB_LEVELS)
+    sub_cells = list(
+        complaints.order_by()
+        .annotate(sub=ExpressionWrapper(F('geo_cell') / Value(1 << sub_shift), output_field=BigIntegerField()))
+        .values('sub')
+        .annotate(n=Count('id'), high=Count('id', filter=Q(priority='High')),
+                  lat=Avg('latitude'), lng=Avg('longitude'))
+        .values_list('sub', 'n', 'high', 'lat', 'lng')
+    )
+    if not sub_cells:
+        return {'total': 0, 'clusters': [], 'bounds': None}
+
+    sub, n, high, lat, lng = (np.array(col) for col in zip(*sub_cells))
+    _, inverse = np.unique(sub.astype(np.int64) >> (2 * SUB_LEVELS), return_inverse=True)
+    counts = np.bincount(inverse, weights=n)
+    c_lat = np.bincount(inverse, weights=lat * n) / counts
+    c_lng = np.bincount(inverse, weights=lng * n) / counts
+    c_high = np.bincount(inverse, weights=high)
+
+    return {
+        'total': int(n.sum()),
+        'clusters': [
+            [round(float(a), 5), round(float(b), 5), int(c), int(h)]
+            for a, b, c, h in zip(c_lat, c_lng, counts, c_high)
+        ],
+        'bounds': [[round(float(lat.min()), 5), round(float(lng.min()), 5)],
+                   [round(float(lat.max()), 5), round(float(lng.max()), 5)]],
+    }
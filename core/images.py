@@ -0,0 +1,261 @@
+"""
+Image ingestion for complaint photos and profile pictures.
+
+Uploads are never stored as-is. ingest() hashes the uploaded bytes and looks
+up a ProcessedImage by sha256:
+
+- already processed: the complaint/profile points at its renditions at once
+- new: the raw file is staged outside MEDIA_ROOT (it still has its EXIF,
+  GPS position included) and processed by a small in-process thread pool
+  once the request's transaction commits
+
+Processing (process()) applies the EXIF orientation, drops all metadata,
+downscales to IMAGE_MAX_DIMENSION, re-encodes as WebP (JPEG where Pillow has
+no WebP support) and writes IMAGE_THUMBNAIL_WIDTHS thumbnails next to it,
+all named by the content hash. Every complaint/user linked to the image is
+then pointed at the main rendition with one UPDATE each. The process_images
+command drains anything left Pending (e.g. after a restart) and ingests the
+legacy files already in media/.
+"""
+import hashlib
+import io
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .models import Complaint, ProcessedImage, User
+
+CHUNK_SIZE = 1 << 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='civic-images')
+        return _executor
+
+
+def staging_storage():
+    return FileSystemStorage(location=settings.IMAGE_STAGING_ROOT)
+
+
+def output_format():
+    """(Pillow format, extension): WebP if this Pillow build can write it"""
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def sha256_of(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def rejected_message():
+    """Shown to the user when their photo was not attached"""
+    limit = settings.IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)
+    return f"Your photo was not attached: it must be a JPEG, PNG or WebP image under {limit} MB."
+
+
+def check_upload(upload):
+    """Reject non-images, oversized files and decompression bombs from the header alone (no decode)"""
+    if upload.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+        return False
+    try:
+        with Image.open(upload) as img:
+            ok = img.width * img.height <= settings.IMAGE_MAX_PIXELS
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        ok = False
+    upload.seek(0)
+    return ok
+
+
+def ingest(upload, enqueue=True):
+    """
+    Args:
+        upload: UploadedFile from request.FILES (or any django File)
+        enqueue: Hand a new image to the thread pool on commit (False: left for process_pending)
+
+    Returns:
+        ProcessedImage (possibly still Pending), or None if the upload isn't an
+        acceptable image (tell the user: rejected_message())
+    """
+    if not check_upload(upload):
+        return None
+    sha = sha256_of(upload)
+    asset, created = ProcessedImage.objects.get_or_create(sha256=sha, defaults={'original_bytes': upload.size})
+    if created or asset.status == 'Failed':
+        asset.staged = staging_storage().save(f'{sha[:2]}/{sha}', upload)
+        asset.status, asset.error = 'Pending', ''
+        asset.save(update_fields=['staged', 'status', 'error'])
+        if enqueue:
+            transaction.on_commit(lambda: _get_executor().submit(_process_in_thread, asset.pk))
+    return asset
+
+
+def attach(instance, field, asset):
+    """Point instance.<field> (image / profile_pic) at asset; empty until a pending asset is processed"""
+    setattr(instance, f'{field}_asset', asset)
+    setattr(instance, field, asset.name if asset and asset.status == 'Done' else None)
+
+
+def _process_in_thread(pk):
+    try:
+        process(pk)
+    finally:
+        connection.close()  # Pool threads own their connection
+
+
+def _encode(img, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'WEBP':
+        img.save(buffer, 'WEBP', quality=settings.IMAGE_QUALITY, method=4, icc_profile=img.info.get('icc_profile'))
+    else:
+        img.save(buffer, 'JPEG', quality=settings.IMAGE_QUALITY, optimize=True, progressive=True,
+                 icc_profile=img.info.get('icc_profile'))
+    return buffer.getvalue()
+
+
+def _save(name, data):
+    """Store a rendition; returns the storage name (ContentAddressedStorage stores identical bytes once)"""
+    return default_storage.save(name, ContentFile(data))
+
+
+def render(source):
+    """
+    Args:
+        source: Binary file object with the original image
+
+    Returns:
+        tuple: (width, height, {width: encoded bytes}) - the main rendition and thumbnails
+    """
+    fmt, _ = output_format()
+    with Image.open(source) as img:
+        scale = max(img.size) / settings.IMAGE_MAX_DIMENSION
+        if scale > 1:  # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 size, still >= the target
+            img.draft('RGB', (math.ceil(img.width / scale), math.ceil(img.height / scale)))
+        img = ImageOps.exif_transpose(img)  # Bake the orientation in before the EXIF goes
+        icc = img.info.get('icc_profile')
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if has_alpha and fmt == 'WEBP':
+            img = img.convert('RGBA')
+        elif has_alpha:
+            background = Image.new('RGB', img.size, 'white')
+            background.paste(img.convert('RGBA'), mask=img.convert('RGBA').getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')  # Also the first frame of animations
+        img.thumbnail((settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION), Image.LANCZOS, reducing_gap=3.0)
+        img.info = {'icc_profile': icc} if icc else {}  # Everything else (EXIF, XMP, comments) is dropped
+
+        renditions = {img.width: _encode(img, fmt)}
+        for width in settings.IMAGE_THUMBNAIL_WIDTHS:
+            if width < img.width:
+                thumb = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+                thumb.info = img.info
+                renditions[width] = _encode(thumb, fmt)
+        return img.width, img.height, renditions
+
+
+def process(pk):
+    """Render a Pending ProcessedImage and point its complaints/users at it; returns True when done"""
+    asset = ProcessedImage.objects.filter(pk=pk, status='Pending').first()
+    if asset is None:
+        return False
+    staging = staging_storage()
+    try:
+        with staging.open(asset.staged, 'rb') as source:
+            width, height, renditions = render(source)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Only if still Pending: another worker may have finished it and removed the staged file meanwhile
+        ProcessedImage.objects.filter(pk=pk, status='Pending').update(status='Failed', error=str(e)[:255])
+        return False
+
+    _, extension = output_format()
+    variants = {}
+    for w, data in renditions.items():
+        suffix = '' if w == width else f'-{w}'
+        variants[str(w)] = _save(f'images/{asset.sha256[:2]}/{asset.sha256}{suffix}.{extension}', data)
+    name = variants[str(width)]
+
+    with transaction.atomic():
+        finished = ProcessedImage.objects.filter(pk=pk, status='Pending').update(
+            status='Done', name=name, width=width, height=height, variants=variants, staged='',
+            stored_bytes=sum(len(data) for data in renditions.values()), processed_at=timezone.now(),
+        )
+        if not finished:
+            return False  # Another worker got there first (same content, same renditions)
+        Complaint.objects.filter(image_asset_id=pk).update(image=name)
+        User.objects.filter(profile_pic_asset_id=pk).update(profile_pic=name)
+    staging.delete(asset.staged)
+    return True
+
+
+def process_pending(workers=None):
+    """Process every Pending image with a pool of `workers` threads; returns how many finished"""
+    pks = list(ProcessedImage.objects.filter(status='Pending').values_list('pk', flat=True))
+    if not pks:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers or settings.IMAGE_WORKERS, thread_name_prefix='civic-images') as pool:
+        return sum(pool.map(_process_and_close, pks))
+
+
+def _process_and_close(pk):
+    try:
+        return process(pk)
+    finally:
+        connection.close()
+
+
+def ingest_existing():
+    """
+    Link complaint images and profile pictures stored before this pipeline to
+    ProcessedImages, to be processed by process_pending(). Identical files
+    stored under different names share one ProcessedImage.
+
+    Returns:
+        dict: 'rows' linked, 'originals' (the linked file names), 'skipped'
+        (missing or not an acceptable image)
+    """
+    result = {'rows': 0, 'originals': [], 'skipped': []}
+    for model, field in ((Complaint, 'image'), (User, 'profile_pic')):
+        rows = model.objects.filter(**{f'{field}_asset__isnull': True}).exclude(**{f'{field}__in': ['', None]})
+        for name in list(rows.values_list(field, flat=True).distinct()):
+            if not default_storage.exists(name):
+                result['skipped'].append(name)
+                continue
+            with default_storage.open(name, 'rb') as original, transaction.atomic():
+                asset = ingest(original, enqueue=False)
+                if asset is None:
+                    result['skipped'].append(name)
+                    continue
+                changes = {f'{field}_asset': asset}
+                if asset.status == 'Done':
+                    changes[field] = asset.name
+                result['rows'] += rows.filter(**{field: name}).update(**changes)
+            result['originals'].append(name)
+    return result
+
+
+def delete_originals(names):
+    """Delete legacy files whose rows now point at a processed image; returns how many were deleted"""
+    deleted = 0
+    for name in names:
+        in_use = (Complaint.objects.filter(image=name).exists()
+                  or User.objects.filter(profile_pic=name).exists())
+        if not in_use and default_storage.exists(name):
+            default_storage.delete(name)
+            deleted += 1
+    return deleted
@@ -0,0 +1,907 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+SAMPLE_TEXTS = [
+    'live wire hanging near the main road causing electric shock hazard',
+    'street light not working on main road for 3 weeks',
+    'garbage piling up near the park and a bad smell everywhere',
+    'huge pothole on the road near the bridge damaged my vehicle',
+    'stray dogs near the hospital and mosquito breeding in stagnant water',
+    'gas cylinder blast in the building, smoke everywhere, urgent help',
+    'my neighbour plays loud music at night',
+]
+
+
+def _timeit(fn, repeat):
+    """Return (mean_us, min_us) per call of fn() over repeat runs."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return sum(timings) / len(timings), min(timings)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+@contextmanager
+def scratch_database():
+    """Create a throwaway test database (never touches the real one)"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if connection.vendor == 'sqlite':
+        # File-backed so concurrent threads get real connections (not shared-cache memory)
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'civic_benchmark.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_complaints(rows, user, days=365, batch=5000, texts=SAMPLE_TEXTS):
+    """Bulk-insert `rows` synthetic complaints spread over the last `days` days"""
+    from django.utils import timezone
+    from core import geo, rollup, user_stats
+    from core.models import Complaint
+
+    rng = random.Random(42)
+    now = timezone.now()
+    depts = ['Municipal', 'Police', 'Electricity', 'Health', 'Water', 'PWD', 'Fire']
+    categories = [c for c, _ in Complaint.CATEGORY_CHOICES]
+    resolutions = [r for r, _ in Complaint.RESOLUTION_CHOICES]
+    created_field = Complaint._meta.get_field('created_at')
+    created_field.auto_now_add = False  # Let the seed choose created_at
+    try:
+        for start in range(0, rows, batch):
+            objs = []
+            for i in range(start, min(rows, start + batch)):
+                created = now - timedelta(minutes=rng.randrange(days * 24 * 60))
+                status = rng.choice(['Pending', 'Solved', 'Closed', 'Closed'])
+                solved = created + timedelta(minutes=rng.randrange(30, 14 * 24 * 60)) if status != 'Pending' else None
+                closed = status == 'Closed'
+                city = rng.choice(['Indore', 'Bhopal'])
+                lat, lng = 22.6 + rng.random() * 0.2, 75.8 + rng.random() * 0.2
+                objs.append(Complaint(
+                    user=user, description=f'{texts[i % len(texts)]} (#{i})',
+                    location_name=f'Ward {i % 50}', pincode=str(452001 + i % 20),
+                    city=city, city_normalized=city.lower(), department=rng.choice(depts),
+                    category=rng.choice(categories), priority=rng.choice(['High', 'Medium', 'Low']),
+                    status=status, created_at=created, solved_at=solved,
+                    closed_at=solved + timedelta(hours=2) if closed else None,
+                    resolution=rng.choice(resolutions) if closed else None,
+                    rating=rng.randint(1, 5) if closed else None, feedback='ok' if closed else None,
+                    latitude=lat, longitude=lng, geo_cell=geo.encode(lat, lng),
+                ))
+            Complaint.objects.bulk_create(objs)
+    finally:
+        created_field.auto_now_add = True
+    rollup.rebuild()  # bulk_create skips the signals that keep the daily rollup and user counters
+    user_stats.reconcile()
+
+
+def bench_keywords(cmd, options):
+    """Keyword detection: legacy per-word re.search loop vs KeywordIndex."""
+    import re
+    from core.ai_model.engine import CivicAI
+
+    bot = CivicAI()
+    texts = [t.lower() for t in SAMPLE_TEXTS]
+
+    def legacy(text_lower):
+        prio = 'Low'
+        for word in bot.priority_keywords['High']:
+            if re.search(r'\b' + re.escape(word) + r'\b', text_lower):
+                prio = 'High'
+                break
+        if prio == 'Low':
+            for word in bot.priority_keywords['Medium']:
+                if re.search(r'\b' + re.escape(word) + r'\b', text_lower):
+                    prio = 'Medium'
+                    break
+        for dept, keywords in bot.dept_keywords.items():
+            for word in keywords:
+                if re.search(r'\b' + re.escape(word) + r'\b', text_lower):
+                    return prio, dept
+        return prio, None
+
+    def indexed(text_lower):
+        matches = bot.keyword_index.match(text_lower)
+        prio = 'Low'
+        if 'High' in matches['priority']:
+            prio = 'High'
+        elif 'Medium' in matches['priority']:
+            prio = 'Medium'
+        return prio, (matches['dept'][0] if matches['dept'] else None)
+
+    repeat = options['repeat']
+    for label, fn in (('legacy re.search loop', legacy), ('KeywordIndex', indexed)):
+        mean, best = _timeit(lambda: [fn(t) for t in texts], repeat)
+        cmd.stdout.write(f"{label:<24} {mean / len(texts):8.1f} us/call (best {best / len(texts):.1f})")
+
+
+def bench_similar(cmd, options):
+    """Near-duplicate lookup over a city's open tickets: cold partition loads vs warm queries."""
+    import pandas as pd
+    from django.conf import settings
+    from core import similarity
+    from core.ai_model.engine import CSV_PATH, ai_bot
+    from core.models import Complaint, User
+
+    rows = min(options['rows'], 100_000)
+    base = pd.read_csv(CSV_PATH)['text'].tolist()
+    rng = random.Random(11)
+    texts = [f'{rng.choice(base)} {rng.choice(base)}' for _ in range(20000)]
+    with scratch_database():
+        user = User.objects.create_user(username='bench', password='x')
+        seed_complaints(rows, user, days=settings.SIMILAR_COMPLAINT_DAYS - 1, texts=texts)
+        Complaint.objects.update(status='Pending', city='Indore', city_normalized='indore')
+        ai_bot.load()
+        similarity.index.clear()
+        sample = list(Complaint.objects.order_by('?')[:200])
+
+        cold = []
+        for complaint in sample:
+            start = time.perf_counter()
+            similarity.find_similar(complaint)
+            cold.append((time.perf_counter() - start) * 1000)
+        warm, found = [], []
+        for complaint in sample:
+            start = time.perf_counter()
+            found.append(len(similarity.find_similar(complaint)))
+            warm.append((time.perf_counter() - start) * 1000)
+        cmd.stdout.write(f"{rows} open tickets, {len(similarity.index._partitions)} partitions loaded")
+        cmd.stdout.write(f"first query (loads up to 9 cells)  p50 {_percentile(cold, 50):7.2f} ms  p95 {_percentile(cold, 95):7.2f} ms")
+        cmd.stdout.write(f"warm query                        p50 {_percentile(warm, 50):7.2f} ms  p95 {_percentile(warm, 95):7.2f} ms  "
+                         f"(mean {sum(found) / len(found):.1f} matches)")
+
+        original = sample[0]
+        duplicate = Complaint.objects.create(
+            user=user, description=original.description, location_name=original.location_name, pincode=original.pincode,
+            city='Indore', department=original.department, latitude=original.latitude + 0.0005, longitude=original.longitude,
+        )
+        before = Complaint.objects.get(pk=original.pk).similar_complaints_count
+        matches = similarity.record_submission(duplicate)
+        after = Complaint.objects.get(pk=original.pk).similar_complaints_count
+        cmd.stdout.write(f"duplicate linked: {len(matches)} matches, original's count {before} -> {after}")
+
+
+def bench_submit(cmd, options):
+    """submit_complaint latency under concurrent submits: inline ML vs async queue."""
+    from django.db import connection
+    from django.test import Client, override_settings
+    from core.ai_model.engine import ai_bot
+    from core.models import ClassificationTask, TicketCounter, User
+    from core.tasks import process_queue, shutdown_workers
+
+    ai_bot.predict('warm up')  # Don't charge model loading to the first request
+    threads, per_thread = options['threads'], options['requests']
+
+    with scratch_database():
+        TicketCounter._blocks.clear()  # Blocks reserved against another database
+        users = [User.objects.create_user(username=f'bench{i}', password='x') for i in range(threads)]
+
+        for label, async_mode in (('inline ML', False), ('async queue', True)):
+            latencies, errors = [], []
+            lock = threading.Lock()
+
+            def worker(user):
+                client = Client()
+                client.force_login(user)
+                mine, failed = [], []
+                for i in range(per_thread):
+                    text = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+                    start = time.perf_counter()
+                    try:
+                        client.post('/submit/', {'description': text, 'location_name': 'Bench', 'pincode': '452001'})
+                    except Exception as e:
+                        failed.append(type(e).__name__)
+                        continue
+                    mine.append((time.perf_counter() - start) * 1000)
+                with lock:
+                    latencies.extend(mine)
+                    errors.extend(failed)
+                connection.close()
+
+            with override_settings(AI_ASYNC_CLASSIFICATION=async_mode):
+                pool = [threading.Thread(target=worker, args=(u,)) for u in users]
+                for t in pool:
+                    t.start()
+                for t in pool:
+                    t.join()
+                shutdown_workers()  # Let the drains the submits started finish
+                process_queue()  # Then whatever they didn't pick up
+
+            if not latencies:
+                raise CommandError(f"{label}: every submit failed ({', '.join(sorted(set(errors)))})")
+            cmd.stdout.write(
+                f"{label:<12} {len(latencies)} submits x {threads} threads: "
+                f"p50 {_percentile(latencies, 50):7.1f} ms  p99 {_percentile(latencies, 99):7.1f} ms"
+                + (f"  ({len(errors)} failed: {', '.join(sorted(set(errors)))})" if errors else '')
+            )
+        done = ClassificationTask.objects.filter(status='Done').count()
+        cmd.stdout.write(f"{done} of {ClassificationTask.objects.count()} classification tasks done after the drain")
+
+
+def bench_tickets(cmd, options):
+    """Ticket allocation throughput from many threads (uniqueness is checked by core.tests.TicketIdTests)."""
+    from django.db import connection
+    from core.models import Complaint, TicketCounter, User
+
+    threads, per_thread = options['threads'], options['requests']
+    with scratch_database():
+        TicketCounter._blocks.clear()  # Blocks reserved against another database
+        user = User.objects.create_user(username='bench', password='x')
+        depts = ['Municipal', 'Police', 'Water', 'Other']
+        created, errors = [], []
+        lock = threading.Lock()
+
+        def worker(n):
+            mine, failed = [], []
+            for i in range(per_thread):
+                try:
+                    c = Complaint.objects.create(user=user, description='bench', location_name='Bench',
+                                                 pincode='452001', department=depts[(n + i) % len(depts)])
+                    mine.append(c.ticket_id)
+                except Exception as e:
+                    failed.append(type(e).__name__)
+            with lock:
+                created.extend(mine)
+                errors.extend(failed)
+            connection.close()
+
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        cmd.stdout.write(f"{len(created)} complaints from {threads} threads in {elapsed:.2f}s "
+                         f"({len(created) / elapsed:.0f}/s)"
+                         + (f", {len(errors)} failed: {', '.join(sorted(set(errors)))}" if errors else ''))
+
+
+def bench_map(cmd, options):
+    """Admin map: every geotagged row embedded as JSON vs server-side clusters per viewport."""
+    import json
+    from core import geo
+    from core.models import Complaint, User
+
+    with scratch_database():
+        user = User.objects.create_user(username='bench', password='x')
+        seed_complaints(options['rows'], user)
+        scope = Complaint.objects.for_department('Water', 'Indore').exclude(status='Closed')
+
+        start = time.perf_counter()
+        legacy = json.dumps(list(scope.exclude(latitude__isnull=True).values(
+            'ticket_id', 'description', 'latitude', 'longitude', 'priority', 'status', 'user__username', 'user__phone')), default=str)
+        cmd.stdout.write(f"embedded map_data   {(time.perf_counter() - start) * 1000:8.1f} ms {len(legacy) / 1e3:9.1f} KB")
+
+        centre_lat, centre_lng = 22.7, 75.9
+        for zoom in (11, 13, 15, 17):
+            # Viewport of a ~1000x700px map at this zoom
+            half_w = 1000 / 256 * 360 / 2 ** zoom / 2
+            half_h = half_w * 0.7
+            bbox = (centre_lng - half_w, centre_lat - half_h, centre_lng + half_w, centre_lat + half_h)
+            start = time.perf_counter()
+            data = geo.clusters(scope, zoom, bbox)
+            elapsed = time.perf_counter() - start
+            payload = json.dumps(data)
+            cmd.stdout.write(f"clusters zoom {zoom:<5} {elapsed * 1000:8.1f} ms {len(payload) / 1e3:9.1f} KB  "
+                             f"{len(data['clusters'])} clusters for {data['total']} rows")
+
+
+def bench_resolution(cmd, options):
+    """department_stats resolution time: Python loop over rows vs database aggregates."""
+    from core.models import Complaint, User
+    from core.stats import resolution_time_stats
+
+    with scratch_database():
+        user = User.objects.create_user(username='bench', password='x')
+        start = time.perf_counter()
+        seed_complaints(options['rows'], user)
+        cmd.stdout.write(f"seeded {options['rows']} complaints in {time.perf_counter() - start:.1f}s")
+        dept = Complaint.objects.filter(department='Water')
+
+        start = time.perf_counter()
+        resolved = dept.filter(solved_at__isnull=False)
+        total_hours = sum([(c.solved_at - c.created_at).total_seconds() / 3600 for c in resolved])
+        legacy_mean = total_hours / resolved.count()
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = resolution_time_stats(dept)
+        db = time.perf_counter() - start
+
+        cmd.stdout.write(f"python loop      {legacy * 1000:9.1f} ms  mean {legacy_mean:.1f} h")
+        cmd.stdout.write(f"database         {db * 1000:9.1f} ms  mean {stats['mean_hours']} h, "
+                         f"median {stats['median_hours']} h, p90 {stats['p90_hours']} h, by priority {stats['by_priority']}")
+
+
+def bench_export(cmd, options):
+    """export_complaints: in-memory HttpResponse vs streaming export, time and peak memory at two sizes."""
+    import csv
+    import tracemalloc
+    from django.http import HttpResponse
+    from core import export
+    from core.models import Complaint, User
+
+    rows = min(options['rows'], 200_000)  # tracemalloc makes large runs slow
+    with scratch_database():
+        user = User.objects.create_user(username='bench', password='x')
+        seed_complaints(rows, user)
+        ids = list(Complaint.objects.order_by('id').values_list('id', flat=True)[::rows // 4 or 1])
+
+        def legacy(complaints):
+            response = HttpResponse(content_type='text/csv')
+            writer = csv.writer(response)
+            for c in complaints:
+                writer.writerow([c.ticket_id, c.description, c.location_name, c.status, c.priority,
+                                 c.created_at.strftime('%Y-%m-%d %H:%M') if c.created_at else '',
+                                 c.solved_at.strftime('%Y-%m-%d %H:%M') if c.solved_at else '',
+                                 c.feedback or '', c.rating or ''])
+            return len(response.content)
+
+        def streaming(complaints, fmt):
+            return sum(len(chunk) for chunk in export.stream_export(complaints, fmt))
+
+        def measure(fn, *args):
+            tracemalloc.start()
+            start = time.perf_counter()
+            size = fn(*args)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return size, elapsed, peak / 1e6
+
+        for fmt in [None] + export.available_formats():
+            if fmt:
+                streaming(Complaint.objects.filter(id__lt=ids[0] + 10), fmt)  # Warm-up (lazy imports)
+            peaks = []
+            for limit in (ids[1], None):  # A quarter of the rows, then all of them
+                complaints = Complaint.objects.filter(id__lt=limit) if limit else Complaint.objects.all()
+                size, elapsed, peak = measure(legacy, complaints) if fmt is None else measure(streaming, complaints, fmt)
+                peaks.append(peak)
+            label = fmt or 'legacy csv'
+            cmd.stdout.write(f"{label:<12} {rows} rows {elapsed:6.2f}s {size / 1e6:8.1f} MB out   "
+                             f"peak {peaks[0]:7.1f} MB at {rows // 4} rows, {peaks[1]:7.1f} MB at {rows} rows")
+
+
+def bench_bulk(cmd, options):
+    """bulk_action over 5,000 tickets: query count with batched owner notifications."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from core import notifications, rollup, user_stats
+    from core.models import Complaint, ComplaintDailyStats, Notification, User
+
+    rows = min(options['rows'], 5000)
+    with scratch_database():
+        admin = User.objects.create_user(username='bench-admin', password='x', is_department_admin=True,
+                                         department_name='Water', city='Indore')
+        owners = User.objects.bulk_create([User(username=f'citizen{i}', password='x') for i in range(rows // 5)])
+        seed_complaints(rows, owners[0])
+        Complaint.objects.update(department='Water', status='Pending')
+        ids = list(Complaint.objects.order_by('id').values_list('id', flat=True))
+        for i, owner in enumerate(owners):
+            Complaint.objects.filter(id__in=ids[i::len(owners)]).update(user=owner)
+        rollup.rebuild()  # The set-up updates above bypass the rollup and user counters
+        user_stats.reconcile()
+
+        # session + user + BEGIN + select + update + COMMIT, the owner INSERT batches and unread-counter
+        # UPDATE batches (in a savepoint), and the admin notice + its counter UPDATE (in a savepoint)
+        fields = [f for f in Notification._meta.concrete_fields if not f.primary_key]
+        batch = min(notifications.BATCH_SIZE, connection.ops.bulk_batch_size(fields, owners))
+        ceiling = 12 + -(-len(owners) // batch) + -(-len(owners) // notifications.BATCH_SIZE)
+        # Rollup (in a savepoint): select + re-select of new keys, then INSERT/UPDATE batches over at most
+        # two keys (old and new) per ticket - bounded by keys, not by ticket count
+        keys = 2 * rows
+        fields = [f for f in ComplaintDailyStats._meta.concrete_fields if not f.primary_key]
+        insert_batch = min(rollup.BATCH_SIZE, connection.ops.bulk_batch_size(fields, [None] * keys))
+        update_batch = min(rollup.BATCH_SIZE, (connection.features.max_query_params or keys) // (len(rollup.METRICS) + 1))
+        ceiling += 4 + -(-keys // insert_batch) + -(-keys // update_batch)
+        # Owner complaint counters: one UPDATE per batch of owners (every owner moves Pending -> Solved alike)
+        ceiling += -(-len(owners) // user_stats.BATCH_SIZE)
+
+        client = Client()
+        client.force_login(admin)
+        for action, extra in [('mark_solved', {}), ('change_priority', {'priority': 'High'}), ('transfer', {'department': 'PWD'})]:
+            before = Notification.objects.count()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                client.post('/bulk-action/', {'action': action, 'complaint_ids': ','.join(map(str, ids)), **extra})
+                elapsed = time.perf_counter() - start
+            written = Notification.objects.count() - before
+            cmd.stdout.write(f"{action:<16} {rows} tickets {elapsed * 1000:8.1f} ms {len(ctx.captured_queries):3} queries "
+                             f"(ceiling {ceiling})  {written} notifications ({len(owners)} owners + admin)")
+
+
+def bench_search(cmd, options):
+    """search_complaints: legacy icontains OR scan vs the full-text search service."""
+    from django.db.models import Q
+    from core import search
+    from core.models import Complaint, User
+
+    with scratch_database():
+        user = User.objects.create_user(username='bench', password='x')
+        # A varied corpus so terms have realistic selectivity (SAMPLE_TEXTS has 7 texts)
+        rng = random.Random(7)
+        words = ' '.join(SAMPLE_TEXTS).split() + [f'w{n:04d}' for n in range(3000)]
+        texts = [' '.join(rng.choice(words) for _ in range(12)) for _ in range(20000)]
+        start = time.perf_counter()
+        seed_complaints(options['rows'], user, texts=texts)
+        indexed = search.rebuild_index()  # bulk_create bypasses the sync signals
+        cmd.stdout.write(f"seeded {options['rows']} complaints in {time.perf_counter() - start:.1f}s "
+                         f"(backend {search.backend()}, {indexed} indexed)")
+        scope = Complaint.objects.for_department('Water', 'Indore')
+        sample = scope.order_by('id')[len(SAMPLE_TEXTS)]
+        Complaint.objects.filter(pk=sample.pk).update(ticket_id=501234)
+
+        repeat = max(1, min(options['repeat'], 5))
+        for query in ['pothole', 'street light', 'garbage park', 'w0042', 'w0042 w1234', '501234']:
+            def legacy():
+                qs = scope.filter(Q(description__icontains=query) | Q(location_name__icontains=query)
+                                  | Q(ticket_id__icontains=query)).order_by('-created_at')
+                return list(qs[:25]), qs.count()
+
+            def fts():
+                qs = search.search(scope, query)
+                return list(qs[:25]), qs.count()
+
+            legacy_rows, legacy_count = legacy()
+            rows, count = fts()
+            legacy_ms = _timeit(legacy, repeat)[0] / 1000
+            fts_ms = _timeit(fts, repeat)[0] / 1000
+            cmd.stdout.write(f"{query!r:<16} icontains {legacy_ms:9.1f} ms ({legacy_count:>7} hits)   "
+                             f"search {fts_ms:9.1f} ms ({count:>7} hits)   {legacy_ms / max(fts_ms, 1e-6):6.1f}x")
+
+
+def bench_cache(cmd, options):
+    """Admin stats views cold vs cached, and the recompute after a write invalidates them."""
+    from django.core.cache import cache
+    from django.db import connection
+    from django.template import TemplateDoesNotExist
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from core import caching
+    from core.models import Complaint, User
+
+    rows = min(options['rows'], 200_000)
+    with scratch_database():
+        cache.clear()
+        admin = User.objects.create_user(username='bench-admin', password='x', is_department_admin=True,
+                                         department_name='Water', city='Indore')
+        seed_complaints(rows, admin)
+        Complaint.objects.filter(id__in=Complaint.objects.order_by('id').values('id')[:rows // 2]).update(
+            status='Closed', feedback='ok', rating=4, resolution='Fully Resolved')
+        client = Client()
+        client.force_login(admin)
+
+        def get(url):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                try:
+                    client.get(url)
+                except TemplateDoesNotExist:
+                    pass  # Stats are computed before render; the template isn't in the repo
+                return (time.perf_counter() - start) * 1000, len(ctx.captured_queries)
+
+        for url in ['/analytics/', '/dept-stats/', '/feedback/']:
+            cold_ms, cold_q = get(url)
+            warm_ms, warm_q = get(url)
+            cmd.stdout.write(f"{url:<14} cold {cold_ms:8.1f} ms {cold_q:2} queries   cached {warm_ms:8.1f} ms {warm_q:2} queries")
+
+        # Recompute after a change in the department (save() signal)
+        complaint = Complaint.objects.filter(department='Water').first()
+        complaint.status = 'Pending'
+        complaint.save()
+        recompute_ms, recompute_q = get('/analytics/')
+        cmd.stdout.write(f"{'after save()':<14} {recompute_ms:8.1f} ms {recompute_q:2} queries")
+
+        for view, c in caching.counters().items():
+            cmd.stdout.write(f"{view:<17} hits {c['hits']:3}  misses {c['misses']:3}  hit rate {c['hit_rate']}")
+
+
+def bench_rollup(cmd, options):
+    """Analytics counters: complaint_stats scan vs the daily rollup over a year of data."""
+    from core import rollup
+    from core.models import Complaint, ComplaintDailyStats, User
+    from core.stats import complaint_stats
+
+    with scratch_database():
+        citizen = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(options['rows'], citizen)
+        start = time.perf_counter()
+        written = rollup.rebuild()
+        cmd.stdout.write(f"{options['rows']} complaints over a year: rebuilt {written} rollup rows "
+                         f"in {time.perf_counter() - start:.1f}s "
+                         f"({ComplaintDailyStats.objects.filter(department='Water', city='indore').count()} for Water/Indore)")
+
+        repeat = max(1, min(options['repeat'], 10))
+        scope = Complaint.objects.for_department('Water', 'Indore')
+        scan_ms = _timeit(lambda: complaint_stats(scope), repeat)[0] / 1000
+        rollup_ms = _timeit(lambda: rollup.stats('Water', 'Indore'), repeat)[0] / 1000
+        cmd.stdout.write(f"Water/Indore counters: complaint_stats {scan_ms:8.1f} ms   rollup {rollup_ms:6.1f} ms   "
+                         f"{scan_ms / max(rollup_ms, 1e-6):6.1f}x")
+
+
+def bench_trends(cmd, options):
+    """Trend API over a year of data: cold (uncached) and cached response times."""
+    from django.core.cache import cache
+    from django.test import Client
+    from core.models import User
+
+    with scratch_database():
+        admin = User.objects.create_user(username='bench-admin', password='x', is_department_admin=True,
+                                         department_name='Water', city='Indore')
+        start = time.perf_counter()
+        seed_complaints(options['rows'], admin)
+        cmd.stdout.write(f"seeded {options['rows']} complaints over a year in {time.perf_counter() - start:.1f}s")
+
+        client = Client()
+        client.force_login(admin)
+        repeat = max(1, min(options['repeat'], 20))
+        for interval in ['day', 'week', 'month']:
+            for by in ['', 'category', 'priority']:
+                url = f'/analytics/trends/?interval={interval}&by={by}&days=366'
+                cold = []
+                for _ in range(repeat):
+                    cache.clear()
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    cold.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                client.get(url)
+                warm_ms = (time.perf_counter() - start) * 1000
+                data = response.json()
+                cmd.stdout.write(f"{interval:<6} by {by or '-':<9} {len(data['periods']):4} periods x {len(data['series'])} series  "
+                                 f"cold p50 {_percentile(cold, 50):6.1f} ms  max {max(cold):6.1f} ms  cached {warm_ms:5.1f} ms")
+
+
+def bench_notifications(cmd, options):
+    """Unread badge: COUNT(*) per dashboard vs the denormalized counter, and the time to prune old notifications."""
+    from django.utils import timezone
+    from core import notifications
+    from core.models import Notification, User
+
+    rows = min(options['rows'], 1_000_000)
+    with scratch_database():
+        users = User.objects.bulk_create([User(username=f'citizen{i}', password='x') for i in range(max(1, rows // 1000))])
+        rng = random.Random(7)
+        now = timezone.now()
+        batch = []
+        for i in range(rows):
+            batch.append(Notification(user=users[i % len(users)], message=f'Update {i}', is_read=rng.random() < 0.8))
+            if len(batch) >= 5000:
+                Notification.objects.bulk_create(batch)
+                batch = []
+        Notification.objects.bulk_create(batch)
+        # Spread over the last 180 days so retention has something to do
+        for days in range(0, 180, 30):
+            Notification.objects.filter(id__gt=rows * days // 180).update(created_at=now - timedelta(days=180 - days))
+        notifications.recount_unread()
+
+        user = User.objects.get(pk=users[0].pk)
+        repeat = max(1, min(options['repeat'], 50))
+        count_us = _timeit(lambda: Notification.objects.filter(user=user, is_read=False).count(), repeat)[0]
+        counter_us = _timeit(lambda: User.objects.filter(pk=user.pk).values_list('unread_notifications', flat=True).get(), repeat)[0]
+        cmd.stdout.write(f"{rows} notifications, {len(users)} users: unread COUNT(*) {count_us:8.0f} us   "
+                         f"counter {counter_us:8.0f} us")
+
+        start = time.perf_counter()
+        deleted = notifications.prune(90)
+        cmd.stdout.write(f"pruned {deleted} notifications older than 90 days in {time.perf_counter() - start:.1f}s")
+
+
+
+def _photo(seed, size=(3840, 2160)):
+    """Synthetic camera JPEG (gradient + sensor noise) with EXIF orientation and GPS tags"""
+    import io
+    from PIL import Image
+
+    base = Image.merge('RGB', [Image.linear_gradient('L').rotate(angle).resize(size) for angle in (0, 90, 45)])
+    noise = Image.effect_noise(size, 30 + seed % 10).convert('RGB')
+    img = Image.blend(base, noise, 0.25)
+    exif = img.getexif()
+    exif[0x0112] = 6  # Orientation: rotate 90 on display
+    exif[0x010F] = 'BenchCam'
+    exif.get_ifd(0x8825).update({1: 'N', 2: (22.0, 43.0, 10.0), 3: 'E', 4: (75.0, 51.0, 30.0)})  # GPS position
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=92, exif=exif)
+    return buffer.getvalue()
+
+
+def bench_images(cmd, options):
+    """Upload pipeline: submit latency, bytes stored vs uploaded, re-upload latency, worker pool throughput."""
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.db import transaction
+    from django.test import Client, override_settings
+    from core import images
+    from core.models import ProcessedImage, User
+
+    count = max(2, min(options['requests'], 64))
+    with scratch_database(), tempfile.TemporaryDirectory() as media, tempfile.TemporaryDirectory() as staging, \
+            override_settings(MEDIA_ROOT=media, IMAGE_STAGING_ROOT=staging, AI_ASYNC_CLASSIFICATION=True):
+        user = User.objects.create_user(username='bench', password='x', city='Indore')
+        client = Client()
+        client.force_login(user)
+        photo = _photo(0)
+
+        start = time.perf_counter()
+        client.post('/submit/', {'description': SAMPLE_TEXTS[1], 'location_name': 'Bench', 'pincode': '452001',
+                                 'image': SimpleUploadedFile('photo.jpg', photo, 'image/jpeg')})
+        submit_ms = (time.perf_counter() - start) * 1000
+        deadline = time.time() + 60
+        while ProcessedImage.objects.filter(status='Pending').exists() and time.time() < deadline:
+            time.sleep(0.05)
+        asset = ProcessedImage.objects.get()
+        cmd.stdout.write(f"submit with a 3840x2160 photo: {submit_ms:.0f} ms; stored {asset.width}x{asset.height}, "
+                         f"{len(asset.variants)} renditions ({', '.join(sorted(asset.variants, key=int))} px wide)")
+        cmd.stdout.write(f"bytes: uploaded {len(photo):,}  stored (all renditions) {asset.stored_bytes:,}  "
+                         f"main only {default_storage.size(asset.name):,}  ({asset.stored_bytes / len(photo):.0%})")
+
+        start = time.perf_counter()
+        client.post('/submit/', {'description': SAMPLE_TEXTS[2], 'location_name': 'Bench', 'pincode': '452001',
+                                 'image': SimpleUploadedFile('same.jpg', photo, 'image/jpeg')})
+        dup_ms = (time.perf_counter() - start) * 1000
+        cmd.stdout.write(f"same photo again: {dup_ms:.0f} ms ({ProcessedImage.objects.count()} processed image stored)")
+
+        photos = [_photo(seed) for seed in range(1, count + 1)]
+        for workers in (1, options['threads']):
+            ProcessedImage.objects.exclude(pk=asset.pk).delete()
+            for data in photos:
+                with transaction.atomic():
+                    images.ingest(ContentFile(data, name='photo.jpg'), enqueue=False)
+            start = time.perf_counter()
+            done = images.process_pending(workers)
+            elapsed = time.perf_counter() - start
+            cmd.stdout.write(f"{done} photos with {workers} worker(s): {elapsed:.2f}s  ({done / elapsed:.1f} images/s)")
+
+
+def bench_media(cmd, options):
+    """Media serving: django.views.static.serve (the old static() path) vs core.media.serve; storage dedupe."""
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import FileSystemStorage
+    from django.test import RequestFactory, override_settings
+    from django.views.static import serve as static_serve
+    from core import media
+
+    repeat = max(5, min(options['repeat'], 200))
+    payload = _photo(0)
+    factory = RequestFactory()
+    with tempfile.TemporaryDirectory() as root:
+        storage = media.ContentAddressedStorage(location=root)
+        names = [storage.save(f'complaints/upload_{i}.jpg', ContentFile(payload)) for i in range(4)]
+        files = sum(len(f) for _, _, f in os.walk(root))
+        cmd.stdout.write(f"4 uploads of the same {len(payload):,}-byte photo -> {files} file on disk ({names[0]})")
+        legacy = FileSystemStorage(location=root).save('complaints/upload.jpg', ContentFile(payload))
+        name = names[0]
+
+        def drain(response):
+            if getattr(response, 'streaming', False):
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            response.close()
+            return response.status_code, size
+
+        def run(label, view, path, **headers):
+            request = factory.get('/media/' + path, **headers)
+            result = drain(view(request, path))
+            mean_us, _ = _timeit(lambda: drain(view(request, path)), repeat)
+            cmd.stdout.write(f"  {label:<36} {mean_us / 1000:7.2f} ms  status {result[0]}  {result[1]:>9,} bytes")
+            return result
+
+        old = lambda request, path: static_serve(request, path, document_root=root)
+        new = lambda request, path: media.serve(request, path, storage)
+        tag = media.serve(factory.get('/'), name, storage)['ETag']
+        from django.conf.urls.static import static
+        with override_settings(DEBUG=False):
+            patterns = len(static('/media/', document_root=root))
+        cmd.stdout.write(f'static() serve (before; {patterns} URL patterns when DEBUG is off, i.e. 404 in production):')
+        run('full GET', old, name)
+        run('revalidate (If-Modified-Since)', old, name, HTTP_IF_MODIFIED_SINCE='Sun, 01 Jan 2090 00:00:00 GMT')
+        run('Range: first 64 KB', old, name, HTTP_RANGE='bytes=0-65535')
+        cmd.stdout.write('media_file serve:')
+        run('full GET', new, name)
+        run('revalidate (If-None-Match)', new, name, HTTP_IF_NONE_MATCH=tag)
+        run('Range: first 64 KB', new, name, HTTP_RANGE='bytes=0-65535')
+        run('full GET, legacy name (hashed once)', new, legacy)
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            run('full GET, X-Accel-Redirect', new, name)
+
+
+def bench_user_stats(cmd, options):
+    """Citizen status counts: COUNT per status over the user's complaints vs the counters on the user row."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from core import user_stats
+    from core.models import Complaint, User
+    from core.stats import complaint_stats
+
+    rows = min(options['rows'], 200_000)
+    with scratch_database():
+        citizen = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(rows, citizen)
+        citizen.refresh_from_db()
+        repeat = max(1, min(options['repeat'], 20))
+        count_ms = _timeit(lambda: complaint_stats(Complaint.objects.filter(user=citizen)), repeat)[0] / 1000
+        row_ms = _timeit(lambda: User.objects.filter(pk=citizen.pk).values_list(*user_stats.COUNTERS).get(), repeat)[0] / 1000
+        cmd.stdout.write(f"{rows} complaints of one citizen: COUNT scan {count_ms:8.2f} ms   user row {row_ms:6.2f} ms")
+
+        client = Client()
+        client.force_login(citizen)
+        with CaptureQueriesContext(connection) as ctx:
+            client.get('/dashboard/')
+        counted = [q['sql'][:80] for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()]
+        cmd.stdout.write(f"citizen dashboard: {len(ctx.captured_queries)} queries, {len(counted)} COUNTs")
+
+        User.objects.filter(pk=citizen.pk).update(complaints_closed=0, complaints_total=1)  # Simulated drift
+        start = time.perf_counter()
+        repaired = user_stats.reconcile()
+        cmd.stdout.write(f"reconcile repaired {repaired} user(s) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def bench_activity(cmd, options):
+    """last_activity: a write per page view vs the throttled, batched middleware; active-user counts."""
+    from django.conf import settings
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import RequestFactory, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from core import activity
+    from core.models import User
+
+    population = min(options['rows'], 200_000)
+    views = max(1000, options['threads'] * options['requests'] * 50)
+    with scratch_database():
+        rng = random.Random(3)
+        now = timezone.now()
+        User.objects.bulk_create([
+            User(username=f'citizen{i}', password='x', last_activity=now - timedelta(minutes=rng.randrange(60 * 24 * 30)))
+            for i in range(population)
+        ], batch_size=5000)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+        visitors = list(User.objects.order_by('?').values_list('pk', flat=True)[:500])
+        factory = RequestFactory()
+        middleware = activity.ActivityMiddleware(lambda request: HttpResponse())
+
+        def page_views(handle):
+            writes, elapsed = 0, 0.0
+            for i in range(views):
+                request = factory.get('/dashboard/')
+                request.user = User.objects.get(pk=visitors[i % len(visitors)])  # AuthenticationMiddleware's load
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    handle(request)
+                    elapsed += time.perf_counter() - start
+                writes += sum(1 for q in ctx.captured_queries if q['sql'].startswith('UPDATE'))
+            return writes, elapsed / views * 1e6
+
+        def naive(request):
+            request.user.last_activity = timezone.now()
+            request.user.save(update_fields=['last_activity'])
+
+        writes, us = page_views(naive)
+        cmd.stdout.write(f"{views} page views by {len(visitors)} users")
+        cmd.stdout.write(f"  save() per view    {writes:6d} UPDATEs  {us:6.0f} us/view")
+        User.objects.filter(pk__in=visitors).update(last_activity=now - timedelta(hours=1))  # Due again
+        with override_settings(ACTIVITY_FLUSH_SECONDS=3600):
+            writes, us = page_views(middleware)
+        activity.flush()
+        cmd.stdout.write(f"  ActivityMiddleware {writes:6d} UPDATEs  {us:6.0f} us/view  (once per user per "
+                         f"{settings.ACTIVITY_UPDATE_INTERVAL}s, flushed {settings.ACTIVITY_FLUSH_SIZE} users per bulk_update)")
+
+        repeat = max(1, min(options['repeat'], 20))
+        counts = activity.active_counts()
+        counts_ms = _timeit(activity.active_counts, repeat)[0] / 1000
+        plan = User.objects.filter(last_activity__gte=now).explain()
+        cmd.stdout.write(f"active users {counts} of {population}: {counts_ms:.2f} ms")
+        cmd.stdout.write(f"  plan: {plan.strip()}")
+
+
+def bench_sla(cmd, options):
+    """SLA sweep: first pass over a backlog, then steady-state sweeps over the partial indexes."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from core import sla
+    from core.models import Complaint, Notification, User
+
+    with scratch_database():
+        for department in ('Water', 'Fire', 'Health'):
+            User.objects.create_user(username=f'admin-{department}', password='x', is_department_admin=True,
+                                     department_name=department, city='Indore')
+        citizen = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(options['rows'], citizen, days=30)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+        pending = Complaint.objects.filter(status='Pending').count()
+        now = timezone.now()
+
+        start = time.perf_counter()
+        first = sla.sweep(now)
+        cmd.stdout.write(f"{options['rows']} complaints over 30 days, {pending} Pending: first sweep flagged "
+                         f"{first['breached']} breached, {first['escalated']} escalated "
+                         f"in {time.perf_counter() - start:.1f}s ({sla.BATCH_SIZE} per batch)")
+
+        repeat = max(1, min(options['repeat'], 20))
+        idle_ms = _timeit(lambda: sla.sweep(now), repeat)[0] / 1000
+        later = now + timedelta(minutes=10)
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            step = sla.sweep(later)
+            step_ms = (time.perf_counter() - start) * 1000
+        cmd.stdout.write(f"  repeat sweep (nothing new)   {idle_ms:7.1f} ms")
+        cmd.stdout.write(f"  sweep 10 minutes later       {step_ms:7.1f} ms  flagged {step['breached']} breached, "
+                         f"{step['escalated']} escalated in {len(ctx.captured_queries)} queries")
+
+        for flag in ('sla_breached', 'is_escalated'):
+            plan = sla.candidates(flag, later).explain()
+            searches = [line.split(' 0 ', 1)[-1].strip() for line in plan.splitlines() if 'SEARCH' in line]
+            for line in sorted(set(searches)):
+                cmd.stdout.write(f"  {flag} plan: {searches.count(line)} x {line}")
+
+        notified = Notification.objects.filter(user__is_department_admin=True).count()
+        cmd.stdout.write(f"  {notified} grouped notifications to {User.objects.filter(is_department_admin=True).count()} "
+                         f"admins, {Notification.objects.filter(user=citizen).count()} to the owner")
+
+
+BENCHMARKS = {
+    'activity': bench_activity,
+    'bulk': bench_bulk,
+    'cache': bench_cache,
+    'export': bench_export,
+    'images': bench_images,
+    'keywords': bench_keywords,
+    'map': bench_map,
+    'media': bench_media,
+    'notifications': bench_notifications,
+    'resolution': bench_resolution,
+    'rollup': bench_rollup,
+    'search': bench_search,
+    'similar': bench_similar,
+    'sla': bench_sla,
+    'submit': bench_submit,
+    'tickets': bench_tickets,
+    'trends': bench_trends,
+    'user_stats': bench_user_stats,
+}
+
+
+class Command(BaseCommand):
+    help = 'Run micro-benchmarks for performance-sensitive code paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=25, help='Requests per thread')
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic complaints to seed')
+
+    def handle(self, *args, **options):
+        BENCHMARKS[options['name']](self, options)
@@ -0,0 +1,19 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core import media
+
+
+class Command(BaseCommand):
+    help = 'Move media saved before content addressing into hash-named blobs (duplicates stored once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        result = media.dedupe_existing(default_storage, dry_run=options['dry_run'])
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(f"[OK] {verb} {result['files']} files into {result['blobs']} blobs "
+                          f"({result['bytes_saved']:,} bytes of duplicates), {result['rows']} rows updated")
+        for name in result['missing']:
+            self.stdout.write(f"[WARNING] {name} is referenced but missing")
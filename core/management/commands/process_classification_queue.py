@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.tasks import process_queue
+
+
+class Command(BaseCommand):
+    help = 'Run queued ML classifications for complaints submitted in async mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=int, metavar='SECONDS', help='Keep polling the queue')
+
+    def handle(self, *args, **options):
+        while True:
+            done = process_queue()
+            if done:
+                self.stdout.write(f"[OK] Classified {done} complaints")
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
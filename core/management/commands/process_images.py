@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import ProcessedImage
+
+
+class Command(BaseCommand):
+    help = 'Process pending uploaded images (EXIF strip, resize, WebP, thumbnails); optionally convert legacy media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_WORKERS)
+        parser.add_argument('--existing', action='store_true',
+                            help='Also convert complaint images/profile pictures stored before the pipeline')
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='With --existing: delete the converted legacy files (they still carry EXIF)')
+        parser.add_argument('--retry-failed', action='store_true', help='Reset Failed images to Pending first')
+
+    def handle(self, *args, **options):
+        legacy = None
+        if options['existing']:
+            legacy = images.ingest_existing()
+            self.stdout.write(f"[OK] Linked {legacy['rows']} rows to images from {len(legacy['originals'])} legacy files")
+            for name in legacy['skipped']:
+                self.stdout.write(f"[WARNING] Skipped {name} (missing or not an image)")
+        if options['retry_failed']:
+            retried = ProcessedImage.objects.filter(status='Failed').exclude(staged='').update(status='Pending', error='')
+            self.stdout.write(f"[OK] Retrying {retried} failed images")
+
+        done = images.process_pending(options['workers'])
+        self.stdout.write(f"[OK] Processed {done} images with {options['workers']} workers")
+        for asset in ProcessedImage.objects.filter(status='Failed'):
+            self.stdout.write(f"[WARNING] {asset.sha256[:12]} failed: {asset.error}")
+
+        if legacy and options['delete_originals']:
+            deleted = images.delete_originals(legacy['originals'])
+            self.stdout.write(f"[OK] Deleted {deleted} legacy files")
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import notifications
+
+
+class Command(BaseCommand):
+    help = 'Delete old notifications in batches (schedule daily) and optionally rebuild unread counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS,
+                            help='Delete notifications older than this (default NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=notifications.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted')
+        parser.add_argument('--recount', action='store_true', help='Rebuild every user\'s unread counter from the rows')
+
+    def handle(self, *args, **options):
+        deleted = notifications.prune(options['days'], options['batch_size'], options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f"[OK] {verb} {deleted} notifications older than {options['days']} days")
+        if options['recount'] and not options['dry_run']:
+            users = notifications.recount_unread()
+            self.stdout.write(f"[OK] Recounted unread notifications for {users} users")
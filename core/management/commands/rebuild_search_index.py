@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Re-fill the SQLite FTS5 complaint index (after bulk inserts or restores)'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        if indexed is None:
+            self.stdout.write(f"[OK] Nothing to rebuild on the {search.backend()} search backend")
+        else:
+            self.stdout.write(f"[OK] Indexed {indexed} complaints")
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import caching, rollup
+from core.ai_model.engine import ai_bot
+from core.models import Complaint, normalize_city
+
+
+class Command(BaseCommand):
+    help = 'Re-run AI classification over existing complaints in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--status', action='append', choices=[s for s, _ in Complaint.STATUS_CHOICES],
+                            help='Only reclassify complaints with this status (repeatable, default: Pending)')
+        parser.add_argument('--city', help='Only reclassify complaints from this city')
+        parser.add_argument('--keep-department', action='store_true', help='Only update priority')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        complaints = Complaint.objects.filter(status__in=options['status'] or ['Pending'])
+        if options['city']:
+            complaints = complaints.filter(city_normalized=normalize_city(options['city']))
+
+        fields = ['priority'] if options['keep_department'] else ['department', 'priority']
+        if 'department' in fields:
+            # Departments an admin confirmed are never overwritten (same guard as tasks._apply)
+            complaints = complaints.exclude(department_confirmed=True)
+        scanned = changed = 0
+        last_id = 0
+        while True:
+            # Keyset pagination on id keeps every chunk an index range scan
+            rows = list(complaints.filter(id__gt=last_id).order_by('id').only('id', 'description', *rollup.FIELDS)[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            depts, prios, _ = ai_bot.predict_batch([c.description for c in rows])
+            dirty, changes = [], []
+            for c, dept, prio in zip(rows, depts, prios):
+                new_values = {'department': dept, 'priority': prio}
+                if any(getattr(c, f) != new_values[f] for f in fields):
+                    old = rollup.state(c)
+                    for f in fields:
+                        setattr(c, f, new_values[f])
+                    dirty.append(c)
+                    changes.append((old, rollup.state(c)))
+
+            if dirty and not options['dry_run']:
+                # bulk_update skips the save() signals
+                with transaction.atomic():
+                    Complaint.objects.bulk_update(dirty, fields)
+                    rollup.record_changes(changes)
+                    caching.invalidate_scopes((v['department'], v['city_normalized']) for pair in changes for v in pair)
+            scanned += len(rows)
+            changed += len(dirty)
+            self.stdout.write(f"  {scanned} scanned, {changed} changed")
+
+        verb = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(self.style.SUCCESS(f"[OK] Reclassified {scanned} complaints, {verb} {changed}"))
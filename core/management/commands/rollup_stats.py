@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import rollup
+
+
+class Command(BaseCommand):
+    help = 'Backfill, rebuild or check the ComplaintDailyStats rollup against Complaint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only the last N days of creation dates (default: everything)')
+        parser.add_argument('--department', help='Only this department')
+        parser.add_argument('--check', action='store_true', help='Report drift without writing (exit status 1 if any)')
+        parser.add_argument('--reconcile', action='store_true', help='Rebuild only if --check finds drift')
+
+    def handle(self, *args, **options):
+        since = timezone.localdate() - timedelta(days=options['days'] - 1) if options['days'] else None
+
+        if options['check'] or options['reconcile']:
+            drifted = rollup.drift(since)
+            if options['department']:
+                drifted = {k: v for k, v in drifted.items() if k[2] == options['department']}
+            for key, diff in list(drifted.items())[:20]:
+                details = ', '.join(f'{m} {have} != {want}' for m, (have, want) in diff.items())
+                self.stdout.write(f"  {key[0]} {key[1]} / {key[2]} / {key[3]} / {key[4]}: {details}")
+            if not drifted:
+                self.stdout.write("[OK] Rollup matches the complaints")
+                return
+            self.stdout.write(f"[WARNING] {len(drifted)} rollup rows drifted")
+            if options['check']:
+                raise SystemExit(1)
+
+        written = rollup.rebuild(since, options['department'])
+        self.stdout.write(f"[OK] Rebuilt {written} rollup rows")
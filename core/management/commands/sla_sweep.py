@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import sla
+
+
+class Command(BaseCommand):
+    help = 'Flag Pending complaints past their SLA deadline (sla_breached) or long past it (is_escalated) and notify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=int, nargs='?', const=settings.SLA_SWEEP_INTERVAL, metavar='SECONDS',
+                            help='Keep sweeping (default interval SLA_SWEEP_INTERVAL)')
+        parser.add_argument('--batch-size', type=int, default=sla.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be flagged')
+        parser.add_argument('--no-notify', action='store_true',
+                            help='Flag without notifying (first run over a backlog of old tickets)')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            result = sla.sweep(batch_size=options['batch_size'], dry_run=options['dry_run'],
+                               notify=not options['no_notify'])
+            verb = 'Would flag' if options['dry_run'] else 'Flagged'
+            if result['breached'] or result['escalated'] or not options['watch']:
+                self.stdout.write(f"[OK] {verb} {result['breached']} breached and {result['escalated']} escalated "
+                                  f"complaints in {(time.perf_counter() - start) * 1000:.0f} ms")
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Q
+
+from core.ai_model import artifact
+from core.ai_model.engine import CSV_PATH, train_and_publish
+from core.models import Complaint
+
+
+def production_labels():
+    """
+    Complaints whose department a human has confirmed: transferred by an admin,
+    or closed by the citizen as fully resolved by the assigned department.
+    """
+    return Complaint.objects.filter(
+        Q(department_confirmed=True) | Q(status='Closed', resolution='Fully Resolved')
+    ).exclude(description='')
+
+
+class Command(BaseCommand):
+    help = 'Retrain the AI model from dataset.csv + labelled complaints and publish a new artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n-jobs', type=int, default=-1, help='Cores for RandomForest (default: all)')
+        parser.add_argument('--no-production-labels', action='store_true', help='Train on dataset.csv only')
+        parser.add_argument('--watch', type=int, metavar='SECONDS',
+                            help='Keep running and retrain whenever labels or dataset.csv change '
+                                 '(new versions reach processes sharing this artifacts/ directory only)')
+
+    def handle(self, *args, **options):
+        if not options['watch']:
+            self.train(options)
+            return
+
+        self.stdout.write(f"[OK] Watching for new labels every {options['watch']}s")
+        last_seen = None
+        while True:
+            seen = self.fingerprint(options)
+            if seen != last_seen:
+                if last_seen is not None or self.is_stale(seen):
+                    self.train(options)
+                last_seen = seen
+            time.sleep(options['watch'])
+
+    def fingerprint(self, options):
+        labels = {} if options['no_production_labels'] else production_labels().aggregate(n=Count('id'), latest=Max('updated_at'))
+        return artifact.dataset_sha256(CSV_PATH), labels.get('n'), labels.get('latest')
+
+    def is_stale(self, seen):
+        """On startup, only retrain if the published artifact predates the current dataset"""
+        try:
+            _, manifest = artifact.load_artifact()
+        except artifact.ArtifactError:
+            return True
+        return manifest['dataset_sha256'] != seen[0]
+
+    def train(self, options):
+        texts, labels = [], []
+        if not options['no_production_labels']:
+            for desc, dept in production_labels().values_list('description', 'department').iterator(chunk_size=2000):
+                texts.append(desc)
+                labels.append(dept)
+
+        manifest = train_and_publish(texts, labels, n_jobs=options['n_jobs'])
+        if manifest:
+            self.stdout.write(self.style.SUCCESS(
+                f"[OK] Published {manifest['version']} ({manifest['metrics']['training_samples']} samples); "
+                f"running workers swap it in within their reload interval"
+            ))
+        else:
+            self.stderr.write("[ERROR] Training failed, CURRENT artifact unchanged")
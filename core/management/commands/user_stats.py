@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core import user_stats
+
+
+class Command(BaseCommand):
+    help = 'Check or repair the per-user complaint counters (User.complaints_*) against Complaint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report drift without writing (exit status 1 if any)')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drifted = user_stats.drift()
+            for user_id, diff in list(drifted.items())[:20]:
+                details = ', '.join(f'{c} {have} != {want}' for c, (have, want) in diff.items())
+                self.stdout.write(f"  user {user_id}: {details}")
+            if drifted:
+                self.stdout.write(f"[WARNING] {len(drifted)} users' counters drifted")
+                raise SystemExit(1)
+            self.stdout.write("[OK] User counters match the complaints")
+            return
+
+        repaired = user_stats.reconcile()
+        self.stdout.write(f"[OK] Reconciled counters for {repaired} users")
@@ -0,0 +1,257 @@
+"""
+Uploaded media: content-addressed storage and cacheable serving.
+
+ContentAddressedStorage (the default storage, see STORAGES) names every file
+by the sha256 of its bytes - blobs/ab/cd/abcd...ef.png - so uploading the same
+file twice stores it once, and a name never changes content. Files saved
+under their upload_to names before it (complaints/, profiles/) keep working;
+the dedupe_media command moves them over.
+
+serve() answers MEDIA_URL requests in production too (django.conf.urls.static
+only works with DEBUG):
+
+- strong ETag: the content hash (read from the name for blobs, computed once
+  per file version for older names); If-None-Match gives a 304
+- Cache-Control immutable for blobs, revalidation for older names; private,
+  since media is only served to logged-in users
+- single byte ranges (206/416, If-Range) for resuming large downloads
+- MEDIA_SENDFILE hands the transfer to the front server instead of Python:
+  'x-sendfile' (Apache mod_xsendfile, lighttpd) or 'x-accel-redirect' (nginx,
+  internal location at MEDIA_ACCEL_PREFIX)
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 1 << 16
+IMMUTABLE = 'private, max-age=31536000, immutable'
+REVALIDATE = 'private, no-cache'
+
+BLOB_NAME = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/(?P<sha>[0-9a-f]{{64}})(\.[a-z0-9]+)?$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def blob_name(sha, extension=''):
+    return f'{BLOB_DIR}/{sha[:2]}/{sha[2:4]}/{sha}{extension}'
+
+
+def content_sha(name):
+    """sha256 encoded in a content-addressed name, or None for other names"""
+    match = BLOB_NAME.match(name)
+    return match.group('sha') if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by their content; identical files are stored once"""
+
+    def get_available_name(self, name, max_length=None):
+        return name  # _save picks the name; no "_AbC12" suffixes
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        name = blob_name(digest.hexdigest(), os.path.splitext(name)[1].lower())
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Write aside and rename: readers never see a partial blob, and two
+        # concurrent saves of the same content just replace it with itself
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    f.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+@lru_cache(maxsize=4096)
+def _file_sha(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def etag(name, path, stat):
+    """Strong ETag: the content hash"""
+    return '"%s"' % (content_sha(name) or _file_sha(path, stat.st_mtime_ns, stat.st_size))
+
+
+def byte_range(header, size):
+    """
+    Args:
+        header: Range request header ('bytes=0-499', 'bytes=500-', 'bytes=-500')
+        size: File size
+
+    Returns:
+        (start, end) inclusive, None to send the whole file (absent, malformed
+        or multi-range header), or False if unsatisfiable
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:  # Suffix: the last N bytes
+        length = int(last)
+        return (max(0, size - length), size - 1) if length and size else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return False
+    return start, end
+
+
+class RangeFile:
+    """File-like view of bytes start..end (inclusive) for FileResponse"""
+
+    def __init__(self, f, start, end):
+        self.file = f
+        self.remaining = end - start + 1
+        f.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        data = self.file.read(self.remaining if size < 0 else min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _sendfile(response, name, path):
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + name
+    else:
+        response['X-Sendfile'] = path
+    response['Content-Length'] = '0'  # The front server fills in the body (and handles Range)
+    return response
+
+
+def serve(request, name, storage):
+    """
+    Args:
+        request: GET/HEAD request
+        name: Storage name (the part of the URL after MEDIA_URL)
+        storage: FileSystemStorage the name belongs to
+
+    Returns:
+        HttpResponse: 200/206 with the file (or a sendfile header), 304, 416; Http404 if missing
+    """
+    try:
+        path = storage.path(name)  # Rejects ../ traversal (SuspiciousFileOperation)
+        stat = os.stat(path)
+    except (OSError, ValueError) as e:
+        raise Http404('File not found') from e
+    if not os.path.isfile(path):
+        raise Http404('File not found')
+
+    tag = etag(name, path, stat)
+    headers = {
+        'ETag': tag,
+        'Cache-Control': IMMUTABLE if content_sha(name) else REVALIDATE,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+    }
+    if tag in (t.strip() for t in request.headers.get('If-None-Match', '').split(',')):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        return _sendfile(response, name, path)
+
+    size = stat.st_size
+    if_range = request.headers.get('If-Range')
+    wanted = byte_range(request.headers.get('Range'), size) if not if_range or if_range == tag else None
+    if wanted is False:
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+    f = open(path, 'rb')
+    if wanted is None:
+        response = FileResponse(f, content_type=content_type, headers=headers)
+        response['Content-Length'] = str(size)
+        return response
+    start, end = wanted
+    response = FileResponse(RangeFile(f, start, end), status=206, content_type=content_type, headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def dedupe_existing(storage, dry_run=False):
+    """
+    Move files saved under their upload names (before content addressing)
+    into blobs and point complaints, profiles and processed images at them;
+    identical files collapse into one.
+
+    Args:
+        storage: ContentAddressedStorage
+        dry_run: Only report
+
+    Returns:
+        dict: 'files' moved, 'blobs' distinct, 'bytes_saved', 'rows' updated, 'missing' names
+    """
+    from .models import Complaint, ProcessedImage, User
+
+    result = {'files': 0, 'blobs': 0, 'bytes_saved': 0, 'rows': 0, 'missing': []}
+    moved = {}
+
+    def to_blob(name):
+        if name in moved or content_sha(name):
+            return moved.get(name, name)
+        if not storage.exists(name):
+            result['missing'].append(name)
+            return name
+        path = storage.path(name)
+        stat = os.stat(path)
+        new_name = blob_name(_file_sha(path, stat.st_mtime_ns, stat.st_size), os.path.splitext(name)[1].lower())
+        if new_name in moved.values() or storage.exists(new_name):
+            result['bytes_saved'] += stat.st_size
+        else:
+            result['blobs'] += 1
+        if not dry_run:
+            with storage.open(name, 'rb') as f:
+                storage.save(name, f)
+        moved[name] = new_name
+        result['files'] += 1
+        return new_name
+
+    for asset in ProcessedImage.objects.filter(status='Done').exclude(name__startswith=f'{BLOB_DIR}/'):
+        variants = {width: to_blob(name) for width, name in asset.variants.items()}
+        if not dry_run:
+            result['rows'] += ProcessedImage.objects.filter(pk=asset.pk).update(name=to_blob(asset.name), variants=variants)
+    for model, field in ((Complaint, 'image'), (User, 'profile_pic')):
+        rows = model.objects.exclude(**{f'{field}__in': ['', None]}).exclude(**{f'{field}__startswith': f'{BLOB_DIR}/'})
+        for name in list(rows.values_list(field, flat=True).distinct()):
+            new_name = to_blob(name)
+            if not dry_run and new_name != name:
+                result['rows'] += model.objects.filter(**{field: name}).update(**{field: new_name})
+    if not dry_run:
+        for name in moved:
+            storage.delete(name)
+    return result
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_user_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='department_confirmed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    # One row per prefix up front, so allocation is always a plain UPDATE
+    TicketCounter = apps.get_model('core', 'TicketCounter')
+    TicketCounter.objects.bulk_create(
+        [TicketCounter(prefix=p, next_seq=1000) for p in (10, 20, 30, 40, 50, 60, 90)],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_classificationtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketCounter',
+            fields=[
+                ('prefix', models.IntegerField(primary_key=True, serialize=False)),
+                ('next_seq', models.BigIntegerField(default=1000)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='ticket_id',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def backfill_city_normalized(apps, schema_editor):
+    Complaint = apps.get_model('core', 'Complaint')
+    Complaint.objects.update(city_normalized=Lower('city'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_ticketcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='city_normalized',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(backfill_city_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['department', 'city_normalized', 'status', 'created_at'], name='complaint_dept_city_status'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['user', 'created_at'], name='complaint_user_created'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 19:10
+
+from django.db import migrations
+
+PG_FORWARD = [
+    """
+    ALTER TABLE core_complaint ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(description, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(location_name, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX complaint_search_vector_gin ON core_complaint USING GIN (search_vector)",
+]
+PG_BACKWARD = [
+    "DROP INDEX IF EXISTS complaint_search_vector_gin",
+    "ALTER TABLE core_complaint DROP COLUMN IF EXISTS search_vector",
+]
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE core_complaint_fts USING fts5(description, location_name, tokenize = 'porter unicode61')",
+    "INSERT INTO core_complaint_fts (rowid, description, location_name) SELECT id, description, location_name FROM core_complaint",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS core_complaint_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, PG_FORWARD)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            has_fts5 = cursor.fetchone()[0]
+        if has_fts5:
+            _run(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, PG_BACKWARD)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_complaint_city_normalized_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+from core.geo import encode
+
+
+def backfill_geo_cell(apps, schema_editor):
+    Complaint = apps.get_model('core', 'Complaint')
+    batch = []
+    rows = Complaint.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude')
+    for complaint in rows.iterator(chunk_size=2000):
+        complaint.geo_cell = encode(complaint.latitude, complaint.longitude)
+        batch.append(complaint)
+        if len(batch) >= 2000:
+            Complaint.objects.bulk_update(batch, ['geo_cell'])
+            batch = []
+    Complaint.objects.bulk_update(batch, ['geo_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_complaint_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='geo_cell',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_geo_cell, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['department', 'city_normalized', 'geo_cell'], name='complaint_dept_city_cell'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-18 20:40
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    from core.rollup import aggregates
+
+    Complaint = apps.get_model('core', 'Complaint')
+    ComplaintDailyStats = apps.get_model('core', 'ComplaintDailyStats')
+    grouped = (
+        Complaint.objects.order_by()
+        .annotate(date=TruncDate('created_at'))
+        .values('date', 'city_normalized', 'department', 'category', 'priority')
+        .annotate(**aggregates())
+    )
+    batch = []
+    for row in grouped.iterator(chunk_size=2000):
+        resolution_time = row.pop('resolution_time')
+        row['city'] = row.pop('city_normalized')
+        row['rating_sum'] = row['rating_sum'] or 0
+        row['resolution_seconds'] = int(resolution_time.total_seconds()) if resolution_time else 0
+        batch.append(ComplaintDailyStats(**row))
+        if len(batch) >= 2000:
+            ComplaintDailyStats.objects.bulk_create(batch)
+            batch = []
+    ComplaintDailyStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_notification_unread_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('city', models.CharField(max_length=50)),
+                ('department', models.CharField(max_length=50)),
+                ('category', models.CharField(max_length=50)),
+                ('priority', models.CharField(max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('solved', models.IntegerField(default=0)),
+                ('closed', models.IntegerField(default=0)),
+                ('fully_resolved', models.IntegerField(default=0)),
+                ('partially_resolved', models.IntegerField(default=0)),
+                ('not_resolved', models.IntegerField(default=0)),
+                ('closed_fully_resolved', models.IntegerField(default=0)),
+                ('with_feedback', models.IntegerField(default=0)),
+                ('rated', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('escalated', models.IntegerField(default=0)),
+                ('sla_breached', models.IntegerField(default=0)),
+                ('resolved', models.IntegerField(default=0)),
+                ('resolution_seconds', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'city', 'date', 'category', 'priority'), name='daily_stats_key')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-18 21:45
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_complaint_counters(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    Complaint = apps.get_model('core', 'Complaint')
+
+    def count(status=None):
+        complaints = Complaint.objects.filter(user=OuterRef('pk'))
+        if status:
+            complaints = complaints.filter(status=status)
+        counted = complaints.order_by().values('user').annotate(n=Count('id')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+    User.objects.update(
+        complaints_total=count(),
+        complaints_pending=count('Pending'),
+        complaints_solved=count('Solved'),
+        complaints_closed=count('Closed'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_processed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='complaints_closed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='complaints_pending',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='complaints_solved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='complaints_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_complaint_counters, migrations.RunPython.noop),
+    ]
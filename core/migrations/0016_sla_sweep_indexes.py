@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_user_last_activity_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('sla_breached', False), ('status', 'Pending')), fields=['priority', 'created_at'], name='complaint_sla_unbreached'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('sla_breached', False), ('status', 'Pending')), fields=['department', 'priority', 'created_at'], name='complaint_sla_dept_unbreached'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('is_escalated', False), ('status', 'Pending')), fields=['priority', 'created_at'], name='complaint_sla_unescalated'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('is_escalated', False), ('status', 'Pending')), fields=['department', 'priority', 'created_at'], name='complaint_sla_dept_unescalated'),
+        ),
+    ]
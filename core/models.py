@@ -1,7 +1,38 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-import random
+import threading
 from django.utils import timezone
+from . import geo
+
+
+class ProcessedImage(models.Model):
+    """
+    One uploaded image per distinct content (sha256 of the uploaded bytes),
+    re-encoded by core.images: EXIF stripped, downscaled, plus thumbnails.
+    Complaints and profiles point at it, so a re-uploaded photo is stored once.
+    """
+    STATUS_CHOICES = [('Pending', 'Pending'), ('Done', 'Done'), ('Failed', 'Failed')]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending', db_index=True)
+    staged = models.CharField(max_length=255, blank=True)  # Raw upload in IMAGE_STAGING_ROOT until processed
+    name = models.CharField(max_length=255, blank=True)  # Main rendition (media storage name)
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    variants = models.JSONField(default=dict, blank=True)  # {width: storage name}, main rendition included
+    original_bytes = models.BigIntegerField(default=0)
+    stored_bytes = models.BigIntegerField(default=0)  # All renditions together
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    def srcset(self):
+        """'url 320w, url 640w, ...' for an <img srcset>"""
+        from django.core.files.storage import default_storage
+        return ', '.join(f'{default_storage.url(name)} {width}w'
+                         for width, name in sorted(self.variants.items(), key=lambda item: int(item[0])))
 
 
 class User(AbstractUser):
@@ -19,7 +50,104 @@ class User(AbstractUser):
     gender = models.CharField(max_length=10, blank=True, null=True)
     dob = models.DateField(blank=True, null=True)
     profile_pic = models.ImageField(upload_to='profiles/', blank=True, null=True)
-    last_activity = models.DateTimeField(default=timezone.now)
+    profile_pic_asset = models.ForeignKey(ProcessedImage, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)  # Throttled by core.activity
+    # Denormalized count of unread notifications, kept in step by core.notifications
+    unread_notifications = models.PositiveIntegerField(default=0)
+    # Denormalized counts of the user's complaints per status, kept in step by core.user_stats
+    complaints_total = models.PositiveIntegerField(default=0)
+    complaints_pending = models.PositiveIntegerField(default=0)
+    complaints_solved = models.PositiveIntegerField(default=0)
+    complaints_closed = models.PositiveIntegerField(default=0)
+
+
+# Ticket ID prefix per department (anything else gets 90)
+TICKET_PREFIXES = {'Municipal': 10, 'Police': 20, 'Electricity': 30, 'Health': 40, 'Water': 50, 'PWD': 60}
+
+
+class TicketCounter(models.Model):
+    """
+    Next ticket sequence number per department prefix.
+
+    Each process reserves a block of TICKET_ID_BLOCK_SIZE numbers with one
+    atomic UPDATE ... SET next_seq = next_seq + N (the row lock serialises
+    concurrent reservations), then hands them out from memory - no random
+    IDs, no IntegrityError retries. Sequences start at 1000, so new IDs never
+    clash with the legacy prefix + 3 random digit IDs. Unused numbers of a
+    block are skipped when a process exits (gaps are fine, duplicates aren't).
+
+    A block reserved inside the caller's transaction only joins the shared
+    blocks once that transaction commits: if it rolls back, so does the
+    UPDATE, and another process will reserve the same numbers.
+    """
+    prefix = models.IntegerField(primary_key=True)
+    next_seq = models.BigIntegerField(default=1000)
+
+    _blocks = {}  # prefix -> (next, end) reserved and committed by this process
+    _lock = threading.Lock()
+
+    @classmethod
+    def allocate(cls, prefix):
+        with cls._lock:
+            start, end = cls._blocks.get(prefix, (0, 0))
+            if start < end:
+                cls._blocks[prefix] = (start + 1, end)
+                return start
+            connection = transaction.get_connection()
+            if not connection.in_atomic_block:
+                start, end = cls._reserve(prefix, settings.TICKET_ID_BLOCK_SIZE)  # Committed right away
+                cls._blocks[prefix] = (start + 1, end)
+                return start
+
+        # Inside a transaction: blocks reserved by it are this connection's until it commits
+        pending = cls._pending(connection)
+        if prefix in pending and pending[prefix][0] < pending[prefix][1]:
+            block = pending[prefix]
+        else:
+            block = list(cls._reserve(prefix, settings.TICKET_ID_BLOCK_SIZE))
+
+            def keep():
+                with cls._lock:
+                    start, end = cls._blocks.get(prefix, (0, 0))
+                    if start >= end and block[0] < block[1]:
+                        cls._blocks[prefix] = (block[0], block[1])
+
+            block.append(keep)
+            pending[prefix] = block
+            transaction.on_commit(keep)
+        block[0] += 1
+        return block[0] - 1
+
+    @staticmethod
+    def _pending(connection):
+        """This connection's uncommitted blocks; those of rolled-back transactions (or savepoints) are dropped"""
+        pending = connection.__dict__.setdefault('ticket_blocks', {})
+        # Django discards the on_commit callbacks of whatever rolls back
+        live = {id(entry[1]) for entry in connection.run_on_commit}
+        for prefix, block in list(pending.items()):
+            if id(block[2]) not in live:
+                del pending[prefix]
+        return pending
+
+    @classmethod
+    def _reserve(cls, prefix, size):
+        with transaction.atomic():
+            if not cls.objects.filter(prefix=prefix).update(next_seq=F('next_seq') + size):
+                cls.objects.bulk_create([cls(prefix=prefix)], ignore_conflicts=True)
+                cls.objects.filter(prefix=prefix).update(next_seq=F('next_seq') + size)
+            end = cls.objects.values_list('next_seq', flat=True).get(prefix=prefix)
+        return end - size, end
+
+
+def normalize_city(city):
+    """Case-folded city used for indexed lookups (replaces city__iexact)"""
+    return (city or '').lower()
+
+
+class ComplaintQuerySet(models.QuerySet):
+    def for_department(self, department, city):
+        """A department admin's scope; served by the (department, city_normalized, ...) index"""
+        return self.filter(department=department, city_normalized=normalize_city(city))
 
 
 class Complaint(models.Model):
@@ -27,18 +155,21 @@ class Complaint(models.Model):
     PRIORITY_CHOICES = [('High', 'High'), ('Medium', 'Medium'), ('Low', 'Low')]
     RESOLUTION_CHOICES = [('Fully Resolved', 'Fully Resolved'), ('Partially Resolved', 'Partially Resolved'), ('Not Resolved', 'Not Resolved')]
 
-    # Smart Ticket ID (e.g. 10492)
-    ticket_id = models.IntegerField(unique=True, blank=True, null=True)
+    # Smart Ticket ID: department prefix + sequence (e.g. 101042)
+    ticket_id = models.BigIntegerField(unique=True, blank=True, null=True)
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     description = models.TextField()
     location_name = models.CharField(max_length=200)
     pincode = models.CharField(max_length=10)
     city = models.CharField(max_length=50) # Snapshot of city
+    city_normalized = models.CharField(max_length=50, default='', editable=False)  # normalize_city(city), kept by save()
     title = models.CharField(blank=True, max_length=200)
     image = models.ImageField(upload_to='complaints/', blank=True, null=True)
+    image_asset = models.ForeignKey(ProcessedImage, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
     
     department = models.CharField(max_length=50) 
+    department_confirmed = models.BooleanField(default=False)  # Set by an admin (transfer) - used as a training label
     CATEGORY_CHOICES = [
         ('Road/Street', 'Road/Street'),
         ('Water/Sewage', 'Water/Sewage'),
@@ -62,6 +193,7 @@ class Complaint(models.Model):
     # Geo & Feedback
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    geo_cell = models.BigIntegerField(null=True, editable=False)  # Morton grid cell, see core.geo
     resolution = models.CharField(max_length=20, choices=RESOLUTION_CHOICES, blank=True, null=True)
     
     # Feedback System
@@ -74,30 +206,110 @@ class Complaint(models.Model):
     closed_at = models.DateTimeField(blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ComplaintQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Admin views: department + city, then status/priority/feedback filters, newest first
+            models.Index(fields=['department', 'city_normalized', 'status', 'created_at'], name='complaint_dept_city_status'),
+            # Citizen views: own complaints, newest first
+            models.Index(fields=['user', 'created_at'], name='complaint_user_created'),
+            # Map clusters: department + city, then a bbox as one geo_cell range
+            models.Index(fields=['department', 'city_normalized', 'geo_cell'], name='complaint_dept_city_cell'),
+            # SLA sweep (core/sla.py): only Pending tickets not yet flagged, so each sweep reads just the new ones;
+            # priority-wide deadlines range over the first, SLA_DEPARTMENT_HOURS overrides over the second
+            models.Index(fields=['priority', 'created_at'], condition=Q(status='Pending', sla_breached=False),
+                         name='complaint_sla_unbreached'),
+            models.Index(fields=['department', 'priority', 'created_at'], condition=Q(status='Pending', sla_breached=False),
+                         name='complaint_sla_dept_unbreached'),
+            models.Index(fields=['priority', 'created_at'], condition=Q(status='Pending', is_escalated=False),
+                         name='complaint_sla_unescalated'),
+            models.Index(fields=['department', 'priority', 'created_at'], condition=Q(status='Pending', is_escalated=False),
+                         name='complaint_sla_dept_unescalated'),
+        ]
+
     def save(self, *args, **kwargs):
         # 1. Generate ID if not present
         if not self.ticket_id:
-            prefix = 90
-            if self.department == 'Municipal': prefix = 10
-            elif self.department == 'Police': prefix = 20
-            elif self.department == 'Electricity': prefix = 30
-            elif self.department == 'Health': prefix = 40
-            elif self.department == 'Water': prefix = 50
-            elif self.department == 'PWD': prefix = 60
-            self.ticket_id = int(f"{prefix}{random.randint(100, 999)}")
+            prefix = TICKET_PREFIXES.get(self.department, 90)
+            self.ticket_id = int(f"{prefix}{TicketCounter.allocate(prefix)}")
 
         # 2. Auto-fill City from User
         if not self.city and self.user:
             self.city = self.user.city
-            
-        super().save(*args, **kwargs)
+        self.city_normalized = normalize_city(self.city)
+        self.geo_cell = geo.encode(self.latitude, self.longitude)
+
+        # The row and what post_save keeps in step with it (daily rollup, owner
+        # counters, search index) commit together or not at all
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"#{self.ticket_id} - {self.description[:20]}"
 
+class ComplaintDailyStats(models.Model):
+    """
+    Complaints created on one day, per (city, department, category, priority),
+    and what has happened to them since. Kept in step incrementally by
+    core.rollup; `manage.py rollup_stats` rebuilds it from Complaint.
+    """
+    date = models.DateField()
+    city = models.CharField(max_length=50)  # Complaint.city_normalized
+    department = models.CharField(max_length=50)
+    category = models.CharField(max_length=50)
+    priority = models.CharField(max_length=20)
+
+    total = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+    closed = models.IntegerField(default=0)
+    fully_resolved = models.IntegerField(default=0)
+    partially_resolved = models.IntegerField(default=0)
+    not_resolved = models.IntegerField(default=0)
+    closed_fully_resolved = models.IntegerField(default=0)
+    with_feedback = models.IntegerField(default=0)
+    rated = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    escalated = models.IntegerField(default=0)
+    sla_breached = models.IntegerField(default=0)
+    resolved = models.IntegerField(default=0)  # solved_at set
+    resolution_seconds = models.BigIntegerField(default=0)  # Sum of solved_at - created_at
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'city', 'date', 'category', 'priority'], name='daily_stats_key'),
+        ]
+
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.CharField(max_length=255)
     title = models.CharField(max_length=255, default='Notification')
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Unread dropdown (user, is_read=False, newest first) and retention scans
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created'),
+        ]
+
+
+class ClassificationTask(models.Model):
+    """Queued ML classification for a complaint saved with provisional (keyword) triage"""
+    STATUS_CHOICES = [('Queued', 'Queued'), ('Running', 'Running'), ('Done', 'Done'), ('Failed', 'Failed')]
+
+    complaint = models.OneToOneField(Complaint, on_delete=models.CASCADE, related_name='classification_task')
+    notification = models.ForeignKey(Notification, on_delete=models.SET_NULL, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Queued', db_index=True)
+    claimed_by = models.CharField(max_length=32, blank=True)  # Token of the worker that claimed it
+    attempts = models.IntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
@@ -0,0 +1,147 @@
+"""
+Notification service.
+
+Single events go through notify(). Bulk admin actions collect the affected
+(ticket_id, owner) pairs with one query and hand them to notify_owners(),
+which writes one notification per owner - grouping an owner's tickets into
+one message - with bulk_create in batches of BATCH_SIZE. Closing 5,000
+tickets is a select, an update and a few INSERTs instead of 5,000 creates.
+
+Each user's unread count is denormalized onto User.unread_notifications and
+changed in the same transaction as the notification rows, so the dashboard
+badge is read off request.user instead of a COUNT(*). Everything that
+creates, reads or deletes notifications must go through this module.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Notification, User
+
+BATCH_SIZE = 500
+MAX_LISTED_TICKETS = 5  # Ticket numbers spelled out in a grouped message
+
+# Owner messages per bulk action: (one ticket, several tickets)
+SOLVED = ("✅ Ticket #{ticket} resolved. Please provide feedback!",
+          "✅ {count} of your tickets were resolved ({tickets}). Please provide feedback!")
+TRANSFERRED = ("Ticket #{ticket} was transferred to the {department} department.",
+               "{count} of your tickets were transferred to the {department} department ({tickets}).")
+PRIORITY_CHANGED = ("Ticket #{ticket} priority changed to {priority}.",
+                    "{count} of your tickets had their priority changed to {priority} ({tickets}).")
+# SLA sweep (core/sla.py): admins on breach, owners and admins on escalation
+SLA_BREACHED = ("⏰ Ticket #{ticket} is past its SLA deadline.",
+                "⏰ {count} tickets are past their SLA deadline ({tickets}).")
+ESCALATED = ("🚨 Ticket #{ticket} is overdue and has been escalated.",
+             "🚨 {count} of your tickets are overdue and have been escalated ({tickets}).")
+ESCALATED_ADMIN = ("🚨 Ticket #{ticket} was escalated: still pending long past its SLA deadline.",
+                   "🚨 {count} tickets were escalated: still pending long past their SLA deadline ({tickets}).")
+
+
+def _add_unread(user_ids, delta):
+    """Shift unread_notifications by delta for user_ids (never below zero)"""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        User.objects.filter(pk__in=user_ids[start:start + BATCH_SIZE]).update(
+            unread_notifications=Greatest(F('unread_notifications') + delta, 0))
+
+
+def notify(user, message):
+    """Create one notification (returns it)"""
+    with transaction.atomic():
+        notification = Notification.objects.create(user=user, message=message)
+        _add_unread([user.pk], 1)
+    return notification
+
+
+def _ticket_list(tickets):
+    listed = ', '.join(f'#{t}' for t in tickets[:MAX_LISTED_TICKETS])
+    extra = len(tickets) - MAX_LISTED_TICKETS
+    return f'{listed} +{extra} more' if extra > 0 else listed
+
+
+def notify_owners(rows, messages, **context):
+    """
+    Args:
+        rows: Iterable of (ticket_id, user_id) for the complaints that changed
+        messages: (single, grouped) format strings, e.g. SOLVED
+        **context: Extra format fields (department, priority, ...)
+
+    Returns:
+        int: Notifications written
+    """
+    by_owner = defaultdict(list)
+    for ticket_id, user_id in rows:
+        by_owner[user_id].append(ticket_id)
+
+    single, grouped = messages
+    notifications = []
+    for user_id, tickets in by_owner.items():
+        if len(tickets) == 1:
+            message = single.format(ticket=tickets[0], **context)
+        else:
+            message = grouped.format(count=len(tickets), tickets=_ticket_list(tickets), **context)
+        notifications.append(Notification(user_id=user_id, message=message[:255]))
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+        _add_unread(by_owner, 1)
+    return len(notifications)
+
+
+def mark_read(user, ids):
+    """Mark some of user's notifications read; returns how many were unread"""
+    with transaction.atomic():
+        count = Notification.objects.filter(user=user, id__in=ids, is_read=False).update(is_read=True)
+        if count:
+            _add_unread([user.pk], -count)
+    user.unread_notifications = max(user.unread_notifications - count, 0)
+    return count
+
+
+def mark_all_read(user):
+    """Mark all of user's notifications read; returns how many were unread"""
+    with transaction.atomic():
+        count = Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+        User.objects.filter(pk=user.pk).update(unread_notifications=0)
+    user.unread_notifications = 0
+    return count
+
+
+def prune(days, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Delete notifications older than `days`, batch_size rows per transaction
+    (short locks, bounded memory), taking deleted unread ones off the counters.
+
+    Returns:
+        int: Notifications deleted (or that would be, with dry_run)
+    """
+    old = Notification.objects.filter(created_at__lt=timezone.now() - timedelta(days=days))
+    if dry_run:
+        return old.count()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(old.order_by('id').values_list('id', 'user_id', 'is_read')[:batch_size])
+            if not rows:
+                return deleted
+            # Complaints' ClassificationTask links are SET_NULL, so this is a plain delete
+            Notification.objects.filter(id__in=[pk for pk, _, _ in rows]).delete()
+            unread = Counter(user_id for _, user_id, is_read in rows if not is_read)
+            by_count = defaultdict(list)
+            for user_id, n in unread.items():
+                by_count[n].append(user_id)
+            for n, user_ids in by_count.items():
+                _add_unread(user_ids, -n)
+        deleted += len(rows)
+
+
+def recount_unread():
+    """Rebuild every user's unread_notifications from the rows; returns users updated"""
+    unread = (
+        Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+        .order_by().values('user').annotate(n=Count('id')).values('n')
+    )
+    return User.objects.update(unread_notifications=Coalesce(Subquery(unread, output_field=IntegerField()), 0))
@@ -0,0 +1,75 @@
+"""
+Keyset (cursor) pagination for long complaint lists.
+
+Pages are ordered by (priority rank, created_at desc, id desc) and the cursor
+is the sort key of the last row shown, so fetching page N costs the same as
+page 1 - no OFFSET scans, no COUNT, and only one page of rows in memory.
+"""
+import base64
+import json
+
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+def priority_order():
+    """High -> Medium -> Low as 1/2/3 (used as the leading sort key)"""
+    return Case(
+        When(priority='High', then=Value(1)),
+        When(priority='Medium', then=Value(2)),
+        When(priority='Low', then=Value(3)),
+        default=Value(4),
+        output_field=IntegerField(),
+    )
+
+
+def page_size(value):
+    """Parse a requested page size, bounded to 1..MAX_PAGE_SIZE"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(row):
+    key = [row.sort, row.created_at.isoformat(), row.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns (sort, created_at, id), or None for a missing/garbled cursor"""
+    try:
+        sort, created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            return None
+        return int(sort), created_at, int(pk)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def keyset_page(complaints, cursor=None, size=DEFAULT_PAGE_SIZE):
+    """
+    Args:
+        complaints: Unordered Complaint queryset (already scoped/filtered)
+        cursor: next_cursor from the previous page, or None for the first page
+        size: Rows per page
+
+    Returns:
+        tuple: (list of complaints, next_cursor or None on the last page)
+    """
+    qs = complaints.annotate(sort=priority_order()).order_by('sort', '-created_at', '-id')
+    key = decode_cursor(cursor) if cursor else None
+    if key:
+        sort, created_at, pk = key
+        qs = qs.filter(
+            Q(sort__gt=sort)
+            | Q(sort=sort, created_at__lt=created_at)
+            | Q(sort=sort, created_at=created_at, id__lt=pk)
+        )
+    rows = list(qs[:size + 1])  # One extra row tells us whether there's a next page
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
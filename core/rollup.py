@@ -0,0 +1,316 @@
+"""
+Daily complaint rollup (ComplaintDailyStats).
+
+One row per (creation date, city, department, category, priority) holding
+counters for the complaints created that day: how many there are, how many
+are Pending/Solved/Closed now, their resolutions, ratings, escalations and
+resolution time. Analytics over any date range is then a SUM over a few
+hundred rows instead of a scan of every complaint.
+
+A complaint's contribution to the rollup is a pure function of FIELDS
+(contribution()). Every write moves the affected counters by
+new contribution - old contribution:
+
+- save()/delete() - Complaint signals (core/signals.py), with the old state
+  snapshotted when the instance was loaded
+- .update()/bulk_update() paths (bulk_action, background classification,
+  reclassify_complaints) - record_update()/record_changes() with the rows
+  they read before writing
+
+Counters move with one UPDATE ... FROM (VALUES ...) per batch of keys
+(PostgreSQL, SQLite 3.33+), so a bulk action touching thousands of keys is
+still a handful of queries. rebuild() recomputes
+rows from Complaint with one GROUP BY (backfill, and repair after raw SQL
+edits or drift from concurrent edits of the same complaint).
+
+record_changes() also hands the same changes to core.user_stats, which keeps
+each citizen's per-status complaint counters on the User row.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, time
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import user_stats
+from .models import Complaint, ComplaintDailyStats, normalize_city
+from .stats import RESOLUTION_TIME
+
+KEY_FIELDS = ('date', 'city', 'department', 'category', 'priority')
+METRICS = (
+    'total', 'pending', 'solved', 'closed', 'fully_resolved', 'partially_resolved', 'not_resolved',
+    'closed_fully_resolved', 'with_feedback', 'rated', 'rating_sum', 'escalated', 'sla_breached',
+    'resolved', 'resolution_seconds',
+)
+# Complaint fields a contribution depends on (user_id: for the per-user counters, see record_changes)
+FIELDS = (
+    'created_at', 'city_normalized', 'department', 'category', 'priority', 'status', 'resolution',
+    'feedback', 'rating', 'is_escalated', 'sla_breached', 'solved_at', 'user_id',
+)
+BATCH_SIZE = 500
+
+
+def state(complaint):
+    """FIELDS of a Complaint instance as a dict, or None if any of them is deferred"""
+    values = complaint.__dict__
+    if any(f not in values for f in FIELDS):
+        return None
+    return {f: values[f] for f in FIELDS}
+
+
+def contribution(values):
+    """(key, {metric: amount}) of one complaint given its FIELDS"""
+    key = (timezone.localdate(values['created_at']), values['city_normalized'], values['department'],
+           values['category'], values['priority'])
+    status, resolution = values['status'], values['resolution']
+    metrics = {
+        'total': 1,
+        'pending': status == 'Pending',
+        'solved': status == 'Solved',
+        'closed': status == 'Closed',
+        'fully_resolved': resolution == 'Fully Resolved',
+        'partially_resolved': resolution == 'Partially Resolved',
+        'not_resolved': resolution == 'Not Resolved',
+        'closed_fully_resolved': status == 'Closed' and resolution == 'Fully Resolved',
+        'with_feedback': values['feedback'] is not None,
+        'rated': values['rating'] is not None,
+        'rating_sum': values['rating'] or 0,
+        'escalated': bool(values['is_escalated']),
+        'sla_breached': bool(values['sla_breached']),
+        'resolved': values['solved_at'] is not None,
+        'resolution_seconds': int((values['solved_at'] - values['created_at']).total_seconds()) if values['solved_at'] else 0,
+    }
+    return key, {m: int(v) for m, v in metrics.items() if v}
+
+
+def _add(deltas, values, sign):
+    key, metrics = contribution(values)
+    for metric, amount in metrics.items():
+        deltas[key][metric] += sign * amount
+
+
+def _key_ids(deltas):
+    """{key: rollup row id} for the keys in deltas, rows locked; creates missing rows"""
+    def select(keys):
+        # Locked in key order, so two writers touching overlapping keys can't deadlock
+        rows = ComplaintDailyStats.objects.select_for_update().filter(
+            date__in={k[0] for k in keys}, city__in={k[1] for k in keys}, department__in={k[2] for k in keys},
+        ).order_by(*KEY_FIELDS).values_list('id', *KEY_FIELDS)
+        found = {}
+        for pk, *key in rows:
+            if tuple(key) in keys:
+                found[tuple(key)] = pk
+        return found
+
+    ids = select(deltas.keys())
+    missing = deltas.keys() - ids.keys()
+    if missing:
+        ComplaintDailyStats.objects.bulk_create(
+            [ComplaintDailyStats(**dict(zip(KEY_FIELDS, key))) for key in sorted(missing)],
+            batch_size=BATCH_SIZE, ignore_conflicts=True,  # Another transaction may have just created some
+        )
+        ids.update(select(missing))
+    return ids
+
+
+def _update_from_values(ids, deltas, metrics):
+    """One UPDATE ... FROM (VALUES ...) per batch: every row moves by its own deltas"""
+    table = connection.ops.quote_name(ComplaintDailyStats._meta.db_table)
+    columns = ['id', *metrics]
+    per_batch = max(1, min(BATCH_SIZE, (connection.features.max_query_params or 100_000) // len(columns)))
+    placeholder = '(' + ', '.join(['CAST(%s AS BIGINT)'] * len(columns)) + ')'
+    assignments = ', '.join(
+        f'{connection.ops.quote_name(m)} = {connection.ops.quote_name(m)} + v.column{i}'
+        for i, m in enumerate(metrics, start=2)
+    )
+    items = sorted(deltas.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), per_batch):
+            batch = items[start:start + per_batch]
+            params = [value for key, changes in batch for value in (ids[key], *(changes.get(m, 0) for m in metrics))]
+            cursor.execute(
+                f'UPDATE {table} SET {assignments} FROM (VALUES {", ".join([placeholder] * len(batch))}) AS v '
+                f'WHERE {table}.id = v.column1',
+                params,
+            )
+
+
+def apply(deltas):
+    """Add {key: {metric: delta}} to the rollup (creating rows as needed)"""
+    deltas = {key: {m: d for m, d in metrics.items() if d} for key, metrics in deltas.items()}
+    deltas = {key: metrics for key, metrics in deltas.items() if metrics}
+    if not deltas:
+        return
+    metrics = [m for m in METRICS if any(m in changes for changes in deltas.values())]
+    with transaction.atomic():
+        ids = _key_ids(deltas)
+        if connection.vendor == 'postgresql' or (connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 33)):
+            _update_from_values(ids, deltas, metrics)
+        else:
+            # No UPDATE ... FROM: one F() update per key
+            for key, changes in sorted(deltas.items()):
+                ComplaintDailyStats.objects.filter(pk=ids[key]).update(**{m: F(m) + d for m, d in changes.items()})
+
+
+def record_changes(pairs):
+    """
+    Args:
+        pairs: Iterable of (old FIELDS dict or None for a new complaint,
+               new FIELDS dict or None for a deleted one)
+    """
+    pairs = list(pairs)
+    deltas = defaultdict(Counter)
+    for old, new in pairs:
+        if old is not None:
+            _add(deltas, old, -1)
+        if new is not None:
+            _add(deltas, new, +1)
+    with transaction.atomic():
+        apply(deltas)
+        user_stats.record_changes(pairs)  # Same changes, per owner
+
+
+def record_update(rows, **changes):
+    """After queryset.update(**changes) on complaints whose FIELDS (read beforehand) are rows"""
+    if 'city' in changes:
+        changes['city_normalized'] = normalize_city(changes.pop('city'))
+    record_changes((row, {**row, **{f: v for f, v in changes.items() if f in FIELDS}}) for row in rows)
+
+
+def aggregates():
+    """Complaint -> ComplaintDailyStats metric aggregates (the GROUP BY used by rebuild)"""
+    return {
+        'total': Count('id'),
+        'pending': Count('id', filter=Q(status='Pending')),
+        'solved': Count('id', filter=Q(status='Solved')),
+        'closed': Count('id', filter=Q(status='Closed')),
+        'fully_resolved': Count('id', filter=Q(resolution='Fully Resolved')),
+        'partially_resolved': Count('id', filter=Q(resolution='Partially Resolved')),
+        'not_resolved': Count('id', filter=Q(resolution='Not Resolved')),
+        'closed_fully_resolved': Count('id', filter=Q(status='Closed', resolution='Fully Resolved')),
+        'with_feedback': Count('id', filter=Q(feedback__isnull=False)),
+        'rated': Count('rating'),
+        'rating_sum': Sum('rating'),
+        'escalated': Count('id', filter=Q(is_escalated=True)),
+        'sla_breached': Count('id', filter=Q(sla_breached=True)),
+        'resolved': Count('solved_at'),
+        'resolution_time': Sum(RESOLUTION_TIME),
+    }
+
+
+def computed_rows(complaints):
+    """ComplaintDailyStats rows (unsaved) computed from a Complaint queryset"""
+    grouped = (
+        complaints.order_by()
+        .annotate(date=TruncDate('created_at'))
+        .values('date', 'city_normalized', 'department', 'category', 'priority')
+        .annotate(**aggregates())
+    )
+    for row in grouped.iterator(chunk_size=BATCH_SIZE * 4):
+        resolution_time = row.pop('resolution_time')
+        row['city'] = row.pop('city_normalized')
+        row['rating_sum'] = row['rating_sum'] or 0
+        # Whole seconds per complaint, like contribution() (sub-second parts differ by < 1 s each)
+        row['resolution_seconds'] = int(resolution_time.total_seconds()) if resolution_time else 0
+        yield ComplaintDailyStats(**row)
+
+
+def rebuild(since=None, department=None):
+    """
+    Recompute rollup rows from Complaint, replacing what's there.
+
+    Args:
+        since: Only creation dates from this date on (None for everything)
+        department: Only this department
+
+    Returns:
+        int: Rows written
+    """
+    complaints = Complaint.objects.all()
+    rows = ComplaintDailyStats.objects.all()
+    if since is not None:
+        # created_at bound in local time, matching TruncDate / localdate
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        complaints = complaints.filter(created_at__gte=start)
+        rows = rows.filter(date__gte=since)
+    if department is not None:
+        complaints = complaints.filter(department=department)
+        rows = rows.filter(department=department)
+
+    written = 0
+    with transaction.atomic():
+        rows.delete()
+        batch = []
+        for row in computed_rows(complaints):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                ComplaintDailyStats.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        ComplaintDailyStats.objects.bulk_create(batch)
+    return written + len(batch)
+
+
+def drift(since=None):
+    """Keys whose stored counters differ from Complaint: {key: {metric: (stored, actual)}}"""
+    complaints = Complaint.objects.all()
+    stored_rows = ComplaintDailyStats.objects.all()
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        complaints = complaints.filter(created_at__gte=start)
+        stored_rows = stored_rows.filter(date__gte=since)
+
+    def as_dict(rows):
+        return {tuple(getattr(r, f) for f in KEY_FIELDS): {m: getattr(r, m) for m in METRICS} for r in rows}
+
+    stored, actual = as_dict(stored_rows.iterator()), as_dict(computed_rows(complaints))
+    zero = dict.fromkeys(METRICS, 0)
+    result = {}
+    for key in stored.keys() | actual.keys():
+        have, want = stored.get(key, zero), actual.get(key, zero)
+        # resolution_seconds is summed at different precisions; allow a second per resolved complaint
+        diff = {m: (have[m], want[m]) for m in METRICS if have[m] != want[m]
+                and not (m == 'resolution_seconds' and abs(have[m] - want[m]) <= want['resolved'])}
+        if diff:
+            result[key] = diff
+    return result
+
+
+def stats(department, city=None, since=None, until=None, recent_since=None):
+    """
+    complaint_stats()-shaped counters for a department (and city) from the rollup.
+
+    Args:
+        department: Department name
+        city: City (normalized here), or None for every city
+        since: First creation date to include (None for all time)
+        until: Last creation date to include (None for today)
+        recent_since: Optional date; adds a 'recent' count of complaints created since
+
+    Returns:
+        dict: total, pending, solved, closed, high, medium, low, fully_resolved,
+              partially_resolved, not_resolved, closed_fully_resolved,
+              with_feedback, avg_rating (0 if none), resolution_rate,
+              escalated, sla_breached, resolved, avg_resolution_hours [, recent]
+    """
+    rows = ComplaintDailyStats.objects.filter(department=department)
+    if city is not None:
+        rows = rows.filter(city=normalize_city(city))
+    if since is not None:
+        rows = rows.filter(date__gte=since)
+    if until is not None:
+        rows = rows.filter(date__lte=until)
+    # Aliases can't shadow the summed fields' names
+    sums = {f'sum_{m}': Sum(m) for m in METRICS}
+    sums.update({f'sum_{p.lower()}': Sum('total', filter=Q(priority=p)) for p, _ in Complaint.PRIORITY_CHOICES})
+    if recent_since is not None:
+        sums['sum_recent'] = Sum('total', filter=Q(date__gte=recent_since))
+    result = {k[len('sum_'):]: v or 0 for k, v in rows.order_by().aggregate(**sums).items()}
+
+    result['avg_rating'] = result['rating_sum'] / result['rated'] if result['rated'] else 0
+    result['resolution_rate'] = int(result['closed_fully_resolved'] / result['closed'] * 100) if result['closed'] else 0
+    result['avg_resolution_hours'] = result['resolution_seconds'] / result['resolved'] / 3600 if result['resolved'] else 0
+    return result
+
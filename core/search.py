@@ -0,0 +1,134 @@
+"""
+Complaint full-text search.
+
+PostgreSQL: `core_complaint.search_vector` is a generated tsvector column
+(description weighted A, location_name B) with a GIN index, so it is always in
+sync - including bulk .update() paths - and ranked with ts_rank.
+
+SQLite: `core_complaint_fts` is an FTS5 shadow table (porter stemming) kept in
+sync by the post_save/post_delete handlers in core.signals and ranked with
+bm25. Bulk inserts bypass signals - run `manage.py rebuild_search_index` after
+them.
+
+Other backends (or SQLite builds without FTS5) fall back to icontains.
+Both backends are created by migration 0009.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'core_complaint_fts'
+MAX_TERMS = 8
+
+_fts_available = None
+
+
+def backend():
+    """'postgresql', 'fts5' or 'like'"""
+    global _fts_available
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        if _fts_available is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _fts_available = cursor.fetchone() is not None
+        if _fts_available:
+            return 'fts5'
+    return 'like'
+
+
+def terms(query):
+    """Words in the query, lowercased (punctuation never reaches the FTS parser)"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def ticket_number(query):
+    """The ticket ID in '12345' / '#12345', else None"""
+    query = query.strip().lstrip('#')
+    return int(query) if query.isdigit() and len(query) <= 18 else None
+
+
+def search(complaints, query):
+    """
+    Args:
+        complaints: Complaint queryset already scoped to what the user may see
+        query: Raw search box text
+
+    Returns:
+        QuerySet ordered by relevance, newest first among equals. An exact
+        ticket-ID hit is returned on its own without touching the text index.
+    """
+    ticket = ticket_number(query)
+    if ticket is not None:
+        hit = complaints.filter(ticket_id=ticket)
+        if hit.exists():
+            return hit
+
+    words = terms(query)
+    if not words:
+        return complaints.none()
+
+    engine = backend()
+    if engine == 'postgresql':
+        tsquery = "plainto_tsquery('english', %s)"
+        text = ' '.join(words)
+        return complaints.filter(
+            RawSQL(f"core_complaint.search_vector @@ {tsquery}", [text], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f"ts_rank(core_complaint.search_vector, {tsquery})", [text], output_field=FloatField())
+        ).order_by('-rank', '-created_at', '-id')
+
+    if engine == 'fts5':
+        # Every term must match, the last one as a prefix so "potho" finds "pothole"
+        match = ' '.join(f'"{w}"' for w in words[:-1]) + f' "{words[-1]}"*'
+        # Join the FTS table so MATCH runs once and bm25() (lower is better) is
+        # read per matched row; negated so both backends sort by -rank. The
+        # unary + keeps the planner from probing FTS by rowid for every row in
+        # scope (which re-runs the MATCH each time) - matches drive the join.
+        return complaints.extra(
+            tables=[FTS_TABLE],
+            where=[f"core_complaint.id = +{FTS_TABLE}.rowid", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+            select={'rank': f"-bm25({FTS_TABLE})"},
+        ).order_by('-rank', '-created_at', '-id')
+
+    condition = Q()
+    for word in words:
+        condition &= Q(description__icontains=word) | Q(location_name__icontains=word)
+    return complaints.filter(condition).order_by('-created_at', '-id')
+
+
+def index_complaint(complaint):
+    """Upsert one complaint into the FTS5 table (no-op on other backends)"""
+    if backend() != 'fts5':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, description, location_name) VALUES (%s, %s, %s)",
+            [complaint.pk, complaint.description, complaint.location_name],
+        )
+
+
+def unindex_complaint(pk):
+    if backend() != 'fts5':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+def rebuild_index():
+    """Re-fill the FTS5 table from core_complaint; returns rows indexed (None if not FTS5)"""
+    if backend() != 'fts5':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, description, location_name) "
+            f"SELECT id, description, location_name FROM core_complaint"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, rollup, search
+from .models import Complaint
+
+SEARCH_FIELDS = {'description', 'location_name'}
+
+
+@receiver(post_save, sender=Complaint)
+def index_complaint(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the SQLite FTS5 table in sync; status-only saves skip the write"""
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.index_complaint(instance)
+
+
+@receiver(post_delete, sender=Complaint)
+def unindex_complaint(sender, instance, **kwargs):
+    search.unindex_complaint(instance.pk)
+
+
+@receiver(post_save, sender=Complaint)
+@receiver(post_delete, sender=Complaint)
+def invalidate_stats(sender, instance, **kwargs):
+    """Cached admin stats of the complaint's department/city are stale now"""
+    caching.invalidate(instance.department, instance.city_normalized)
+
+
+@receiver(post_init, sender=Complaint)
+def snapshot_rollup_state(sender, instance, **kwargs):
+    """Remember the loaded state so a save() can move the daily rollup by the difference"""
+    instance._rollup_state = rollup.state(instance) if instance.pk else None
+
+
+@receiver(pre_save, sender=Complaint)
+def load_rollup_state(sender, instance, raw=False, **kwargs):
+    # Loaded with .only()/.defer(): read the stored state instead (one query)
+    if not raw and instance.pk and instance._rollup_state is None:
+        stored = Complaint.objects.filter(pk=instance.pk).values(*rollup.FIELDS).first()
+        instance._rollup_state = stored
+
+
+@receiver(post_save, sender=Complaint)
+def update_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = rollup.state(instance)
+    rollup.record_changes([(instance._rollup_state, new)])
+    instance._rollup_state = new
+
+
+@receiver(post_delete, sender=Complaint)
+def remove_from_rollup(sender, instance, **kwargs):
+    rollup.record_changes([(instance._rollup_state or rollup.state(instance), None)])
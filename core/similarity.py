@@ -0,0 +1,172 @@
+"""
+Near-duplicate complaint detection.
+
+Descriptions are embedded with the classifier's TF-IDF vectorizer (rows are
+L2-normalised, so a sparse dot product is cosine similarity). Open complaints
+from the last SIMILAR_COMPLAINT_DAYS are held in an in-process index
+partitioned by (department, city, grid cell ~2.4 km across); a query scores
+only its own cell and the 8 around it. Complaints without coordinates are
+partitioned by pincode instead.
+
+Partitions load lazily from the database (one geo_cell range scan), take new
+submissions in place, and reload after SIMILAR_INDEX_TTL seconds - which is
+also how complaints submitted through other worker processes, closed or
+transferred show up. Least recently used partitions are dropped beyond
+MAX_PARTITIONS.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+import scipy.sparse as sp
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import geo
+from .ai_model.engine import ai_bot
+from .models import Complaint
+
+CELL_LEVEL = 14  # 360 / 2^14 degrees ~ 2.4 km cells
+MAX_PARTITIONS = 4096  # ~100k open tickets across them is a few tens of MB
+MAX_MATCHES = 100
+
+
+class _Partition:
+    def __init__(self, vectorizer, ids, matrix):
+        self.vectorizer = vectorizer
+        self.ids = ids
+        self.matrix = matrix
+        self.pending = []  # (id, vector) added since the last query
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, pk, vector):
+        with self._lock:
+            if pk not in self.ids and all(pk != p for p, _ in self.pending):
+                self.pending.append((pk, vector))
+
+    def scores(self, vector):
+        with self._lock:
+            if self.pending:
+                self.ids = np.concatenate([self.ids, [pk for pk, _ in self.pending]])
+                self.matrix = sp.vstack([self.matrix] + [v for _, v in self.pending], format='csr')
+                self.pending = []
+            ids, matrix = self.ids, self.matrix
+        return ids, (matrix @ vector.T).toarray().ravel()
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._partitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(complaint):
+        """The partition a complaint belongs to"""
+        base = (complaint.department, complaint.city_normalized)
+        if complaint.latitude is None or complaint.longitude is None:
+            return base + ('pin', complaint.pincode)
+        return base + geo.cell_xy(complaint.latitude, complaint.longitude, CELL_LEVEL)
+
+    def keys(self, complaint):
+        """Partitions to search for a complaint: its own cell and the 8 around it"""
+        department, city, a, b = self.key(complaint)
+        if a == 'pin':
+            return [(department, city, a, b)]
+        return [(department, city, a + dx, b + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+    def _load(self, key, vectorizer):
+        department, city, a, b = key
+        complaints = Complaint.objects.filter(
+            department=department, city_normalized=city,
+            created_at__gte=timezone.now() - timedelta(days=settings.SIMILAR_COMPLAINT_DAYS),
+        ).exclude(status='Closed')
+        if a == 'pin':
+            complaints = complaints.filter(geo_cell__isnull=True, pincode=b)
+        else:
+            complaints = complaints.filter(geo_cell__range=geo.cell_range(a, b, CELL_LEVEL))
+        rows = list(complaints.values_list('id', 'description'))
+        ids = np.array([pk for pk, _ in rows], dtype=np.int64)
+        matrix = vectorizer.transform([text for _, text in rows]) if rows else sp.csr_matrix((0, len(vectorizer.vocabulary_)))
+        return _Partition(vectorizer, ids, matrix.tocsr())
+
+    def _partition(self, key, vectorizer):
+        with self._lock:
+            part = self._partitions.get(key)
+            if part and part.vectorizer is vectorizer and time.monotonic() - part.loaded_at < settings.SIMILAR_INDEX_TTL:
+                self._partitions.move_to_end(key)
+                return part
+        part = self._load(key, vectorizer)
+        with self._lock:
+            self._partitions[key] = part
+            self._partitions.move_to_end(key)
+            while len(self._partitions) > MAX_PARTITIONS:
+                self._partitions.popitem(last=False)
+        return part
+
+    def search(self, complaint, vector, vectorizer, threshold):
+        """[(id, score)] above threshold, best first (the complaint itself excluded)"""
+        ids, scores = [], []
+        for key in self.keys(complaint):
+            part_ids, part_scores = self._partition(key, vectorizer).scores(vector)
+            ids.append(part_ids)
+            scores.append(part_scores)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        hits = np.flatnonzero((scores >= threshold) & (ids != (complaint.pk or -1)))
+        hits = hits[np.argsort(-scores[hits], kind='stable')][:MAX_MATCHES]
+        return [(int(ids[i]), round(float(scores[i]), 3)) for i in hits]
+
+    def add(self, complaint, vector, vectorizer):
+        """Add a new complaint to its partition if that partition is loaded"""
+        with self._lock:
+            part = self._partitions.get(self.key(complaint))
+        if part and part.vectorizer is vectorizer:
+            part.add(complaint.pk, vector)
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+
+index = SimilarityIndex()
+
+
+def find_similar(complaint, threshold=None):
+    """
+    Args:
+        complaint: Complaint (department, city and coordinates/pincode decide where to look)
+        threshold: Minimum cosine similarity (default settings.SIMILAR_COMPLAINT_THRESHOLD)
+
+    Returns:
+        list: [(complaint id, score)] best first, or None while no ML model is loaded
+    """
+    vectorizer, vectors = ai_bot.embed([complaint.description])
+    if vectorizer is None:
+        return None
+    if threshold is None:
+        threshold = settings.SIMILAR_COMPLAINT_THRESHOLD
+    return index.search(complaint, vectors, vectorizer, threshold)
+
+
+def record_submission(complaint):
+    """
+    Link a newly submitted complaint to its near-duplicates: its own
+    similar_complaints_count becomes the number of matches, and each match's
+    count goes up by one.
+
+    Returns:
+        list: [(complaint id, score)] of the matches (empty while no ML model is loaded)
+    """
+    vectorizer, vectors = ai_bot.embed([complaint.description])
+    if vectorizer is None:
+        return []
+    matches = index.search(complaint, vectors, vectorizer, settings.SIMILAR_COMPLAINT_THRESHOLD)
+    index.add(complaint, vectors, vectorizer)
+    if matches:
+        Complaint.objects.filter(pk=complaint.pk).update(similar_complaints_count=len(matches))
+        Complaint.objects.filter(pk__in=[pk for pk, _ in matches]).update(similar_complaints_count=F('similar_complaints_count') + 1)
+        complaint.similar_complaints_count = len(matches)
+    return matches
@@ -0,0 +1,129 @@
+"""
+SLA sweep: sets Complaint.sla_breached and is_escalated.
+
+Every ticket has a resolution deadline from its department and priority
+(SLA_HOURS, overridden per department by SLA_DEPARTMENT_HOURS). A ticket still
+Pending after its deadline is breached; after SLA_ESCALATION_FACTOR times the
+deadline it's escalated. Both flags stay set once the ticket is solved - they
+record what happened.
+
+sweep() finds the tickets that just crossed a deadline with one query per
+flag: an OR of created_at range searches, one per (priority, deadline), over
+partial indexes that only hold Pending tickets without the flag. Tickets already
+flagged drop out of the index, so a sweep reads only what it's about to
+change - a few milliseconds however many tickets are open. It then flips the
+flags with set-based UPDATEs in batches, moves the daily rollup
+(escalated/sla_breached counters), drops cached admin stats, and notifies
+department admins (and, on escalation, owners) with one grouped message per
+recipient. Run it every few minutes: sla_sweep (--watch for a worker loop).
+"""
+import functools
+import operator
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching, notifications, rollup
+from .models import Complaint, User, normalize_city
+
+BATCH_SIZE = 5000
+
+
+def deadline_hours(department, priority):
+    """Hours a ticket of this department and priority may stay Pending"""
+    overrides = settings.SLA_DEPARTMENT_HOURS.get(department, {})
+    return overrides.get(priority, settings.SLA_HOURS[priority])
+
+
+def overdue(now, factor=1, **within):
+    """
+    Q matching tickets created more than factor x their deadline before now.
+
+    `within` (field lookups) is repeated inside every OR term rather than
+    ANDed around them: SQLite only turns the OR into one range search per
+    term over a partial index when each term implies the index's condition.
+    """
+    terms = []
+    for priority, default_hours in settings.SLA_HOURS.items():
+        special = {d: hours[priority] for d, hours in settings.SLA_DEPARTMENT_HOURS.items() if priority in hours}
+        terms.append(Q(priority=priority, created_at__lt=now - timedelta(hours=default_hours * factor), **within)
+                     & ~Q(department__in=list(special)))
+        for department, hours in special.items():
+            terms.append(Q(priority=priority, department=department,
+                           created_at__lt=now - timedelta(hours=hours * factor), **within))
+    return functools.reduce(operator.or_, terms)
+
+
+def candidates(flag, now=None):
+    """Pending tickets without `flag` that are past the deadline for it ('sla_breached' or 'is_escalated')"""
+    now = now or timezone.now()
+    factor = settings.SLA_ESCALATION_FACTOR if flag == 'is_escalated' else 1
+    return Complaint.objects.filter(overdue(now, factor, status='Pending', **{flag: False}))
+
+
+def _admins_by_scope():
+    """{(department, normalized city): [admin user ids]}"""
+    admins = defaultdict(list)
+    for pk, department, city in User.objects.filter(is_department_admin=True).values_list('pk', 'department_name', 'city'):
+        admins[(department, normalize_city(city))].append(pk)
+    return admins
+
+
+def _flag(flag, now, admins, limit, notify=True):
+    """Flag one batch; returns the (ticket_id, owner id, department, city) rows flagged"""
+    changes = {flag: True}
+    if flag == 'is_escalated':
+        changes['sla_breached'] = True  # Escalation implies a breach, whatever the settings said earlier
+    with transaction.atomic():
+        rows = list(candidates(flag, now).select_for_update().order_by('created_at')
+                    .values('id', 'ticket_id', *rollup.FIELDS)[:limit])
+        if not rows:
+            return []
+        ids = [row.pop('id') for row in rows]
+        Complaint.objects.filter(id__in=ids, status='Pending').update(**changes)
+        # .update() skips the save() signals
+        rollup.record_update(rows, **changes)
+        caching.invalidate_scopes((row['department'], row['city_normalized']) for row in rows)
+
+        if not notify:
+            return rows
+        to_admins = [(row['ticket_id'], admin) for row in rows
+                     for admin in admins.get((row['department'], row['city_normalized']), ())]
+        if flag == 'is_escalated':
+            notifications.notify_owners([(row['ticket_id'], row['user_id']) for row in rows], notifications.ESCALATED)
+            notifications.notify_owners(to_admins, notifications.ESCALATED_ADMIN)
+        else:
+            notifications.notify_owners(to_admins, notifications.SLA_BREACHED)
+    return rows
+
+
+def sweep(now=None, batch_size=BATCH_SIZE, dry_run=False, notify=True):
+    """
+    Flag newly breached and newly escalated tickets.
+
+    Args:
+        now: Reference time (default: now)
+        batch_size: Tickets flagged per transaction
+        dry_run: Only count
+        notify: Send notifications (off for a first backfill of old tickets)
+
+    Returns:
+        dict: {'breached': n, 'escalated': n}
+    """
+    now = now or timezone.now()
+    if dry_run:
+        return {'breached': candidates('sla_breached', now).count(), 'escalated': candidates('is_escalated', now).count()}
+    admins = _admins_by_scope()
+    result = {}
+    for key, flag in (('breached', 'sla_breached'), ('escalated', 'is_escalated')):
+        result[key] = 0
+        while True:
+            flagged = len(_flag(flag, now, admins, batch_size, notify))
+            result[key] += flagged
+            if flagged < batch_size:
+                break
+    return result
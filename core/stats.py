@@ -0,0 +1,116 @@
+"""
+Complaint statistics computed in a single aggregate query.
+
+Every dashboard/analytics view used to fire one COUNT per number it showed;
+complaint_stats() folds them all into one SELECT with conditional
+Count(filter=Q(...)) aggregates over whatever queryset the view scopes to.
+resolution_time_stats() does the same for solved_at - created_at instead of
+loading resolved complaints into Python.
+"""
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, DurationField, ExpressionWrapper, F, Q
+
+
+def complaint_stats(complaints, recent_since=None):
+    """
+    Args:
+        complaints: Complaint queryset already scoped (department/city or user)
+        recent_since: Optional datetime; adds a 'recent' count of newer complaints
+
+    Returns:
+        dict: total, pending, solved, closed, high, medium, low,
+              fully_resolved, partially_resolved, not_resolved,
+              closed_fully_resolved, with_feedback, avg_rating (0 if none),
+              resolution_rate (% of closed that are fully resolved)
+              [, recent]
+    """
+    aggregates = {
+        'total': Count('id'),
+        'pending': Count('id', filter=Q(status='Pending')),
+        'solved': Count('id', filter=Q(status='Solved')),
+        'closed': Count('id', filter=Q(status='Closed')),
+        'high': Count('id', filter=Q(priority='High')),
+        'medium': Count('id', filter=Q(priority='Medium')),
+        'low': Count('id', filter=Q(priority='Low')),
+        'fully_resolved': Count('id', filter=Q(resolution='Fully Resolved')),
+        'partially_resolved': Count('id', filter=Q(resolution='Partially Resolved')),
+        'not_resolved': Count('id', filter=Q(resolution='Not Resolved')),
+        'closed_fully_resolved': Count('id', filter=Q(status='Closed', resolution='Fully Resolved')),
+        'with_feedback': Count('id', filter=Q(feedback__isnull=False)),
+        'avg_rating': Avg('rating'),
+    }
+    if recent_since is not None:
+        aggregates['recent'] = Count('id', filter=Q(created_at__gte=recent_since))
+
+    stats = complaints.order_by().aggregate(**aggregates)
+    stats['avg_rating'] = stats['avg_rating'] or 0
+    stats['resolution_rate'] = int(stats['closed_fully_resolved'] / stats['closed'] * 100) if stats['closed'] else 0
+    return stats
+
+
+# solved_at - created_at as a database-side interval
+RESOLUTION_TIME = ExpressionWrapper(F('solved_at') - F('created_at'), output_field=DurationField())
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL percentile_cont(p) WITHIN GROUP (ORDER BY expr)"""
+    function = 'PERCENTILE_CONT'
+    name = 'PercentileCont'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = DurationField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def _percentile_fallback(resolved, percentile, count):
+    """
+    percentile_cont for backends without it (SQLite): sort in the database and
+    fetch only the two rows around the rank, then interpolate like PostgreSQL.
+    """
+    rank = percentile * (count - 1)
+    lower = int(rank)
+    values = list(
+        resolved.annotate(duration=RESOLUTION_TIME).order_by('duration')
+        .values_list('duration', flat=True)[lower:lower + 2]
+    )
+    if len(values) == 1:
+        return values[0]
+    return values[0] + (values[1] - values[0]) * (rank - lower)
+
+
+def _hours(duration):
+    return round(duration.total_seconds() / 3600, 1) if duration is not None else 0
+
+
+def resolution_time_stats(complaints):
+    """
+    Resolution time (solved_at - created_at) computed in the database.
+
+    Returns:
+        dict: count, mean_hours, median_hours, p90_hours,
+              by_priority {'High': mean_hours, 'Medium': ..., 'Low': ...}
+    """
+    resolved = complaints.filter(solved_at__isnull=False).order_by()
+    aggregates = {'count': Count('id'), 'mean': Avg(RESOLUTION_TIME)}
+    for priority in ('High', 'Medium', 'Low'):
+        aggregates[priority] = Avg(RESOLUTION_TIME, filter=Q(priority=priority))
+    native_percentiles = connection.vendor == 'postgresql'
+    if native_percentiles:
+        aggregates['median'] = PercentileCont(RESOLUTION_TIME, 0.5)
+        aggregates['p90'] = PercentileCont(RESOLUTION_TIME, 0.9)
+
+    result = resolved.aggregate(**aggregates)
+    if not native_percentiles:
+        result['median'] = result['p90'] = None
+        if result['count']:
+            result['median'] = _percentile_fallback(resolved, 0.5, result['count'])
+            result['p90'] = _percentile_fallback(resolved, 0.9, result['count'])
+
+    return {
+        'count': result['count'],
+        'mean_hours': _hours(result['mean']),
+        'median_hours': _hours(result['median']),
+        'p90_hours': _hours(result['p90']),
+        'by_priority': {p: _hours(result[p]) for p in ('High', 'Medium', 'Low')},
+    }
@@ -0,0 +1,157 @@
+"""
+DB-backed classification queue (no external broker).
+
+In async mode submit_complaint saves the complaint with the keyword triage and
+enqueues a ClassificationTask. A small in-process thread pool drains the
+queue right after the request's transaction commits; the
+process_classification_queue command drains anything left over (e.g. after a
+restart) and can run as a standalone worker.
+
+A claim is a lease of AI_CLASSIFICATION_LEASE_SECONDS: a task still Running
+after that (its worker died) is claimed again, or marked Failed once it has
+used MAX_ATTEMPTS. A batch that fails - model or database error - goes back
+to Queued the same way. Failed complaints keep their keyword triage.
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import caching, rollup, similarity
+from .ai_model.engine import ai_bot
+from .models import ClassificationTask, Complaint, Notification
+
+BATCH_SIZE = 64
+MAX_ATTEMPTS = 3
+
+SUBMITTED_MESSAGE = "✅ Complaint submitted! Assigned to {dept}"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.AI_CLASSIFICATION_WORKERS, thread_name_prefix='civic-classify'
+            )
+        return _executor
+
+
+def enqueue_classification(complaint, notification=None):
+    """Queue full ML classification; runs once the current transaction commits"""
+    task = ClassificationTask.objects.create(complaint=complaint, notification=notification)
+    transaction.on_commit(lambda: _get_executor().submit(_drain_in_thread))
+    return task
+
+
+def _drain_in_thread():
+    try:
+        process_queue()
+    finally:
+        connection.close()  # Pool threads own their connection
+
+
+def shutdown_workers(wait=True):
+    """Stop this process's pool (waiting for running drains); the next enqueue starts a new one"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _lease_expired(now):
+    return Q(status='Running', started_at__lt=now - timedelta(seconds=settings.AI_CLASSIFICATION_LEASE_SECONDS))
+
+
+def fail_expired(now=None):
+    """Mark Failed the tasks whose last allowed attempt's worker died; returns how many"""
+    now = now or timezone.now()
+    return ClassificationTask.objects.filter(_lease_expired(now), attempts__gte=MAX_ATTEMPTS).update(
+        status='Failed', error='Worker lease expired', finished_at=now
+    )
+
+
+def _release(tasks, error):
+    """Give a failed batch back to the queue (or mark it Failed if out of attempts)"""
+    now = timezone.now()
+    ids = [t.id for t in tasks]
+    message = f'{type(error).__name__}: {error}'[:255]
+    ClassificationTask.objects.filter(id__in=ids, attempts__lt=MAX_ATTEMPTS).update(status='Queued', error=message)
+    ClassificationTask.objects.filter(id__in=ids, attempts__gte=MAX_ATTEMPTS).update(
+        status='Failed', error=message, finished_at=now
+    )
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """
+    Claim up to `limit` tasks for this worker.
+
+    Each row is claimed with a conditional UPDATE (status still Queued, or
+    Running past its lease), so concurrent workers never process the same
+    task - no SELECT ... FOR UPDATE needed, which keeps it portable to SQLite.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    fail_expired(now)
+    claimable = Q(status='Queued') | _lease_expired(now)
+    candidates = list(
+        ClassificationTask.objects.filter(claimable, attempts__lt=MAX_ATTEMPTS)
+        .order_by('id').values_list('id', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    ClassificationTask.objects.filter(claimable, id__in=candidates).update(
+        status='Running', claimed_by=token, started_at=now, attempts=F('attempts') + 1
+    )
+    return list(ClassificationTask.objects.filter(claimed_by=token, status='Running').select_related('complaint'))
+
+
+def classify_tasks(tasks):
+    """Run the ML model over a claimed batch and apply the results"""
+    try:
+        depts, _, _ = ai_bot.predict_batch([t.complaint.description for t in tasks])
+        with transaction.atomic():
+            _apply(tasks, depts)
+    except Exception as e:
+        _release(tasks, e)
+        return 0
+    return len(tasks)
+
+
+def _apply(tasks, depts):
+    for task, dept in zip(tasks, depts):
+        if dept != task.complaint.department:
+            # Never override an admin's manual transfer made in the meantime
+            moved = Complaint.objects.filter(id=task.complaint_id, department_confirmed=False).update(department=dept)
+            if moved:
+                # .update() skips the save() signals
+                caching.invalidate(task.complaint.department, task.complaint.city_normalized)
+                caching.invalidate(dept, task.complaint.city_normalized)
+                rollup.record_update([rollup.state(task.complaint)], department=dept)
+                task.complaint.department = dept
+                if task.notification_id:
+                    Notification.objects.filter(id=task.notification_id).update(message=SUBMITTED_MESSAGE.format(dept=dept))
+        # Near-duplicates are looked up in the final department's index
+        similarity.record_submission(task.complaint)
+
+    ClassificationTask.objects.filter(id__in=[t.id for t in tasks]).update(status='Done', finished_at=timezone.now())
+
+
+def process_queue(limit=None):
+    """Drain the queue in batches; returns the number of tasks classified"""
+    done = 0
+    while limit is None or done < limit:
+        tasks = claim_batch(BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - done))
+        if not tasks:
+            break
+        done += classify_tasks(tasks)
+    return done
@@ -1,3 +1,1214 @@
-from django.test import TestCase
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from unittest import enterModuleContext, mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.template import TemplateDoesNotExist
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (activity, caching, export, geo, images, media, notifications, rollup, search, similarity, sla, tasks,
+               trends, user_stats)
+from .ai_model import artifact, engine
+from .ai_model.engine import CivicAI, ai_bot
+from .management.commands.benchmark import SAMPLE_TEXTS, _photo, seed_complaints
+from .models import (ClassificationTask, Complaint, ComplaintDailyStats, Notification, ProcessedImage,
+                     TicketCounter, User)
+from .pagination import decode_cursor, keyset_page, priority_order
+from .stats import complaint_stats, resolution_time_stats
+
+# Max queries per page (auth session/user lookups included); raise only on purpose
+QUERY_CEILINGS = {
+    ('admin', '/dashboard/'): 7,  # Two keyset pages (active + history); map clusters load separately
+    ('admin', '/analytics/'): 3,
+    ('admin', '/dept-stats/'): 4,
+    ('admin', '/feedback/'): 3,
+    ('citizen', '/dashboard/'): 4,  # Unread badge and status counters come off the user row
+    ('citizen', '/analytics/'): 2,
+}
+
+
+def setUpModule():
+    # Tests flush activity themselves: a flush timer would write through its own connection mid-test
+    enterModuleContext(override_settings(ACTIVITY_FLUSH_SECONDS=3600))
+
+
+class KeywordIndexTests(SimpleTestCase):
+    """KeywordIndex finds what the old per-keyword re.search loop found"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bot = CivicAI(lazy=True)  # Keyword dictionaries only, no model
+
+    def legacy(self, text):
+        def found(word):
+            return re.search(r'\b' + re.escape(word) + r'\b', text)
+
+        priority = next((p for p in ('High', 'Medium') if any(map(found, self.bot.priority_keywords[p]))), 'Low')
+        dept = next((d for d, words in self.bot.dept_keywords.items() if any(map(found, words))), None)
+        return priority, dept
+
+    def indexed(self, text):
+        matches = self.bot.keyword_index.match(text)
+        priority = next((p for p in ('High', 'Medium') if p in matches['priority']), 'Low')
+        return priority, (matches['dept'][0] if matches['dept'] else None)
+
+    def test_matches_legacy_loop(self):
+        keywords = [w for words in [*self.bot.priority_keywords.values(), *self.bot.dept_keywords.values()] for w in words]
+        texts = [t.lower() for t in SAMPLE_TEXTS] + keywords + [
+            f'near the {w}s and {w}-side, not a{w}' for w in keywords[::7]  # Plurals and partial words
+        ]
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(self.indexed(text), self.legacy(text))
+
+
+class EngineTests(SimpleTestCase):
+    """The ML engine loads versioned artifacts, swaps in newer ones and falls back to keywords"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.published = tempfile.mkdtemp()
+        with cls.artifacts(cls.published):
+            cls.version = engine.train_and_publish(n_jobs=1)['version']
+        cls.texts = SAMPLE_TEXTS + ['', None, 'Tree fell on the bench in the park']
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.published)
+        super().tearDownClass()
+
+    @staticmethod
+    def artifacts(path):
+        """Point the artifact module at path"""
+        patches = [mock.patch.object(artifact, name, os.path.join(path, *rel)) for name, rel in (
+            ('ARTIFACT_DIR', ()), ('CURRENT_FILE', ('CURRENT',)), ('TRAINING_LOCK', ('.training.lock',)))]
+        stack = contextlib.ExitStack()
+        for patch in patches:
+            stack.enter_context(patch)
+        return stack
+
+    def setUp(self):
+        self.dir = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'artifacts')
+        shutil.copytree(self.published, self.dir)
+        self.enterContext(self.artifacts(self.dir))
+        self.train = self.enterContext(mock.patch.object(CivicAI, 'train_in_background'))
+
+    def manifest(self, name, **changes):
+        path = os.path.join(self.dir, name, artifact.MANIFEST_NAME)
+        with open(path) as f:
+            manifest = json.load(f)
+        with open(path, 'w') as f:
+            json.dump(dict(manifest, **changes), f)
+
+    def keywords(self, bot):
+        return tuple(map(list, zip(*(bot.predict_keywords(text) for text in self.texts))))
+
+    def test_lazy_startup(self):
+        with mock.patch.object(artifact, 'load_artifact', wraps=artifact.load_artifact) as load:
+            bot = CivicAI(lazy=True)
+            self.assertEqual((bot.loaded, bot.bundle, load.call_count), (False, None, 0))
+            bot.predict('Street light not working')  # First prediction loads the model
+            bot.predict('Street light not working')
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(bot.bundle['manifest']['version'], self.version)
+
+    def test_preloaded(self):
+        bot = CivicAI()
+        self.assertTrue(bot.loaded)
+        self.assertEqual(bot.bundle['manifest']['version'], self.version)
+        self.train.assert_not_called()
+
+    def test_predict_batch_matches_predict(self):
+        bot = CivicAI()
+        depts, prios, confidences = bot.predict_batch(self.texts)
+        self.assertEqual(list(zip(depts, prios, confidences)), [bot.predict(text) for text in self.texts])
+        self.assertGreater(max(confidences), 0.5)  # Some came from the model, not keywords
+        self.assertEqual(bot.predict_batch([]), ([], [], []))
+
+    def test_model_error_falls_back_to_keywords(self):
+        bot = CivicAI()
+        # Failing before or after the probabilities are computed
+        for part, method in (('model', 'predict_proba'), ('label_encoder', 'inverse_transform')):
+            with self.subTest(part=part):
+                broken = mock.Mock(wraps=bot.bundle[part])
+                getattr(broken, method).side_effect = ValueError('broken')
+                with mock.patch.dict(bot.bundle, {part: broken}):
+                    self.assertEqual(bot.predict_batch(self.texts), self.keywords(bot))
+
+    def test_bad_manifest_falls_back_to_keywords(self):
+        for case, change in (('incompatible', {'format': artifact.ARTIFACT_FORMAT + 1}),
+                             ('old sklearn', {'versions': dict(artifact.runtime_versions(), sklearn='0.1.0')}),
+                             ('corrupt', None)):
+            with self.subTest(case=case):
+                shutil.rmtree(self.dir)
+                shutil.copytree(self.published, self.dir)
+                if change:
+                    self.manifest(self.version, **change)
+                else:
+                    with open(os.path.join(self.dir, self.version, artifact.MANIFEST_NAME), 'w') as f:
+                        f.write('{"format": ')
+                self.train.reset_mock()
+                bot = CivicAI()
+                self.assertIsNone(bot.bundle)
+                self.train.assert_called_once()  # A compatible one is trained in the background
+                self.assertEqual(bot.predict_batch(self.texts), self.keywords(bot))
+                bot._reload_thread.join()  # Retries the same CURRENT off the request path
+
+    def test_hot_swap(self):
+        bot = CivicAI()
+        newer = self.version + '1'
+        shutil.copytree(os.path.join(self.dir, self.version), os.path.join(self.dir, newer))
+        self.manifest(newer, version=newer)
+        with open(artifact.CURRENT_FILE, 'w') as f:
+            f.write(newer)  # Published by another process
+
+        bot.predict('Garbage not collected')  # Not due yet
+        self.assertEqual(bot.bundle['manifest']['version'], self.version)
+        bot._next_reload_check = 0
+        bot.predict('Garbage not collected')
+        bot._reload_thread.join()
+        self.assertEqual(bot.bundle['manifest']['version'], newer)
+
+    def test_training_lock(self):
+        self.assertTrue(artifact.acquire_training_lock())  # Held by another process
+        self.assertFalse(artifact.acquire_training_lock())
+        with mock.patch.object(engine, 'train_and_publish') as train:
+            CivicAI(lazy=True)._train_model()
+        train.assert_not_called()
+        self.assertTrue(os.path.exists(artifact.TRAINING_LOCK))  # Still the other process's
+
+        stale = time.time() - artifact.TRAINING_LOCK_STALE_SECONDS - 1
+        os.utime(artifact.TRAINING_LOCK, (stale, stale))  # Its owner died
+        with mock.patch.object(engine, 'train_and_publish', return_value=None) as train:
+            CivicAI(lazy=True)._train_model()
+        train.assert_called_once()
+        self.assertFalse(os.path.exists(artifact.TRAINING_LOCK))
+
+
+class ClassificationQueueTests(TestCase):
+    """Queued classifications are applied once; failed batches and dead workers end Queued again or Failed"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+
+    def enqueue(self, department='Municipal', **fields):
+        complaint = Complaint.objects.create(user=self.user, description='No water supply since Monday',
+                                             location_name='Ward 1', pincode='452001', city='Indore',
+                                             department=department, **fields)
+        notification = notifications.notify(self.user, tasks.SUBMITTED_MESSAGE.format(dept=department))
+        return tasks.enqueue_classification(complaint, notification)
+
+    def predict(self, dept):
+        return mock.patch.object(tasks.ai_bot, 'predict_batch', side_effect=lambda texts: ([dept] * len(texts), None, None))
+
+    def test_applied(self):
+        task = self.enqueue()
+        with self.predict('Water'):
+            self.assertEqual(tasks.process_queue(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('Done', 1))
+        self.assertEqual(Complaint.objects.get(pk=task.complaint_id).department, 'Water')
+        self.assertEqual(task.notification.message, tasks.SUBMITTED_MESSAGE.format(dept='Water'))
+        self.assertEqual(rollup.drift(), {})
+
+    def test_manual_transfer_kept(self):
+        task = self.enqueue(department='PWD', department_confirmed=True)
+        with self.predict('Water'):
+            tasks.process_queue()
+        self.assertEqual(Complaint.objects.get(pk=task.complaint_id).department, 'PWD')
+
+    def test_failed_batch(self):
+        task = self.enqueue()
+        with mock.patch.object(tasks.ai_bot, 'predict_batch', side_effect=RuntimeError('model gone')) as predict:
+            self.assertEqual(tasks.process_queue(), 0)
+        self.assertEqual(predict.call_count, tasks.MAX_ATTEMPTS)  # Released back to the queue each time
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.error), ('Failed', 'RuntimeError: model gone'))
+        self.assertEqual(Complaint.objects.get(pk=task.complaint_id).department, 'Municipal')  # Keyword triage
+
+    def test_expired_lease(self):
+        stale = timezone.now() - timedelta(seconds=settings.AI_CLASSIFICATION_LEASE_SECONDS + 1)
+        retried, dead = self.enqueue(), self.enqueue()
+        ClassificationTask.objects.filter(pk=retried.pk).update(status='Running', started_at=stale, attempts=1)
+        ClassificationTask.objects.filter(pk=dead.pk).update(status='Running', started_at=stale,
+                                                             attempts=tasks.MAX_ATTEMPTS)
+        self.assertEqual([t.pk for t in tasks.claim_batch()], [retried.pk])
+        retried.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((retried.status, retried.attempts), ('Running', 2))
+        self.assertEqual(dead.status, 'Failed')
+        self.assertEqual(tasks.claim_batch(), [])  # Leased again, not claimable
+
+
+class ReclassifyTests(TestCase):
+    """reclassify_complaints re-runs the model in batches, leaving admin-confirmed departments alone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+        for department, confirmed in (('Municipal', False), ('PWD', True), ('Water', False)):
+            Complaint.objects.create(user=cls.user, description='Pipe burst near the park', location_name='Ward 1',
+                                     pincode='452001', city='Indore', department=department,
+                                     department_confirmed=confirmed)
+
+    def reclassify(self, *args):
+        predict = lambda texts: (['Water'] * len(texts), ['High'] * len(texts), [0.9] * len(texts))
+        with mock.patch.object(ai_bot, 'predict_batch', side_effect=predict):
+            call_command('reclassify_complaints', '--chunk-size', '2', *args, stdout=io.StringIO())
+        return list(Complaint.objects.order_by('id').values_list('department', 'priority'))
+
+    def test_reclassified(self):
+        self.assertEqual(self.reclassify(), [('Water', 'High'), ('PWD', 'Low'), ('Water', 'High')])
+        self.assertEqual(rollup.drift(), {})
+
+    def test_keep_department(self):
+        self.assertEqual(self.reclassify('--keep-department'), [('Municipal', 'High'), ('PWD', 'High'), ('Water', 'High')])
+
+    def test_dry_run(self):
+        self.assertEqual(self.reclassify('--dry-run'), [('Municipal', 'Low'), ('PWD', 'Low'), ('Water', 'Low')])
+
+
+class TicketIdTests(TransactionTestCase):
+    """Ticket IDs come from per-department counters: unique under concurrent submits, no retries"""
+
+    def setUp(self):
+        TicketCounter._blocks.clear()  # Blocks reserved against another database
+        self.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+
+    def create(self, department):
+        return Complaint.objects.create(user=self.user, description='Pipe burst', location_name='Ward 1',
+                                        pincode='452001', department=department)
+
+    def test_prefix_and_sequence(self):
+        first, second = self.create('Water'), self.create('Water')
+        self.assertEqual(str(first.ticket_id)[:2], '50')
+        self.assertEqual(second.ticket_id, first.ticket_id + 1)
+        self.assertEqual(str(self.create('Fire').ticket_id)[:2], '90')  # No prefix of its own
+
+    def test_rolled_back_reservation(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            lost = self.create('Water')  # Reserves a block inside the transaction
+            raise RuntimeError
+        # The counter UPDATE rolled back with it: another process reserves the same numbers now
+        start, end = TicketCounter._reserve(50, settings.TICKET_ID_BLOCK_SIZE)
+        self.assertEqual(int(f'50{start}'), lost.ticket_id)
+        taken = {int(f'50{seq}') for seq in range(start, end)}
+        self.assertNotIn(self.create('Water').ticket_id, taken)
+
+    def test_committed_reservation_kept(self):
+        with transaction.atomic():
+            first = self.create('Water')
+            self.assertEqual(self.create('Water').ticket_id, first.ticket_id + 1)  # Same block
+        self.assertEqual(self.create('Water').ticket_id, first.ticket_id + 2)  # Shared once committed
+
+    def test_concurrent_submits(self):
+        threads, per_thread = 8, 25
+        departments = ['Municipal', 'Police', 'Water', 'Other']
+        created, errors = [], []
+        lock = threading.Lock()
+
+        def worker(n):
+            mine, failed = [], []
+            for i in range(per_thread):
+                try:
+                    mine.append(self.create(departments[(n + i) % len(departments)]).ticket_id)
+                except Exception as e:
+                    failed.append(f'{type(e).__name__}: {e}')
+            with lock:
+                created.extend(mine)
+                errors.extend(failed)
+            connection.close()
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(created)), threads * per_thread)
+        # Each save committed together with its rollup and owner counter updates
+        self.assertEqual(rollup.drift(), {})
+        self.assertEqual(user_stats.drift(), {})
+
+
+class DashboardQueryTests(TestCase):
+    """Dashboard/analytics counters come from one aggregate query; pages stay under their query ceilings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        TicketCounter._blocks.clear()
+        cls.users = {
+            'admin': User.objects.create_user(username='admin', password='x', is_department_admin=True,
+                                              department_name='Water', city='Indore'),
+            'citizen': User.objects.create_user(username='citizen', password='x', city='Indore'),
+        }
+        statuses, priorities = ['Pending', 'Solved', 'Closed'], ['High', 'Medium', 'Low']
+        resolutions = ['Fully Resolved', 'Partially Resolved', None]
+        for i in range(30):
+            Complaint.objects.create(
+                user=cls.users['citizen'], description=f'Complaint {i}', location_name='Ward 1', pincode='452001',
+                city='Indore', department='Water', status=statuses[i % 3], priority=priorities[i // 3 % 3],
+                rating=(i % 5) + 1 if i % 2 else None, feedback='ok' if i % 4 == 0 else None,
+                resolution=resolutions[i % 3], latitude=22.7 + i / 1000, longitude=75.8,
+            )
+
+    def setUp(self):
+        cache.clear()  # Cached admin stats would hide the queries
+
+    def test_complaint_stats(self):
+        complaints = Complaint.objects.for_department('Water', 'Indore')
+        with self.assertNumQueries(1):
+            stats = complaint_stats(complaints)
+        counted = {
+            'total': complaints.count(),
+            'pending': complaints.filter(status='Pending').count(),
+            'closed': complaints.filter(status='Closed').count(),
+            'high': complaints.filter(priority='High').count(),
+            'fully_resolved': complaints.filter(resolution='Fully Resolved').count(),
+            'closed_fully_resolved': complaints.filter(status='Closed', resolution='Fully Resolved').count(),
+            'with_feedback': complaints.filter(feedback__isnull=False).count(),
+        }
+        self.assertEqual({k: stats[k] for k in counted}, counted)
+        ratings = [r for r in complaints.values_list('rating', flat=True) if r is not None]
+        self.assertAlmostEqual(stats['avg_rating'], sum(ratings) / len(ratings))
+
+    def test_query_ceilings(self):
+        for (role, url), ceiling in QUERY_CEILINGS.items():
+            with self.subTest(role=role, url=url):
+                self.client.force_login(self.users[role])
+                with CaptureQueriesContext(connection) as ctx:
+                    try:
+                        self.client.get(url)
+                    except TemplateDoesNotExist:
+                        pass  # Some pages' templates aren't in the repo; count up to render
+                self.assertLessEqual(len(ctx.captured_queries), ceiling,
+                                     '\n'.join(q['sql'] for q in ctx.captured_queries))
+
+
+class ResolutionTimeTests(TestCase):
+    """Resolution-time metrics from the database match the old Python loop over rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_complaints(1000, User.objects.create_user(username='citizen', password='x'))
+
+    def test_matches_python(self):
+        complaints = Complaint.objects.filter(department='Water')
+        hours = sorted((c.solved_at - c.created_at).total_seconds() / 3600
+                       for c in complaints.filter(solved_at__isnull=False))
+
+        def percentile(p):  # Interpolated like percentile_cont
+            rank = p * (len(hours) - 1)
+            lower = int(rank)
+            upper = min(lower + 1, len(hours) - 1)
+            return hours[lower] + (hours[upper] - hours[lower]) * (rank - lower)
+
+        stats = resolution_time_stats(complaints)
+        self.assertEqual(stats['count'], len(hours))
+        self.assertAlmostEqual(stats['mean_hours'], sum(hours) / len(hours), delta=0.05)
+        self.assertAlmostEqual(stats['median_hours'], percentile(0.5), delta=0.05)
+        self.assertAlmostEqual(stats['p90_hours'], percentile(0.9), delta=0.05)
+        for priority, mean in stats['by_priority'].items():
+            rows = [(c.solved_at - c.created_at).total_seconds() / 3600
+                    for c in complaints.filter(solved_at__isnull=False, priority=priority)]
+            self.assertAlmostEqual(mean, sum(rows) / len(rows), delta=0.05)
+
+    def test_nothing_resolved(self):
+        stats = resolution_time_stats(Complaint.objects.none())
+        self.assertEqual((stats['count'], stats['mean_hours'], stats['median_hours']), (0, 0, 0))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Index names and plans are checked on SQLite')
+class IndexUsageTests(TestCase):
+    """The hot admin/citizen queries are planned on the composite indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='citizen', password='x')
+        seed_complaints(3000, cls.user)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')  # Give the planner real statistics
+
+    def assertUsesIndex(self, queryset, *indexes):
+        plan = queryset.explain()
+        self.assertTrue(any(index in plan for index in indexes), f"None of {indexes} in:\n{plan}")
+
+    def test_admin_dashboard(self):
+        scope = Complaint.objects.for_department('Water', 'INDORE')
+        dept_city = ('complaint_dept_city_status', 'complaint_dept_city_cell')  # Same (department, city) prefix
+        self.assertUsesIndex(scope.annotate(sort=priority_order()).order_by('sort', '-created_at', '-id'), *dept_city)
+        self.assertUsesIndex(scope.order_by().values('status', 'priority', 'resolution'), *dept_city)
+        self.assertUsesIndex(scope.filter(status='Pending', description__icontains='road'),
+                             'complaint_dept_city_status')
+        self.assertUsesIndex(scope.filter(status='Closed', created_at__gte='2020-01-01'),
+                             'complaint_dept_city_status')
+
+    def test_citizen_dashboard(self):
+        self.assertUsesIndex(Complaint.objects.filter(user=self.user).order_by('-created_at'),
+                             'complaint_user_created')
+
+    def test_map_clusters(self):
+        scope = Complaint.objects.for_department('Water', 'INDORE')
+        self.assertUsesIndex(geo.in_bbox(scope, (75.85, 22.65, 75.9, 22.7)), 'complaint_dept_city_cell')
+
+
+class KeysetPageTests(TestCase):
+    """Following next_cursor walks the whole ordering once: no row skipped or repeated"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='citizen', password='x')
+        seed_complaints(230, user, days=3)
+        # Ties on (priority, created_at) must be broken by id
+        tied = Complaint.objects.order_by('id')[:40].values_list('pk', flat=True)
+        Complaint.objects.filter(pk__in=list(tied)).update(priority='High', created_at=timezone.now())
+
+    def test_round_trip(self):
+        complaints = Complaint.objects.filter(department__in=['Water', 'Police', 'Fire'])
+        expected = list(complaints.annotate(sort=priority_order())
+                        .order_by('sort', '-created_at', '-id').values_list('pk', flat=True))
+        seen, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = keyset_page(complaints, cursor, size=7)
+            seen.extend(row.pk for row in rows)
+            pages += 1
+            if cursor is None:
+                break
+            self.assertEqual(len(rows), 7)
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, max(1, -(-len(expected) // 7)))
+
+    def test_garbled_cursor_starts_over(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        first, _ = keyset_page(Complaint.objects.all(), size=5)
+        rows, _ = keyset_page(Complaint.objects.all(), 'not-a-cursor', size=5)
+        self.assertEqual(rows, first)
+
+
+class MapClusterTests(TestCase):
+    """Server-side clusters account for every geotagged row in the viewport"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_complaints(3000, User.objects.create_user(username='citizen', password='x'))
+
+    def test_clusters_cover_bbox(self):
+        scope = Complaint.objects.for_department('Water', 'Indore').exclude(status='Closed')
+        centre_lat, centre_lng = 22.7, 75.9
+        for zoom in (11, 13, 15, 17):
+            with self.subTest(zoom=zoom):
+                half_w = 1000 / 256 * 360 / 2 ** zoom / 2  # Viewport of a ~1000x700px map at this zoom
+                half_h = half_w * 0.7
+                west, south, east, north = bbox = (centre_lng - half_w, centre_lat - half_h,
+                                                   centre_lng + half_w, centre_lat + half_h)
+                in_view = scope.filter(latitude__range=(south, north), longitude__range=(west, east))
+                data = geo.clusters(scope, zoom, bbox)
+                self.assertEqual(data['total'], in_view.count())
+                self.assertEqual(sum(c[2] for c in data['clusters']), data['total'])
+                self.assertEqual(sum(c[3] for c in data['clusters']), in_view.filter(priority='High').count())
+                for lat, lng, _, _ in data['clusters']:
+                    self.assertTrue(south - 1e-5 <= lat <= north + 1e-5 and west - 1e-5 <= lng <= east + 1e-5)
+
+
+class SearchTests(TestCase):
+    """The search service finds what the old icontains scan found and stays in sync with saves"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(700, cls.user)
+        search.rebuild_index()  # bulk_create bypasses the sync signals
+
+    def ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_matches_icontains(self):
+        for query in ['pothole', 'street light', 'garbage park', 'Hospital!']:
+            with self.subTest(query=query):
+                condition = Q()
+                for word in search.terms(query):
+                    condition &= Q(description__icontains=word) | Q(location_name__icontains=word)
+                expected = self.ids(Complaint.objects.filter(condition))
+                self.assertTrue(expected)
+                self.assertEqual(self.ids(search.search(Complaint.objects.all(), query)), expected)
+
+    def test_prefix_ticket_and_junk(self):
+        potholes = self.ids(Complaint.objects.filter(description__icontains='pothole'))
+        self.assertEqual(self.ids(search.search(Complaint.objects.all(), 'potho')), potholes)
+        complaint = Complaint.objects.order_by('id')[3]
+        Complaint.objects.filter(pk=complaint.pk).update(ticket_id=501234)  # bulk_create assigns none
+        self.assertEqual(list(search.search(Complaint.objects.all(), '#501234')), [complaint])
+        self.assertFalse(search.search(Complaint.objects.all(), '"*) OR (').exists())
+
+    def test_sync_on_save_and_delete(self):
+        complaint = Complaint.objects.create(user=self.user, description='Broken manhole cover near school',
+                                             location_name='Ward 7', pincode='452001', city='Indore', department='Water')
+        self.assertEqual(self.ids(search.search(Complaint.objects.all(), 'manhole')), {complaint.pk})
+        complaint.description = 'Open drain near school'
+        complaint.save()
+        self.assertFalse(search.search(Complaint.objects.all(), 'manhole').exists())
+        self.assertTrue(search.search(Complaint.objects.all(), 'drain').filter(pk=complaint.pk).exists())
+        complaint.delete()
+        self.assertFalse(search.search(Complaint.objects.all(), 'drain').exists())
+
+
+class ExportTests(TestCase):
+    """Exports stream in every format, ignore bad dates and keep memory flat as rows grow"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(4000, cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        response = self.client.get('/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content)
+
+    def csv_rows(self, **params):
+        return list(csv.reader(io.StringIO(self.get(**params).decode())))[1:]
+
+    def test_formats(self):
+        total = Complaint.objects.filter(user=self.user).count()
+        self.assertEqual(len(self.csv_rows()), total)
+        unzipped = gzip.decompress(self.get(format='csv.gz')).decode()
+        self.assertEqual(len(list(csv.reader(io.StringIO(unzipped)))), total + 1)  # Header
+        lines = self.get(format='jsonl', columns='ticket_id,status').decode().splitlines()
+        self.assertEqual(len(lines), total)
+        self.assertEqual(set(json.loads(lines[0])), {'ticket_id', 'status'})
+        self.assertEqual(self.client.get('/export/', {'format': 'xlsx'}).status_code, 400)
+
+    def test_bad_dates_ignored(self):
+        total = Complaint.objects.filter(user=self.user).count()
+        self.assertEqual(len(self.csv_rows(date_from='2024-02-30', date_to='not-a-date')), total)
+
+    def test_bounds_at_local_midnight(self):
+        Complaint.objects.all().delete()
+        tz = timezone.get_current_timezone()
+        late = Complaint.objects.create(user=self.user, description='Late', location_name='Ward 1', pincode='452001')
+        early = Complaint.objects.create(user=self.user, description='Early', location_name='Ward 1', pincode='452001')
+        Complaint.objects.filter(pk=late.pk).update(created_at=datetime(2024, 3, 9, 23, 50, tzinfo=tz))
+        Complaint.objects.filter(pk=early.pk).update(created_at=datetime(2024, 3, 10, 0, 10, tzinfo=tz))
+        self.assertEqual([r[1] for r in self.csv_rows(date_from='2024-03-10')], ['Early'])
+        self.assertEqual([r[1] for r in self.csv_rows(date_to='2024-03-09')], ['Late'])
+        # Printed in local time too, on the day the bounds put them
+        self.assertEqual([r[5] for r in self.csv_rows()], ['2024-03-09 23:50', '2024-03-10 00:10'])
+        lines = self.get(format='jsonl', columns='created').decode().splitlines()
+        self.assertEqual([json.loads(line)['created'] for line in lines],
+                         ['2024-03-09T23:50:00+05:30', '2024-03-10T00:10:00+05:30'])
+
+    def test_memory_flat(self):
+        ids = list(Complaint.objects.order_by('id').values_list('id', flat=True))
+        for fmt in export.available_formats():
+            with self.subTest(fmt=fmt):
+                for _ in export.stream_export(Complaint.objects.filter(id__lt=ids[10]), fmt):
+                    pass  # Warm-up (lazy imports)
+                peaks = []
+                for limit in (ids[len(ids) // 4], ids[-1] + 1):  # A quarter of the rows, then all of them
+                    tracemalloc.start()
+                    for _ in export.stream_export(Complaint.objects.filter(id__lt=limit), fmt, chunk_size=200):
+                        pass
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                self.assertLess(peaks[1], peaks[0] * 1.5 + 1e6)
+
+
+class SimilarityTests(TestCase):
+    """Near-duplicates are found among open complaints of the same department nearby, and linked both ways"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+        ai_bot.load()
+
+    def setUp(self):
+        similarity.index.clear()
+        self.addCleanup(similarity.index.clear)  # Partitions hold ids of rolled-back rows
+
+    def create(self, lat=22.7196, lng=75.8577, **fields):
+        fields = {'description': 'Huge pothole on the main road near the bridge damaged my vehicle',
+                  'department': 'PWD', **fields}
+        return Complaint.objects.create(user=self.user, location_name='Ward 1', pincode='452001', city='Indore',
+                                        latitude=lat, longitude=lng, **fields)
+
+    def test_duplicate_linked(self):
+        original = self.create()
+        self.create(department='Water')  # Same text, other department
+        self.create(lat=22.9)  # ~20 km away
+        self.create(status='Closed')
+        duplicate = self.create(lat=22.7196 + 0.00045)  # ~50 m north
+        matches = similarity.record_submission(duplicate)
+        self.assertEqual([pk for pk, _ in matches], [original.pk])
+        self.assertEqual(Complaint.objects.get(pk=original.pk).similar_complaints_count, 1)
+        self.assertEqual(Complaint.objects.get(pk=duplicate.pk).similar_complaints_count, 1)
+        # The index took the new complaint in place
+        third = self.create(lat=22.7196 - 0.00045)
+        self.assertEqual({pk for pk, _ in similarity.find_similar(third)}, {original.pk, duplicate.pk})
+
+    def test_unrelated_text(self):
+        self.create()
+        other = self.create(description='Stray dogs near the hospital at night', lat=22.7197)
+        self.assertEqual(similarity.find_similar(other), [])
+
+
+class BulkActionTests(TestCase):
+    """bulk_action notifies every owner in batches: queries bounded by batches, not tickets"""
+
+    rows = 600
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', is_department_admin=True,
+                                             department_name='Water', city='Indore')
+        cls.owners = User.objects.bulk_create([User(username=f'citizen{i}', password='x') for i in range(cls.rows // 5)])
+        seed_complaints(cls.rows, cls.owners[0])
+        Complaint.objects.update(department='Water', status='Pending')
+        cls.ids = list(Complaint.objects.order_by('id').values_list('id', flat=True))
+        for i, owner in enumerate(cls.owners):
+            Complaint.objects.filter(id__in=cls.ids[i::len(cls.owners)]).update(user=owner)
+        rollup.rebuild()  # The set-up updates above bypass the rollup and user counters
+        user_stats.reconcile()
+
+    def ceiling(self):
+        owners, keys = len(self.owners), 2 * self.rows
+        # session + user + savepoint + select + update + release, the owner INSERT batches and unread-counter
+        # UPDATE batches (in a savepoint), and the admin notice + its counter UPDATE (in a savepoint)
+        fields = [f for f in Notification._meta.concrete_fields if not f.primary_key]
+        batch = min(notifications.BATCH_SIZE, connection.ops.bulk_batch_size(fields, self.owners))
+        ceiling = 12 + -(-owners // batch) + -(-owners // notifications.BATCH_SIZE)
+        # Rollup (in a savepoint): select + re-select of new keys, then INSERT/UPDATE batches over at most
+        # two keys (old and new) per ticket
+        fields = [f for f in ComplaintDailyStats._meta.concrete_fields if not f.primary_key]
+        insert_batch = min(rollup.BATCH_SIZE, connection.ops.bulk_batch_size(fields, [None] * keys))
+        update_batch = min(rollup.BATCH_SIZE, (connection.features.max_query_params or keys) // (len(rollup.METRICS) + 1))
+        ceiling += 4 + -(-keys // insert_batch) + -(-keys // update_batch)
+        # Owner complaint counters: one UPDATE per batch of owners
+        return ceiling + -(-owners // user_stats.BATCH_SIZE)
+
+    def test_bulk_actions(self):
+        self.client.force_login(self.admin)
+        ceiling = self.ceiling()
+        for action, extra in [('mark_solved', {}), ('change_priority', {'priority': 'High'}),
+                              ('transfer', {'department': 'PWD'})]:
+            with self.subTest(action=action):
+                before = Notification.objects.count()
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.post('/bulk-action/', {'action': action, 'complaint_ids': ','.join(map(str, self.ids)),
+                                                       **extra})
+                self.assertLessEqual(len(ctx.captured_queries), ceiling)
+                self.assertEqual(Notification.objects.count() - before, len(self.owners) + 1)  # Owners + admin
+        self.assertFalse(Complaint.objects.exclude(department='PWD').exists())
+        self.assertEqual(rollup.drift(), {})
+        self.assertEqual(user_stats.drift(), {})
+
+
+class RollupTests(TestCase):
+    """The daily rollup gives complaint_stats' numbers and follows every status transition path"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', is_department_admin=True,
+                                             department_name='Water', city='Indore')
+        cls.citizen = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(1500, cls.citizen)
+
+    def test_matches_complaint_stats(self):
+        expected, actual = complaint_stats(Complaint.objects.for_department('Water', 'Indore')), rollup.stats('Water', 'Indore')
+        for key in ('total', 'pending', 'solved', 'closed', 'high', 'medium', 'low', 'with_feedback',
+                    'closed_fully_resolved', 'resolution_rate'):
+            self.assertEqual(actual[key], expected[key], key)
+        self.assertAlmostEqual(actual['avg_rating'], expected['avg_rating'])
+
+    def test_transitions(self):
+        admin, citizen = self.client_class(), self.client_class()
+        admin.force_login(self.admin)
+        citizen.force_login(self.citizen)
+        ids = list(Complaint.objects.for_department('Water', 'Indore').order_by('id').values_list('id', flat=True)[:40])
+        Complaint.objects.filter(pk__in=ids).update(status='Pending', solved_at=None, closed_at=None, resolution=None,
+                                                   rating=None, feedback=None)
+        Complaint.objects.filter(pk__in=ids[5:15]).update(status='Solved', solved_at=timezone.now())
+        rollup.rebuild()  # The set-up updates above bypass the rollup and user counters
+        user_stats.reconcile()
+        for pk in ids[:5]:
+            admin.get(f'/solve/{pk}/')
+        for pk in ids[5:10]:
+            citizen.post(f'/verify/{pk}/', {'resolution': 'Fully Resolved', 'feedback': 'good', 'rating': '5'})
+        for pk in ids[10:15]:
+            citizen.get(f'/reopen/{pk}/')
+        for pk in ids[15:20]:
+            admin.post(f'/complaint/{pk}/status/', {'status': 'Solved'})
+        for pk in ids[20:22]:
+            admin.post(f'/transfer/{pk}/', {'new_department': 'PWD'})
+        bulk = ','.join(map(str, ids[22:40]))
+        admin.post('/bulk-action/', {'action': 'change_priority', 'priority': 'High', 'complaint_ids': bulk})
+        admin.post('/bulk-action/', {'action': 'mark_solved', 'complaint_ids': bulk})
+        admin.post('/bulk-action/', {'action': 'transfer', 'department': 'Health', 'complaint_ids': bulk})
+        Complaint.objects.get(pk=ids[0]).delete()
+        Complaint.objects.create(user=self.citizen, description='Pipe burst', location_name='Ward 1', pincode='452001',
+                                 city='Indore', department='Water')
+
+        moved = Complaint.objects.filter(pk__in=ids)
+        self.assertEqual(moved.filter(pk__in=ids[1:5] + ids[15:20], status='Solved').count(), 9)
+        self.assertEqual(moved.filter(pk__in=ids[5:10], status='Closed').count(), 5)
+        self.assertEqual(moved.filter(pk__in=ids[10:15], status='Pending').count(), 5)
+        self.assertEqual(moved.filter(pk__in=ids[22:40], department='Health').count(), 18)
+        self.assertEqual(rollup.drift(), {})
+        self.assertEqual(user_stats.drift(), {})
+
+
+class TrendsTests(TestCase):
+    """Trend series count every complaint once, whatever the interval and grouping"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', is_department_admin=True,
+                                             department_name='Water', city='Indore')
+        seed_complaints(2000, cls.admin)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_totals(self):
+        scope = Complaint.objects.for_department('Water', 'Indore')
+        by_priority = dict(scope.order_by().values('priority').annotate(n=Count('id')).values_list('priority', 'n'))
+        for interval in trends.INTERVALS:
+            for by in ['', *trends.GROUP_BY]:
+                with self.subTest(interval=interval, by=by):
+                    # 366 days back covers every seeded complaint (up to 365 x 24 h old)
+                    data = self.client.get('/analytics/trends/', {'interval': interval, 'by': by, 'days': 366}).json()
+                    self.assertEqual(sum(sum(series['total']) for series in data['series']), scope.count())
+                    self.assertTrue(all(len(series['total']) == len(data['periods']) for series in data['series']))
+                    if by == 'priority':
+                        self.assertEqual({s['group']: sum(s['total']) for s in data['series']}, by_priority)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/analytics/trends/', {'interval': 'hour'}).status_code, 400)
+        self.assertEqual(self.client.get('/analytics/trends/', {'days': 'all'}).status_code, 400)
+
+    def test_moving_average_and_forecast(self):
+        values = np.array([1, 2, 3, 4, 5])
+        self.assertEqual(trends._json(trends.moving_average(values, 3)), [None, None, 2.0, 3.0, 4.0])
+        self.assertEqual(trends._json(trends.forecast(values, 2, 4)), [6.0, 7.0])
+        self.assertEqual(trends._json(trends.forecast(np.array([5, 3, 1]), 2, 3)), [0.0, 0.0])  # Clipped at zero
+
+
+class UserStatsTests(TestCase):
+    """Citizens' status counts are read off their user row and follow their complaints"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(300, cls.citizen)
+
+    def test_counters(self):
+        citizen = User.objects.get(pk=self.citizen.pk)
+        stats = complaint_stats(Complaint.objects.filter(user=citizen))
+        self.assertEqual([getattr(citizen, c) for c in user_stats.COUNTERS],
+                         [stats['total'], stats['pending'], stats['solved'], stats['closed']])
+
+        complaint = Complaint.objects.create(user=citizen, description='Pipe burst', location_name='Ward 1',
+                                             pincode='452001', city='Indore', department='Water')
+        complaint.status = 'Solved'
+        complaint.save()
+        Complaint.objects.filter(user=citizen, status='Closed').first().delete()
+        self.assertEqual(user_stats.drift(), {})
+
+    def test_dashboard_counts_nothing(self):
+        self.client.force_login(self.citizen)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/dashboard/')
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()], [])
+
+    def test_profile_update_keeps_counters(self):
+        """Counters moved by another request while a profile is being saved survive the save"""
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory()),
+                                            IMAGE_STAGING_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        ingest = images.ingest
+
+        def concurrent(upload):  # Runs after the view loaded request.user
+            notifications.notify(self.citizen, 'Complaint solved')
+            Complaint.objects.create(user=self.citizen, description='Pipe burst', location_name='Ward 1',
+                                     pincode='452001', city='Indore', department='Water')
+            return ingest(upload)
+
+        self.client.force_login(self.citizen)
+        before = User.objects.get(pk=self.citizen.pk)
+        with mock.patch.object(images, 'ingest', side_effect=concurrent):
+            self.client.post('/profile/update/', {'first_name': 'Asha', 'address': 'Ward 2',
+                                                  'profile_pic': SimpleUploadedFile('me.jpg', _photo(1, size=(64, 64)))})
+            self.client.post('/update_pic/',
+                             {'profile_pic': SimpleUploadedFile('me.jpg', _photo(2, size=(64, 64)))})
+
+        citizen = User.objects.get(pk=self.citizen.pk)
+        self.assertEqual((citizen.first_name, citizen.address), ('Asha', 'Ward 2'))
+        self.assertIsNotNone(citizen.profile_pic_asset)
+        self.assertEqual(citizen.unread_notifications, before.unread_notifications + 2)
+        self.assertEqual(citizen.complaints_total, before.complaints_total + 2)
+        self.assertEqual(user_stats.drift(), {})
+
+    def test_reconcile(self):
+        User.objects.filter(pk=self.citizen.pk).update(complaints_closed=0, complaints_total=1)  # Drift
+        self.assertEqual(set(user_stats.drift()), {self.citizen.pk})
+        self.assertEqual(user_stats.reconcile(), 1)
+        self.assertEqual(user_stats.drift(), {})
+
+
+class StatsCacheTests(TestCase):
+    """Admin stats views are served from the cache until a complaint in their department changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', is_department_admin=True,
+                                             department_name='Water', city='Indore')
+        seed_complaints(400, cls.admin)
+        Complaint.objects.filter(id__in=Complaint.objects.order_by('id').values('id')[:200]).update(
+            status='Closed', feedback='ok', rating=4, resolution='Fully Resolved')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def get(self, url):
+        """Queries run by the request"""
+        with CaptureQueriesContext(connection) as ctx:
+            try:
+                self.client.get(url)
+            except TemplateDoesNotExist:
+                pass  # Stats are computed before render; the template isn't in the repo
+        return len(ctx.captured_queries)
+
+    def misses(self, view):
+        return caching.counters()[view]['misses']
+
+    def test_cached(self):
+        for url, view in [('/analytics/', 'analytics'), ('/dept-stats/', 'department_stats'), ('/feedback/', 'feedback')]:
+            with self.subTest(url=url):
+                cold = self.get(url)
+                hits = caching.counters()[view]['hits']
+                self.assertLess(self.get(url), cold)
+                self.assertEqual(caching.counters()[view]['hits'], hits + 1)
+
+    def test_invalidated_on_save(self):
+        self.get('/analytics/')
+        other = Complaint.objects.filter(department='Police').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            other.status = 'Solved'
+            other.save()
+        before = self.misses('analytics')
+        self.get('/analytics/')
+        self.assertEqual(self.misses('analytics'), before)  # Another department: still cached
+
+        complaint = Complaint.objects.filter(department='Water', city='Indore').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint.status = 'Pending'
+            complaint.save()
+        self.get('/analytics/')
+        self.assertEqual(self.misses('analytics'), before + 1)
+
+    def test_invalidated_by_bulk_action(self):
+        self.get('/dept-stats/')
+        complaint = Complaint.objects.filter(department='Water', city='Indore').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/bulk-action/', {'action': 'change_priority', 'priority': 'High',
+                                               'complaint_ids': str(complaint.pk)})
+        before = self.misses('department_stats')
+        self.get('/dept-stats/')
+        self.assertEqual(self.misses('department_stats'), before + 1)
+
+
+class NotificationTests(TestCase):
+    """Owner notifications are written in batches; unread counters stay exact through read, notify and prune"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'citizen{i}', password='x') for i in range(4)])
+        Notification.objects.bulk_create([
+            Notification(user=cls.users[i % 4], message=f'Update {i}', is_read=i % 5 == 0) for i in range(200)
+        ])
+        now, ids = timezone.now(), list(Notification.objects.order_by('id').values_list('id', flat=True))
+        for days in range(0, 180, 30):  # Spread over the last 180 days so prune has something to do
+            Notification.objects.filter(id__gt=ids[len(ids) * days // 180]).update(created_at=now - timedelta(days=180 - days))
+        notifications.recount_unread()
+
+    def assertCountersExact(self):
+        for user in User.objects.all():
+            self.assertEqual(user.unread_notifications,
+                             Notification.objects.filter(user=user, is_read=False).count(), user.username)
+
+    def test_notify_owners_batches(self):
+        owners = User.objects.bulk_create([User(username=f'owner{i}', password='x') for i in range(1200)])
+        rows = [(5000 + i, owner.pk) for i, owner in enumerate(owners)] + [(9999, owners[0].pk)]
+        fields = [f for f in Notification._meta.concrete_fields if not f.primary_key]
+        batch = min(notifications.BATCH_SIZE, connection.ops.bulk_batch_size(fields, owners))
+        # savepoint + INSERT batches + unread-counter UPDATE batches + release
+        expected = 2 + -(-len(owners) // batch) + -(-len(owners) // notifications.BATCH_SIZE)
+        with self.assertNumQueries(expected):
+            written = notifications.notify_owners(rows, notifications.SOLVED)
+        self.assertEqual(written, len(owners))  # owners[0]'s two tickets share one message
+        self.assertIn('2 of your tickets', Notification.objects.filter(user=owners[0]).get().message)
+        self.assertCountersExact()
+
+    def test_counters_exact(self):
+        user = User.objects.get(pk=self.users[0].pk)
+        self.client.force_login(user)
+        page = self.client.get('/notifications/', {'unread': 1, 'page_size': 5}).json()
+        self.client.post('/notifications/read/', {'ids': ','.join(str(n['id']) for n in page['notifications'])})
+        self.assertCountersExact()
+        self.client.post('/notifications/read-all/', {})
+        notifications.notify(self.users[1], 'Notice')
+        notifications.notify_owners([(1, u.pk) for u in self.users[2:]], notifications.SOLVED)
+        self.assertCountersExact()
+        self.assertGreater(notifications.prune(90, batch_size=7), 0)
+        self.assertCountersExact()
+
+
+class ImageTests(TestCase):
+    """Uploads are re-encoded without metadata, downscaled, stored once and linked when processed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='citizen', password='x', city='Indore')
+        cls.photo = _photo(0, size=(2400, 1350))
+
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.staging = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, IMAGE_STAGING_ROOT=self.staging,
+                                            AI_ASYNC_CLASSIFICATION=True))
+        self.client.force_login(self.user)
+
+    def submit(self, name, data, content_type='image/jpeg'):
+        return self.client.post('/submit/', {'description': SAMPLE_TEXTS[1], 'location_name': 'Ward 1',
+                                             'pincode': '452001', 'image': SimpleUploadedFile(name, data, content_type)})
+
+    def test_processed(self):
+        self.submit('photo.jpg', self.photo)
+        asset, complaint = ProcessedImage.objects.get(), Complaint.objects.get()
+        self.assertEqual(asset.status, 'Pending')
+        self.assertFalse(complaint.image)  # Nothing shown until processed
+        self.assertTrue(images.process(asset.pk))  # The pool only starts on commit
+
+        asset.refresh_from_db()
+        complaint.refresh_from_db()
+        self.assertEqual(complaint.image.name, asset.name)
+        self.assertEqual((asset.width, asset.height), (1080, 1920))  # EXIF orientation applied, then downscaled
+        self.assertEqual(set(asset.variants), {'320', '640', '1080'})
+        for name in asset.variants.values():
+            with default_storage.open(name, 'rb') as f, Image.open(f) as img:
+                self.assertFalse('exif' in img.info or len(img.getexif()) or 'xmp' in img.info, name)
+        self.assertFalse(any(files for _, _, files in os.walk(self.staging)))  # Raw upload removed
+
+        self.submit('same.jpg', self.photo)
+        self.assertEqual(ProcessedImage.objects.count(), 1)
+        self.assertEqual(Complaint.objects.order_by('-pk').first().image.name, asset.name)
+
+    def test_processed_twice(self):
+        self.submit('photo.jpg', self.photo)
+        asset = ProcessedImage.objects.get()
+        render = images.render
+
+        def finished_elsewhere(source, fail):
+            """Another worker processes the image (and deletes the staged file) while this one renders"""
+            with mock.patch.object(images, 'render', render):
+                self.assertTrue(images.process(asset.pk))
+            if fail:
+                raise OSError('staged file gone')
+            return render(source)
+
+        for fail in (True, False):
+            with self.subTest(fail=fail):
+                with open(os.path.join(self.staging, asset.staged), 'wb') as f:
+                    f.write(self.photo)
+                ProcessedImage.objects.filter(pk=asset.pk).update(status='Pending', staged=asset.staged)
+                with mock.patch.object(images, 'render', side_effect=lambda source: finished_elsewhere(source, fail)):
+                    self.assertFalse(images.process(asset.pk))
+                done = ProcessedImage.objects.get()
+                self.assertEqual((done.status, done.error), ('Done', ''))
+                self.assertEqual(Complaint.objects.get().image.name, done.name)
+
+    def test_rejected(self):
+        response = self.submit('notes.jpg', b'not an image')
+        self.assertEqual([m.message for m in get_messages(response.wsgi_request)], [images.rejected_message()])
+        self.assertFalse(ProcessedImage.objects.exists())
+        self.assertFalse(Complaint.objects.get().image)
+
+
+class MediaTests(SimpleTestCase):
+    """Media is stored once per content and served with ETags and byte ranges"""
+
+    payload = bytes(range(256)) * 1024  # 256 KB
+
+    def setUp(self):
+        self.storage = media.ContentAddressedStorage(location=self.enterContext(tempfile.TemporaryDirectory()))
+        self.name = self.storage.save('complaints/upload.jpg', ContentFile(self.payload))
+
+    def get(self, name=None, **headers):
+        response = media.serve(RequestFactory().get('/media/', **headers), name or self.name, self.storage)
+        body = b''.join(response.streaming_content) if getattr(response, 'streaming', False) else response.content
+        response.close()
+        return response, body
+
+    def test_stored_once(self):
+        names = {self.storage.save(f'complaints/upload_{i}.JPG', ContentFile(self.payload)) for i in range(3)}
+        self.assertEqual(names, {self.name})
+        self.assertEqual(media.content_sha(self.name), hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.storage.location)), 1)
+
+    def test_etag_and_ranges(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.payload))
+        self.assertEqual(response['Cache-Control'], media.IMMUTABLE)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+
+        response, body = self.get(HTTP_RANGE='bytes=0-65535')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, f'bytes 0-65535/{len(self.payload)}'))
+        self.assertEqual(body, self.payload[:65536])
+        self.assertEqual(self.get(HTTP_RANGE='bytes=-10')[1], self.payload[-10:])
+        self.assertEqual(self.get(HTTP_RANGE=f'bytes={len(self.payload)}-')[0].status_code, 416)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')[0].status_code, 200)
+
+    def test_missing_and_traversal(self):
+        with self.assertRaises(Http404):
+            self.get('complaints/missing.jpg')
+        with self.assertRaises(SuspiciousFileOperation):  # 400 from the request handler
+            self.get('../etc/passwd')
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_sendfile(self):
+        response, body = self.get()
+        self.assertEqual((response['X-Accel-Redirect'], body), ('/protected-media/' + self.name, b''))
+
+
+@override_settings(ACTIVITY_UPDATE_INTERVAL=300, ACTIVITY_FLUSH_SIZE=100, ACTIVITY_FLUSH_SECONDS=3600)
+class ActivityTests(TestCase):
+    """last_activity is written once per interval per user, in batches, and counted off its index"""
+
+    def setUp(self):
+        activity.flush()  # Nothing left buffered by other tests
+        self.addCleanup(activity.flush)
+        hour_ago = timezone.now() - timedelta(hours=1)
+        self.users = [User.objects.create_user(username=f'citizen{i}', password='x', last_activity=hour_ago)
+                      for i in range(3)]
+
+    def test_batched(self):
+        middleware = activity.ActivityMiddleware(lambda request: HttpResponse())
+        with CaptureQueriesContext(connection) as ctx:
+            for i in range(30):
+                request = RequestFactory().get('/dashboard/')
+                request.user = self.users[i % 3]
+                middleware(request)
+        self.assertEqual(ctx.captured_queries, [])  # Buffered, not written per view
+        with self.assertNumQueries(1):
+            self.assertEqual(activity.flush(), 3)
+        for user in User.objects.filter(pk__in=[u.pk for u in self.users]):
+            self.assertLess(timezone.now() - user.last_activity, timedelta(minutes=1))
+            self.assertFalse(activity.record(user))  # Not due again within the interval
+
+    def test_active_counts(self):
+        now = timezone.now()
+        for user, minutes in zip(self.users, (2, 10, 30)):
+            User.objects.filter(pk=user.pk).update(last_activity=now - timedelta(minutes=minutes))
+        self.assertEqual(activity.active_counts(), {5: 1, 15: 2, 60: 3})
+        plan = User.objects.filter(last_activity__gte=now).explain()
+        self.assertIn('index', plan.lower())  # Range over last_activity's index, not a table scan
+
+
+class ActivityTimerTests(TransactionTestCase):
+    """Buffered activity is written ACTIVITY_FLUSH_SECONDS later even if no request follows"""
+
+    def test_flushed_without_requests(self):
+        activity.flush()
+        hour_ago = timezone.now() - timedelta(hours=1)
+        user = User.objects.create_user(username='citizen', password='x', last_activity=hour_ago)
+        with override_settings(ACTIVITY_FLUSH_SECONDS=0.2):
+            self.assertTrue(activity.record(user))
+            timer = activity._timer
+        self.assertEqual(User.objects.get(pk=user.pk).last_activity, hour_ago)  # Buffered
+        timer.join(5)
+        self.assertLess(timezone.now() - User.objects.get(pk=user.pk).last_activity, timedelta(minutes=1))
+        self.assertEqual((activity._pending, activity._timer), ({}, None))
+
+
+class SlaSweepTests(TestCase):
+    """The sweep flags exactly the overdue Pending tickets, once, and keeps the rollup exact"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for department in ('Water', 'Fire', 'Health'):
+            User.objects.create_user(username=f'admin-{department}', password='x', is_department_admin=True,
+                                     department_name=department, city='Indore')
+        cls.citizen = User.objects.create_user(username='citizen', password='x', city='Indore')
+        seed_complaints(2000, cls.citizen, days=30)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+
+    def expected(self, now, factor=1):
+        return {pk for pk, department, priority, created in Complaint.objects.filter(status='Pending')
+                .values_list('pk', 'department', 'priority', 'created_at')
+                if now - created > timedelta(hours=sla.deadline_hours(department, priority) * factor)}
+
+    def test_sweep(self):
+        now = timezone.now()
+        breached, escalated = self.expected(now), self.expected(now, settings.SLA_ESCALATION_FACTOR)
+        self.assertTrue(escalated)
+        self.assertEqual(sla.sweep(now, batch_size=300), {'breached': len(breached), 'escalated': len(escalated)})
+        self.assertEqual(set(Complaint.objects.filter(sla_breached=True).values_list('pk', flat=True)), breached)
+        self.assertEqual(set(Complaint.objects.filter(is_escalated=True).values_list('pk', flat=True)), escalated)
+        self.assertEqual(sla.sweep(now), {'breached': 0, 'escalated': 0})  # Flagged once
+        self.assertEqual(rollup.drift(), {})
+        self.assertEqual(user_stats.drift(), {})
+
+        # One grouped message per recipient and batch
+        admins = User.objects.filter(is_department_admin=True)
+        batches = -(-len(breached) // 300) + -(-len(escalated) // 300)
+        self.assertLessEqual(Notification.objects.filter(user__in=admins).count(), admins.count() * batches)
+        self.assertTrue(Notification.objects.filter(user=self.citizen, message__contains='escalated').exists())
+
+    def test_no_notify(self):
+        sla.sweep(notify=False)
+        self.assertFalse(Notification.objects.exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'Index names and plans are checked on SQLite')
+    def test_partial_indexes(self):
+        for flag, index in (('sla_breached', 'unbreached'), ('is_escalated', 'unescalated')):
+            with self.subTest(flag=flag):
+                plan = sla.candidates(flag).explain()
+                searches = [line for line in plan.splitlines() if 'SEARCH' in line]
+                self.assertTrue(searches, plan)
+                self.assertTrue(all(f'_{index} (' in line for line in searches), plan)
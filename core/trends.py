@@ -0,0 +1,156 @@
+"""
+Complaint trend series for capacity planning.
+
+Series come from the daily rollup (ComplaintDailyStats), grouped in the
+database by day, TruncWeek or TruncMonth of the creation date and optionally
+split by category or priority - a year of daily data for one department is
+a single GROUP BY over a few thousand rows. NumPy then fills empty periods
+with zeros and adds per series:
+
+- moving_average: trailing mean over `window` periods (null until full)
+- breach_rate: SLA-breached share of the complaints created in each period
+- forecast: `horizon` periods from the current one on, from a least-squares
+  line through the last FIT_WINDOWS windows of complete periods (the
+  current period is still filling, so it's left out of the fit), clipped at
+  zero
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import ComplaintDailyStats, normalize_city
+
+INTERVALS = {
+    # interval: (truncate the rollup date, default moving-average window)
+    'day': (F('date'), 7),
+    'week': (TruncWeek('date'), 4),
+    'month': (TruncMonth('date'), 3),
+}
+GROUP_BY = ('category', 'priority')
+FIT_WINDOWS = 4
+MAX_HORIZON = 90
+
+
+def period_start(day, interval):
+    """First day of the period containing `day`"""
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(day, interval):
+    if interval == 'week':
+        return day + timedelta(days=7)
+    if interval == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def periods(since, until, interval, count=None):
+    """Period start dates covering since..until (or `count` periods from since)"""
+    result = []
+    day = period_start(since, interval)
+    while (count is None and day <= until) or (count is not None and len(result) < count):
+        result.append(day)
+        day = _next_period(day, interval)
+    return result
+
+
+def moving_average(values, window):
+    """Trailing mean over `window` periods; NaN where fewer are available"""
+    if window <= 1 or len(values) < window:
+        return values.astype(float) if window <= 1 else np.full(len(values), np.nan)
+    sums = np.cumsum(np.concatenate([[0.0], values]))
+    return np.concatenate([np.full(window - 1, np.nan), (sums[window:] - sums[:-window]) / window])
+
+
+def forecast(values, horizon, fit):
+    """Linear least-squares extrapolation of the last `fit` values, clipped at zero"""
+    recent = values[-fit:].astype(float)
+    if not len(recent):
+        return np.zeros(horizon)
+    if len(recent) < 2:
+        return np.full(horizon, recent[-1])
+    slope, intercept = np.polyfit(np.arange(len(recent)), recent, 1)
+    return np.clip(intercept + slope * np.arange(len(recent), len(recent) + horizon), 0, None)
+
+
+def _json(values, digits=2):
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def trends(department, city=None, interval='week', by=None, days=365, window=None, horizon=None):
+    """
+    Args:
+        department: Department name
+        city: City (normalized here), or None for every city of the department
+        interval: 'day', 'week' or 'month'
+        by: None, 'category' or 'priority'
+        days: How far back (creation date), today included
+        window: Moving-average periods (default 7 days / 4 weeks / 3 months)
+        horizon: Periods to forecast (default: one window)
+
+    Returns:
+        dict: interval, by, window, periods (ISO start dates; the last one is
+        the current period), forecast_periods, series [{group, total,
+        sla_breached, breach_rate, resolved, closed, moving_average, forecast}]
+    """
+    truncate, default_window = INTERVALS[interval]
+    window = window or default_window
+    horizon = min(horizon if horizon is not None else window, MAX_HORIZON)
+    until = timezone.localdate()
+    since = period_start(until - timedelta(days=days - 1), interval)  # Whole first period
+
+    rows = ComplaintDailyStats.objects.filter(department=department, date__gte=since, date__lte=until)
+    if city is not None:
+        rows = rows.filter(city=normalize_city(city))
+    group_fields = [by] if by else []
+    grouped = (
+        rows.order_by().annotate(period=truncate).values('period', *group_fields)
+        .annotate(n=Sum('total'), breached=Sum('sla_breached'), n_resolved=Sum('resolved'), n_closed=Sum('closed'))
+        .values_list('period', *group_fields, 'n', 'breached', 'n_resolved', 'n_closed')
+    )
+
+    axis = periods(since, until, interval)
+    index = {day: i for i, day in enumerate(axis)}
+    data = {}  # group -> 4 x periods array (total, sla_breached, resolved, closed)
+    for row in grouped:
+        period, group, counts = row[0], (row[1] if by else None), row[-4:]
+        if group not in data:
+            data[group] = np.zeros((4, len(axis)))
+        data[group][:, index[period_start(period, interval)]] += counts
+    if not by and not data:
+        data[None] = np.zeros((4, len(axis)))
+
+    fit = FIT_WINDOWS * window
+    series = []
+    for group in sorted(data, key=lambda g: (g is None, g or '')):
+        total, breached, resolved, closed = data[group]
+        complete = total[:-1]  # The current period (today's) is still filling
+        with np.errstate(divide='ignore', invalid='ignore'):
+            breach_rate = np.where(total > 0, breached / total, np.nan)
+        series.append({
+            'group': group,
+            'total': total.astype(int).tolist(),
+            'sla_breached': breached.astype(int).tolist(),
+            'breach_rate': _json(breach_rate, 4),
+            'resolved': resolved.astype(int).tolist(),
+            'closed': closed.astype(int).tolist(),
+            'moving_average': _json(moving_average(total, window)),
+            'forecast': _json(forecast(complete, horizon, fit)),
+        })
+
+    return {
+        'interval': interval,
+        'by': by,
+        'window': window,
+        'periods': [day.isoformat() for day in axis],
+        # Forecasts start with the current period, whose total so far is the last entry of `total`
+        'forecast_periods': [day.isoformat() for day in periods(axis[-1], None, interval, count=horizon)],
+        'series': series,
+    }
@@ -12,6 +12,7 @@ urlpatterns = [
 
     # Dashboard & Profile
     path('dashboard/', views.dashboard_view, name='dashboard'),
+    path('dashboard/complaints/', views.dashboard_complaints, name='dashboard_complaints'),
     path('profile/', views.profile_view, name='profile_view'),
     path('profile/update/', views.update_profile, name='update_profile'),
     path('update_pic/', views.update_profile_pic, name='update_profile_pic'),
@@ -32,6 +33,9 @@ urlpatterns = [
     
     # 3. Analytics
     path('analytics/', views.analytics_view, name='analytics'),
+    path('analytics/trends/', views.analytics_trends, name='analytics_trends'),
+    path('analytics/cache-stats/', views.cache_stats, name='cache_stats'),
+    path('analytics/active-users/', views.active_users, name='active_users'),
     
     # 4. Export
     path('export/', views.export_complaints, name='export_complaints'),
@@ -53,9 +57,13 @@ urlpatterns = [
     
     # 10. Notification Settings
     path('notifications/settings/', views.notification_settings, name='notification_settings'),
+    path('notifications/', views.notification_list, name='notification_list'),
+    path('notifications/read/', views.mark_notifications_read, name='mark_notifications_read'),
+    path('notifications/read-all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     
     # 11. Complaint Heatmap
     path('heatmap/', views.complaint_heatmap, name='complaint_heatmap'),
+    path('heatmap/clusters/', views.complaint_clusters, name='complaint_clusters'),
     
     # 12. Bulk Actions
     path('bulk-action/', views.bulk_action, name='bulk_action'),
@@ -0,0 +1,100 @@
+"""
+Per-citizen complaint counters (User.complaints_total/_pending/_solved/_closed).
+
+The citizen dashboard and analytics used to COUNT the user's complaints per
+status on every page load. The counts are denormalized onto the user row
+instead and moved with F() expressions by the same (old, new) complaint
+states the daily rollup gets (rollup.record_changes() forwards them here), so
+every path that keeps the rollup right - save()/delete() signals, bulk
+actions, background classification - keeps these right too. Changes that
+don't touch an owner's status counts (department, priority) cost nothing.
+
+reconcile() recomputes the counters with one GROUP BY (user_stats command).
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import Complaint, User
+
+BATCH_SIZE = 500
+COUNTERS = ('complaints_total', 'complaints_pending', 'complaints_solved', 'complaints_closed')
+STATUS_COUNTERS = {'Pending': 'complaints_pending', 'Solved': 'complaints_solved', 'Closed': 'complaints_closed'}
+
+# (closed complaints above which, level) from the top
+LEVELS = ((15, 'Community Ambassador'), (5, 'Civic Steward'))
+ENTRY_LEVEL = 'Active Resident'
+
+
+def level(closed):
+    """Citizen level from the number of closed complaints"""
+    for threshold, name in LEVELS:
+        if closed > threshold:
+            return name
+    return ENTRY_LEVEL
+
+
+def _add(deltas, values, sign):
+    counters = deltas[values['user_id']]
+    counters['complaints_total'] += sign
+    if values['status'] in STATUS_COUNTERS:
+        counters[STATUS_COUNTERS[values['status']]] += sign
+
+
+def record_changes(pairs):
+    """
+    Args:
+        pairs: (old, new) complaint states as in rollup.record_changes (dicts
+               with user_id and status; None for created/deleted)
+    """
+    deltas = defaultdict(Counter)
+    for old, new in pairs:
+        if old is not None and new is not None and (old['user_id'], old['status']) == (new['user_id'], new['status']):
+            continue
+        if old is not None:
+            _add(deltas, old, -1)
+        if new is not None:
+            _add(deltas, new, +1)
+
+    # Bulk actions move many owners by the same amounts: one UPDATE per distinct change
+    by_change = defaultdict(list)
+    for user_id, counters in deltas.items():
+        change = tuple(sorted((c, d) for c, d in counters.items() if d))
+        if change:
+            by_change[change].append(user_id)
+    for change, user_ids in by_change.items():
+        user_ids.sort()  # Same lock order in every writer
+        updates = {c: Greatest(F(c) + d, 0) for c, d in change}
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            User.objects.filter(pk__in=user_ids[start:start + BATCH_SIZE]).update(**updates)
+
+
+def actual_counts():
+    """{user_id: {counter: n}} computed from Complaint (users with complaints only)"""
+    aggregates = {'complaints_total': Count('id')}
+    aggregates.update({c: Count('id', filter=Q(status=s)) for s, c in STATUS_COUNTERS.items()})
+    rows = Complaint.objects.order_by().values('user_id').annotate(**aggregates)
+    return {row.pop('user_id'): row for row in rows.iterator()}
+
+
+def drift(actual=None):
+    """{user_id: {counter: (stored, actual)}} for users whose counters are wrong"""
+    actual = actual_counts() if actual is None else actual
+    zero = dict.fromkeys(COUNTERS, 0)
+    result = {}
+    for user_id, *values in User.objects.values_list('pk', *COUNTERS).iterator():
+        want = actual.get(user_id, zero)
+        diff = {c: (have, want[c]) for c, have in zip(COUNTERS, values) if have != want[c]}
+        if diff:
+            result[user_id] = diff
+    return result
+
+
+def reconcile():
+    """Rewrite the counters of every drifted user from Complaint; returns how many"""
+    actual = actual_counts()
+    zero = dict.fromkeys(COUNTERS, 0)
+    users = [User(pk=user_id, **actual.get(user_id, zero)) for user_id in drift(actual)]
+    User.objects.bulk_update(users, COUNTERS, batch_size=BATCH_SIZE)
+    return len(users)
@@ -1,17 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Case, When, Value, IntegerField, Count, Avg, Q
+from django.contrib import messages
+from django.db.models import Count
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseNotAllowed
+from django.core.files.storage import default_storage
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.db import transaction
 from .models import User, Complaint, Notification
 from .ai_model.engine import ai_bot
+from .tasks import enqueue_classification, SUBMITTED_MESSAGE
+from .stats import complaint_stats, resolution_time_stats
+from . import activity, caching, export, geo, images, media, notifications, rollup, search, similarity, trends, user_stats
+from .pagination import keyset_page, page_size, DEFAULT_PAGE_SIZE
 import json
 from datetime import datetime, timedelta
 
 # --- UTILS ---
 def send_notif(user, message):
-    Notification.objects.create(user=user, message=message)
+    return notifications.notify(user, message)
 
 # --- AUTH ---
 def auth_view(request):
@@ -74,8 +84,13 @@ def logout_view(request):
 @login_required
 def update_profile_pic(request):
     if request.method == 'POST' and request.FILES.get('profile_pic'):
-        request.user.profile_pic = request.FILES['profile_pic']
-        request.user.save()
+        with transaction.atomic():  # Processing starts on commit, once the user row links the image
+            asset = images.ingest(request.FILES['profile_pic'])
+            if asset:
+                images.attach(request.user, 'profile_pic', asset)
+                request.user.save(update_fields=['profile_pic', 'profile_pic_asset'])
+            else:
+                messages.error(request, images.rejected_message())
     return redirect('dashboard')
 
 @login_required
@@ -83,7 +98,7 @@ def profile_view(request):
     user = request.user
     if user.is_department_admin:
         # Show admin's department complaints
-        complaints = Complaint.objects.filter(department=user.department_name, city__iexact=user.city).order_by('-created_at')
+        complaints = Complaint.objects.for_department(user.department_name, user.city).order_by('-created_at')
         return render(request, 'admin_profile.html', {'user': user, 'complaints': complaints})
     else:
         return render(request, 'profile.html', {'user': user})
@@ -97,47 +112,60 @@ def update_profile(request):
         user.phone = request.POST.get('phone', user.phone)
         user.aadhar_id = request.POST.get('aadhar_id', user.aadhar_id)
         user.address = request.POST.get('address', user.address)
-        if request.FILES.get('profile_pic'):
-            user.profile_pic = request.FILES['profile_pic']
-        user.save()
+        fields = ['first_name', 'last_name', 'phone', 'aadhar_id', 'address']
+        with transaction.atomic():
+            if request.FILES.get('profile_pic'):
+                asset = images.ingest(request.FILES['profile_pic'])
+                if asset:
+                    images.attach(user, 'profile_pic', asset)
+                    fields += ['profile_pic', 'profile_pic_asset']
+                else:
+                    messages.error(request, images.rejected_message())
+            user.save(update_fields=fields)  # Leaves the counters other requests keep with F() alone
         return redirect('profile_view')
     return redirect('dashboard')
 
+# --- MEDIA ---
+@login_required
+def media_file(request, path):
+    """Uploaded files under MEDIA_URL, with ETag, caching and range support (core/media.py)"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    return media.serve(request, path, default_storage)
+
 # --- DASHBOARD ---
 @login_required
 def dashboard_view(request):
     user = request.user
-    notifs = Notification.objects.filter(user=user).order_by('-created_at')[:5]
-    unread_count = Notification.objects.filter(user=user, is_read=False).count()
-    
-    priority_order = Case(When(priority='High', then=Value(1)), When(priority='Medium', then=Value(2)), When(priority='Low', then=Value(3)), output_field=IntegerField())
+    # Badge count is denormalized on the user row; the dropdown lists the latest, read or not
+    unread_count = user.unread_notifications
+    notifs = Notification.objects.filter(user=user).order_by('-id')[:5]
 
     # ADMIN VIEW
     if user.is_department_admin:
-        complaints = Complaint.objects.filter(department=user.department_name, city__iexact=user.city).annotate(sort=priority_order).order_by('sort', '-created_at')
-        active_complaints = complaints.exclude(status='Closed')  # Active cases only
-        closed_complaints = complaints.filter(status='Closed')
-        fully_resolved = closed_complaints.filter(resolution='Fully Resolved').count()
-        
-        # Calculate resolution percentage
-        resolved_percentage = 0
-        if closed_complaints.count() > 0:
-            resolved_percentage = int((fully_resolved / closed_complaints.count()) * 100)
+        base = Complaint.objects.for_department(user.department_name, user.city)
+        stats = rollup.stats(user.department_name, user.city)  # Summed from the daily rollup, not the complaints
+
+        # First page of each tab; the rest is fetched from dashboard_complaints
+        active_complaints, active_next = keyset_page(base.exclude(status='Closed').select_related('user'))
+        history_complaints, history_next = keyset_page(base.select_related('user'))
         
-        hotspots = complaints.values('pincode', 'location_name').annotate(total=Count('id')).order_by('-total')[:5]
-        map_data = list(complaints.exclude(latitude__isnull=True).exclude(status='Closed').values('ticket_id', 'description', 'latitude', 'longitude', 'priority', 'status', 'user__username', 'user__phone'))
+        hotspots = base.values('pincode', 'location_name').annotate(total=Count('id')).order_by('-total')[:5]
         
-        p_data = [complaints.filter(priority='High').count(), complaints.filter(priority='Medium').count(), complaints.filter(priority='Low').count()]
-        s_data = [complaints.filter(status='Pending').count(), complaints.filter(status='Solved').count(), complaints.filter(status='Closed').count()]
+        p_data = [stats['high'], stats['medium'], stats['low']]
+        s_data = [stats['pending'], stats['solved'], stats['closed']]
 
         return render(request, 'dash_admin.html', {
-            'complaints': complaints, 
-            'active_count': active_complaints.count(),
-            'resolved_percentage': resolved_percentage,
+            'active_complaints': active_complaints,
+            'active_next': active_next,
+            'history_complaints': history_complaints,
+            'history_next': history_next,
+            'total_count': stats['total'],
+            'active_count': stats['total'] - stats['closed'],  # Active cases only
+            'resolved_percentage': stats['resolution_rate'],
             'hotspots': hotspots, 
             'chart_prio': json.dumps(p_data), 
             'chart_status': json.dumps(s_data), 
-            'map_data': json.dumps(map_data), 
             'notifs': notifs, 
             'unread_count': unread_count
         })
@@ -145,25 +173,40 @@ def dashboard_view(request):
     # USER VIEW
     else:
         complaints = Complaint.objects.filter(user=user).order_by('-created_at')
-        closed_count = complaints.filter(status='Closed').count()
-        
-        # NEW PROFESSIONAL LOGIC
-        level = "Active Resident"          # Level 1 (Entry)
-        if closed_count > 5: 
-            level = "Civic Steward"        # Level 2 (Intermediate)
-        if closed_count > 15: 
-            level = "Community Ambassador" # Level 3 (Top Tier)
-
+        # Counters live on the user row (core.user_stats): no COUNT queries
         stats = {
-            'total': complaints.count(),
-            'pending': complaints.filter(status='Pending').count(),
-            'solved': complaints.filter(status='Solved').count(),
-            'closed': closed_count,
-            'level': level
+            'total': user.complaints_total,
+            'pending': user.complaints_pending,
+            'solved': user.complaints_solved,
+            'closed': user.complaints_closed,
+            'level': user_stats.level(user.complaints_closed)
         }
         return render(request, 'dash_user.html', {
             'complaints': complaints, 'stats': stats, 'notifs': notifs, 'unread_count': unread_count
         })
+
+@login_required
+def dashboard_complaints(request):
+    """Next keyset page of the admin dashboard's active/history tab (AJAX)"""
+    user = request.user
+    if not user.is_department_admin:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    tab = request.GET.get('tab', 'active')
+    complaints = Complaint.objects.for_department(user.department_name, user.city).select_related('user')
+    if tab == 'active':
+        complaints = complaints.exclude(status='Closed')
+        template = 'partials/admin_case_rows.html'
+    else:
+        template = 'partials/admin_history_rows.html'
+
+    rows, next_cursor = keyset_page(complaints, request.GET.get('cursor'), page_size(request.GET.get('page_size', DEFAULT_PAGE_SIZE)))
+    return JsonResponse({
+        'html': render_to_string(template, {'complaints': rows}, request=request),
+        'count': len(rows),
+        'next_cursor': next_cursor,
+    })
+
 # --- COMPLAINT ACTIONS ---
 @login_required
 def submit_complaint(request):
@@ -176,27 +219,41 @@ def submit_complaint(request):
         lng = request.POST.get('longitude') or None
         
         # Improved AI prediction (confidence not shown to user)
-        dept, prio, confidence = ai_bot.predict(desc)
-        Complaint.objects.create(
-            user=request.user, 
-            description=desc, 
-            location_name=loc, 
-            pincode=pin, 
-            image=img, 
-            department=dept, 
-            priority=prio, 
-            latitude=lat, 
-            longitude=lng, 
-            city=request.user.city,
-            category=request.POST.get('category', 'Other'),
-            is_escalated=False,
-            sla_breached=False,
-            is_public=True,
-            views_count=0,
-            similar_complaints_count=0
-        )
+        # Async mode: provisional keyword triage now, full ML classification queued
+        if settings.AI_ASYNC_CLASSIFICATION:
+            dept, prio, confidence = ai_bot.predict_keywords(desc)
+        else:
+            dept, prio, confidence = ai_bot.predict(desc)
+        with transaction.atomic():  # Image processing starts on commit, once the complaint links it
+            # Stored re-encoded without EXIF; a repeat of an earlier photo reuses its files
+            asset = images.ingest(img) if img else None
+            if img and asset is None:  # The complaint is still filed, without the photo
+                messages.error(request, images.rejected_message())
+            complaint = Complaint(
+                user=request.user, 
+                description=desc, 
+                location_name=loc, 
+                pincode=pin, 
+                department=dept, 
+                priority=prio, 
+                latitude=lat, 
+                longitude=lng, 
+                city=request.user.city,
+                category=request.POST.get('category', 'Other'),
+                is_escalated=False,
+                sla_breached=False,
+                is_public=True,
+                views_count=0,
+                similar_complaints_count=0
+            )
+            images.attach(complaint, 'image', asset)
+            complaint.save()
         # Removed confidence score from user notification
-        send_notif(request.user, f"✅ Complaint submitted! Assigned to {dept}")
+        notif = send_notif(request.user, SUBMITTED_MESSAGE.format(dept=dept))
+        if settings.AI_ASYNC_CLASSIFICATION:
+            enqueue_classification(complaint, notif)  # Also links near-duplicates once classified
+        else:
+            similarity.record_submission(complaint)
     return redirect('dashboard')
 
 @login_required
@@ -236,8 +293,11 @@ def transfer_complaint(request, id):
     if request.method == 'POST':
         c = get_object_or_404(Complaint, id=id)
         if request.user.is_department_admin:
+            caching.invalidate(c.department, c.city_normalized)  # The save() signal covers the new department
             c.department = request.POST.get('new_department')
+            c.department_confirmed = True
             c.save()
+            notifications.notify_owners([(c.ticket_id, c.user_id)], notifications.TRANSFERRED, department=c.department)
     return redirect('dashboard')
 
 @login_required
@@ -299,33 +359,44 @@ def complaint_timeline(request, id):
 # FEATURE 2: Search & Filter Complaints
 @login_required
 def search_complaints(request):
-    """Search complaints by keyword, status, priority, date range"""
-    query = request.GET.get('q', '')
+    """Search complaints by keyword or ticket ID, status, priority, category, date range"""
+    query = request.GET.get('q', '').strip()
     status = request.GET.get('status', '')
     priority = request.GET.get('priority', '')
+    category = request.GET.get('category', '')
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
     
     if request.user.is_department_admin:
-        complaints = Complaint.objects.filter(department=request.user.department_name, city__iexact=request.user.city)
+        complaints = Complaint.objects.for_department(request.user.department_name, request.user.city)
     else:
         complaints = Complaint.objects.filter(user=request.user)
     
-    if query:
-        complaints = complaints.filter(Q(description__icontains=query) | Q(location_name__icontains=query) | Q(ticket_id__icontains=query))
     if status:
         complaints = complaints.filter(status=status)
     if priority:
         complaints = complaints.filter(priority=priority)
+    if category:
+        complaints = complaints.filter(category=category)
     if date_from:
         complaints = complaints.filter(created_at__gte=date_from)
     if date_to:
         complaints = complaints.filter(created_at__lte=date_to)
     
-    return render(request, 'search_results.html', {
-        'complaints': complaints,
+    if query:
+        complaints = search.search(complaints, query)
+    else:
+        complaints = complaints.order_by('-created_at', '-id')
+    
+    page_obj = Paginator(complaints, page_size(request.GET.get('size'))).get_page(request.GET.get('page'))
+    return render(request, 'search_complaints.html', {
+        'complaints': page_obj.object_list,
+        'page_obj': page_obj,
         'query': query,
-        'count': complaints.count()
+        'total_count': page_obj.paginator.count,
+        'statuses': Complaint.STATUS_CHOICES,
+        'priorities': Complaint.PRIORITY_CHOICES,
+        'categories': Complaint.CATEGORY_CHOICES,
     })
 
 # FEATURE 3: Statistics & Analytics
@@ -335,68 +406,111 @@ def analytics_view(request):
     user = request.user
     
     if user.is_department_admin:
-        complaints = Complaint.objects.filter(department=user.department_name, city__iexact=user.city)
+        complaints = Complaint.objects.for_department(user.department_name, user.city)
+        
+        # Last 7 days (today included); read off the daily rollup, not the complaints
+        last_7_days = timezone.localdate() - timedelta(days=6)
+        counts = caching.cached('analytics', user.department_name, user.city,
+                                lambda: rollup.stats(user.department_name, user.city, recent_since=last_7_days))
         
         stats = {
-            'total': complaints.count(),
-            'pending': complaints.filter(status='Pending').count(),
-            'solved': complaints.filter(status='Solved').count(),
-            'closed': complaints.filter(status='Closed').count(),
-            'high_priority': complaints.filter(priority='High').count(),
-            'avg_rating': complaints.filter(rating__isnull=False).aggregate(Avg('rating'))['rating__avg'] or 0,
-            'resolution_rate': 0
+            'total': counts['total'],
+            'pending': counts['pending'],
+            'solved': counts['solved'],
+            'closed': counts['closed'],
+            'high_priority': counts['high'],
+            'avg_rating': counts['avg_rating'],
+            'resolution_rate': counts['resolution_rate']
         }
         
-        closed = complaints.filter(status='Closed')
-        if closed.count() > 0:
-            fully = closed.filter(resolution='Fully Resolved').count()
-            stats['resolution_rate'] = int((fully / closed.count()) * 100)
-        
-        # Last 7 days
-        last_7_days = timezone.now() - timedelta(days=7)
-        recent = complaints.filter(created_at__gte=last_7_days).count()
-        
         return render(request, 'analytics.html', {
             'stats': stats,
-            'recent_complaints': recent,
+            'recent_complaints': counts['recent'],
             'complaints': complaints[:10]
         })
     else:
-        complaints = Complaint.objects.filter(user=user)
         stats = {
-            'total': complaints.count(),
-            'pending': complaints.filter(status='Pending').count(),
-            'solved': complaints.filter(status='Solved').count(),
-            'closed': complaints.filter(status='Closed').count(),
+            'total': user.complaints_total,
+            'pending': user.complaints_pending,
+            'solved': user.complaints_solved,
+            'closed': user.complaints_closed,
         }
         return render(request, 'user_analytics.html', {'stats': stats})
 
+@login_required
+def analytics_trends(request):
+    """
+    Complaint trend series as JSON (admins): ?interval=day|week|month, ?by=category|priority,
+    ?days= (lookback, default 365), ?window= (moving average), ?horizon= (forecast periods),
+    ?all_cities=1 for the whole department
+    """
+    user = request.user
+    if not user.is_department_admin:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    
+    interval = request.GET.get('interval', 'week')
+    by = request.GET.get('by') or None
+    if interval not in trends.INTERVALS or (by and by not in trends.GROUP_BY):
+        return JsonResponse({'error': 'Unknown interval or grouping', 'intervals': list(trends.INTERVALS),
+                             'by': list(trends.GROUP_BY)}, status=400)
+    try:
+        days = max(1, min(int(request.GET.get('days', 365)), 3650))
+        window = max(1, min(int(request.GET['window']), 365)) if request.GET.get('window') else None
+        horizon = max(0, min(int(request.GET['horizon']), trends.MAX_HORIZON)) if request.GET.get('horizon') else None
+    except ValueError:
+        return JsonResponse({'error': 'days, window and horizon must be integers'}, status=400)
+    city = None if request.GET.get('all_cities') else user.city
+    
+    data = caching.cached(
+        'trends', user.department_name, city or caching.ALL_CITIES,
+        lambda: trends.trends(user.department_name, city, interval, by, days, window, horizon),
+        variant=f'{interval}:{by}:{days}:{window}:{horizon}:{timezone.localdate()}',
+    )
+    return JsonResponse(data)
+
+@login_required
+def cache_stats(request):
+    """Stats cache hit/miss counters per view, for monitoring (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    return JsonResponse({
+        'backend': settings.CACHE_BACKEND,
+        'ttl': settings.STATS_CACHE_TTL,
+        'views': caching.counters(),
+    })
+
+@login_required
+def active_users(request):
+    """Users active in the last 5/15/60 minutes (department admins and staff)"""
+    if not (request.user.is_department_admin or request.user.is_staff):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    counts = activity.active_counts()
+    return JsonResponse({
+        'active': {f'{minutes}m': n for minutes, n in counts.items()},
+        'granularity_seconds': settings.ACTIVITY_UPDATE_INTERVAL,  # Activity is recorded this coarsely
+    })
+
 # FEATURE 4: Export Complaints
 @login_required
 def export_complaints(request):
-    """Export complaints to CSV"""
-    import csv
-    from django.http import HttpResponse
+    """Stream complaints as CSV / gzip CSV / JSON Lines / Parquet (?format=, ?columns=, ?date_from=, ?date_to=)"""
+    from django.http import StreamingHttpResponse
     
     if request.user.is_department_admin:
-        complaints = Complaint.objects.filter(department=request.user.department_name, city__iexact=request.user.city)
+        complaints = Complaint.objects.for_department(request.user.department_name, request.user.city)
     else:
         complaints = Complaint.objects.filter(user=request.user)
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="complaints.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Ticket ID', 'Description', 'Location', 'Status', 'Priority', 'Created', 'Resolved', 'Feedback', 'Rating'])
-    
-    for c in complaints:
-        writer.writerow([
-            c.ticket_id, c.description, c.location_name, c.status, c.priority,
-            c.created_at.strftime('%Y-%m-%d %H:%M') if c.created_at else '',
-            c.solved_at.strftime('%Y-%m-%d %H:%M') if c.solved_at else '',
-            c.feedback or '', c.rating or ''
-        ])
+    fmt = request.GET.get('format', 'csv')
+    complaints = export.filter_dates(complaints, request.GET.get('date_from'), request.GET.get('date_to'))
+    try:
+        chunks = export.stream_export(complaints, fmt, export.parse_columns(request.GET.get('columns')))
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'formats': export.available_formats()}, status=400)
     
+    content_type, extension = export.FORMATS[fmt]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="complaints.{extension}"'
     return response
 
 # FEATURE 5: Department Performance
@@ -408,24 +522,27 @@ def department_stats(request):
     
     dept_complaints = Complaint.objects.filter(department=request.user.department_name)
     
-    stats = {
-        'avg_resolution_time': 0,
-        'feedback_average': dept_complaints.filter(rating__isnull=False).aggregate(Avg('rating'))['rating__avg'] or 0,
-        'total_feedback': dept_complaints.filter(feedback__isnull=False).count(),
-        'performance_score': 0
-    }
-    
-    # Calculate avg resolution time (in hours)
-    resolved = dept_complaints.filter(solved_at__isnull=False)
-    if resolved.exists():
-        total_hours = sum([(c.solved_at - c.created_at).total_seconds() / 3600 for c in resolved])
-        stats['avg_resolution_time'] = int(total_hours / resolved.count())
+    def compute():
+        counts = rollup.stats(request.user.department_name)
+        stats = {
+            'avg_resolution_time': 0,
+            'feedback_average': counts['avg_rating'],
+            'total_feedback': counts['with_feedback'],
+            'performance_score': 0
+        }
+        
+        # Resolution time (in hours) - mean/median/p90/per priority, computed in the database
+        stats['resolution_time'] = resolution_time_stats(dept_complaints)
+        stats['avg_resolution_time'] = int(stats['resolution_time']['mean_hours'])
+        
+        # Performance score = (Avg Rating * 20) + (Feedback % * 0.8) + (Closure Rate * 20)
+        if counts['total'] > 0:
+            feedback_pct = (stats['total_feedback'] / counts['total']) * 100
+            closure_rate = (counts['closed'] / counts['total']) * 100
+            stats['performance_score'] = int((stats['feedback_average'] * 20) + (feedback_pct * 0.08) + (closure_rate * 0.2))
+        return stats
     
-    # Performance score = (Avg Rating * 20) + (Feedback % * 0.8) + (Closure Rate * 20)
-    if dept_complaints.count() > 0:
-        feedback_pct = (stats['total_feedback'] / dept_complaints.count()) * 100
-        closure_rate = (dept_complaints.filter(status='Closed').count() / dept_complaints.count()) * 100
-        stats['performance_score'] = int((stats['feedback_average'] * 20) + (feedback_pct * 0.08) + (closure_rate * 0.2))
+    stats = caching.cached('department_stats', request.user.department_name, caching.ALL_CITIES, compute)
     
     return render(request, 'department_stats.html', {
         'stats': stats,
@@ -439,18 +556,19 @@ def feedback_dashboard(request):
     if not request.user.is_department_admin:
         return redirect('dashboard')
     
-    feedback_list = Complaint.objects.filter(
-        department=request.user.department_name,
-        city__iexact=request.user.city,
-        feedback__isnull=False
-    ).exclude(feedback='').order_by('-feedback_submitted_at')
+    feedback_list = Complaint.objects.for_department(
+        request.user.department_name,
+        request.user.city
+    ).filter(feedback__isnull=False).exclude(feedback='').order_by('-feedback_submitted_at')
     
+    counts = caching.cached('feedback', request.user.department_name, request.user.city,
+                            lambda: complaint_stats(feedback_list))
     feedback_stats = {
-        'total_feedback': feedback_list.count(),
-        'avg_rating': feedback_list.filter(rating__isnull=False).aggregate(Avg('rating'))['rating__avg'] or 0,
-        'fully_resolved_feedback': feedback_list.filter(resolution='Fully Resolved').count(),
-        'partially_resolved_feedback': feedback_list.filter(resolution='Partially Resolved').count(),
-        'not_resolved_feedback': feedback_list.filter(resolution='Not Resolved').count(),
+        'total_feedback': counts['total'],
+        'avg_rating': counts['avg_rating'],
+        'fully_resolved_feedback': counts['fully_resolved'],
+        'partially_resolved_feedback': counts['partially_resolved'],
+        'not_resolved_feedback': counts['not_resolved'],
     }
     
     return render(request, 'feedback_dashboard.html', {
@@ -474,6 +592,8 @@ def quick_update_status(request, id):
             if new_status == 'Solved' and not complaint.solved_at:
                 complaint.solved_at = timezone.now()
             complaint.save()
+            if new_status == 'Solved':
+                notifications.notify_owners([(complaint.ticket_id, complaint.user_id)], notifications.SOLVED)
             return JsonResponse({'success': True, 'status': new_status})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
@@ -523,19 +643,64 @@ Closed: {complaint.closed_at or 'Open'}
 # FEATURE 9: Similar Complaints
 @login_required
 def similar_complaints(request, id):
-    """Show similar complaints in same area"""
+    """Show open near-duplicates of a complaint nearby (TF-IDF cosine, see core.similarity)"""
     complaint = get_object_or_404(Complaint, id=id)
     
-    similar = Complaint.objects.filter(
-        pincode=complaint.pincode,
-        department=complaint.department
-    ).exclude(id=id)[:5]
+    matches = similarity.find_similar(complaint)
+    if matches is None:
+        # No ML model loaded yet: same area and department
+        similar = Complaint.objects.filter(
+            pincode=complaint.pincode,
+            department=complaint.department
+        ).exclude(id=id)[:5]
+    else:
+        scores = dict(matches[:5])
+        similar = sorted(
+            Complaint.objects.filter(id__in=scores).exclude(status='Closed'),
+            key=lambda c: -scores[c.id]
+        )
+        for c in similar:
+            c.similarity = scores[c.id]
     
     return render(request, 'similar_complaints.html', {
         'complaint': complaint,
         'similar_complaints': similar
     })
 
+@login_required
+def notification_list(request):
+    """Keyset page of the user's notifications, newest first (?cursor=, ?unread=1, ?page_size=)"""
+    notifs = Notification.objects.filter(user=request.user).order_by('-id')
+    if request.GET.get('unread'):
+        notifs = notifs.filter(is_read=False)
+    cursor = request.GET.get('cursor')
+    if cursor and cursor.isdigit():
+        notifs = notifs.filter(id__lt=int(cursor))
+    size = page_size(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    rows = list(notifs.values('id', 'title', 'message', 'is_read', 'created_at')[:size + 1])
+    return JsonResponse({
+        'notifications': rows[:size],
+        'unread_count': request.user.unread_notifications,
+        'next_cursor': str(rows[size - 1]['id']) if len(rows) > size else None,
+    })
+
+@login_required
+def mark_notifications_read(request):
+    """Mark notifications read (POST ids, repeated or comma-separated)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    ids = [pk for value in request.POST.getlist('ids') for pk in value.split(',') if pk.strip().isdigit()]
+    marked = notifications.mark_read(request.user, ids)
+    return JsonResponse({'marked': marked, 'unread_count': request.user.unread_notifications})
+
+@login_required
+def mark_all_notifications_read(request):
+    """Mark every notification of the user read (POST)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    marked = notifications.mark_all_read(request.user)
+    return JsonResponse({'marked': marked, 'unread_count': 0})
+
 # FEATURE 10: Notification Preferences
 @login_required
 def notification_settings(request):
@@ -558,50 +723,90 @@ def notification_settings(request):
 # FEATURE 11: Track Complaint Live Map
 @login_required
 def complaint_heatmap(request):
-    """Show heatmap of complaints by location"""
+    """Show heatmap of complaints by location (clusters load from complaint_clusters)"""
     if request.user.is_department_admin:
-        complaints = Complaint.objects.filter(
-            department=request.user.department_name,
-            city__iexact=request.user.city
-        ).exclude(latitude__isnull=True)
+        complaints = Complaint.objects.for_department(
+            request.user.department_name,
+            request.user.city
+        )
     else:
-        complaints = Complaint.objects.filter(user=request.user).exclude(latitude__isnull=True)
-    
-    heatmap_data = [{
-        'lat': float(c.latitude),
-        'lng': float(c.longitude),
-        'title': f"#{c.ticket_id}: {c.description[:30]}",
-        'priority': c.priority
-    } for c in complaints]
+        complaints = Complaint.objects.filter(user=request.user)
     
     return render(request, 'complaint_heatmap.html', {
-        'heatmap_data': json.dumps(heatmap_data),
-        'complaint_count': len(heatmap_data)
+        'complaint_count': complaints.filter(geo_cell__isnull=False).count()
     })
 
+@login_required
+def complaint_clusters(request):
+    """Map clusters for a viewport (?zoom=, ?bbox=west,south,east,north, ?active=1 hides Closed)"""
+    if request.user.is_department_admin:
+        complaints = Complaint.objects.for_department(request.user.department_name, request.user.city)
+        point_fields = ['ticket_id', 'description', 'latitude', 'longitude', 'priority', 'status', 'user__username', 'user__phone']
+    else:
+        complaints = Complaint.objects.filter(user=request.user)
+        point_fields = ['ticket_id', 'description', 'latitude', 'longitude', 'priority', 'status']
+    if request.GET.get('active'):
+        complaints = complaints.exclude(status='Closed')
+    
+    try:
+        zoom = max(0, min(int(request.GET.get('zoom', 12)), 20))
+    except ValueError:
+        zoom = 12
+    bbox = geo.parse_bbox(request.GET.get('bbox'))
+    data = geo.clusters(complaints, zoom, bbox)
+    
+    # Street level: few enough rows in view to send the points (with popup details)
+    data['points'] = None
+    if data['total'] <= geo.POINT_LIMIT:
+        data['points'] = list(geo.in_bbox(complaints, bbox).values(*point_fields))
+        for point in data['points']:
+            point['description'] = point['description'][:80]
+    return JsonResponse(data)
+
 # FEATURE 12: Bulk Actions
 @login_required
 def bulk_action(request):
-    """Perform bulk actions on multiple complaints"""
+    """Perform bulk actions on multiple complaints (owners are notified in batches)"""
     if not request.user.is_department_admin:
         return redirect('dashboard')
     
     if request.method == 'POST':
         action = request.POST.get('action')
-        complaint_ids = request.POST.getlist('complaint_ids')
+        # Repeated fields or comma-separated (large selections exceed DATA_UPLOAD_MAX_NUMBER_FIELDS as fields)
+        complaint_ids = [pk for value in request.POST.getlist('complaint_ids') for pk in value.split(',') if pk.strip().isdigit()]
+        # Cap the work one request can do; the rest can be sent again
+        complaint_ids = complaint_ids[:settings.BULK_ACTION_LIMIT]
         
         complaints = Complaint.objects.filter(id__in=complaint_ids, department=request.user.department_name)
         
-        if action == 'mark_solved':
-            complaints.update(status='Solved', solved_at=timezone.now())
-            send_notif(request.user, f"✅ {complaints.count()} complaints marked as solved")
-        elif action == 'change_priority':
-            new_priority = request.POST.get('priority')
-            complaints.update(priority=new_priority)
-            send_notif(request.user, f"✅ {complaints.count()} complaints priority updated")
-        elif action == 'transfer':
-            new_dept = request.POST.get('department')
-            complaints.update(department=new_dept)
-            send_notif(request.user, f"✅ {complaints.count()} complaints transferred")
-    
-    return redirect('dashboard')
\ No newline at end of file
+        with transaction.atomic():
+            # Affected tickets, owners and rollup state in one query, captured before the update changes the filter
+            rows = list(complaints.values('id', 'ticket_id', *rollup.FIELDS))
+            changed = Complaint.objects.filter(id__in=[row.pop('id') for row in rows])
+            owners = [(row.pop('ticket_id'), row['user_id']) for row in rows]
+            # .update() skips the save() signals: drop cached stats of every department/city touched
+            cities = {row['city_normalized'] for row in rows}
+            caching.invalidate_scopes((request.user.department_name, city) for city in cities)
+            
+            if action == 'mark_solved':
+                now = timezone.now()
+                count = changed.update(status='Solved', solved_at=now)
+                rollup.record_update(rows, status='Solved', solved_at=now)
+                notifications.notify_owners(owners, notifications.SOLVED)
+                send_notif(request.user, f"✅ {count} complaints marked as solved")
+            elif action == 'change_priority':
+                new_priority = request.POST.get('priority')
+                if new_priority in dict(Complaint.PRIORITY_CHOICES):
+                    count = changed.update(priority=new_priority)
+                    rollup.record_update(rows, priority=new_priority)
+                    notifications.notify_owners(owners, notifications.PRIORITY_CHANGED, priority=new_priority)
+                    send_notif(request.user, f"✅ {count} complaints priority updated")
+            elif action == 'transfer':
+                new_dept = request.POST.get('department')
+                count = changed.update(department=new_dept, department_confirmed=True)
+                rollup.record_update(rows, department=new_dept)
+                caching.invalidate_scopes((new_dept, city) for city in cities)
+                notifications.notify_owners(owners, notifications.TRANSFERRED, department=new_dept)
+                send_notif(request.user, f"✅ {count} complaints transferred")
+    
+    return redirect('dashboard')
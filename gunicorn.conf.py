@@ -0,0 +1,44 @@
+"""
+Gunicorn config (picked up automatically from the project root).
+
+With preload_app the Django app and the AI model are loaded once in the
+master process; forked workers share those pages copy-on-write instead of
+each unpickling (or retraining) the RandomForest on boot.
+Set GUNICORN_PRELOAD=False to fall back to per-worker lazy loading.
+"""
+import gc
+import os
+import resource
+import time
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+
+_started = time.perf_counter()
+
+
+def when_ready(server):
+    """Master is up: warm the AI engine before any worker is forked"""
+    if not server.cfg.preload_app:
+        return
+    from core.ai_model.engine import ai_bot
+    ai_bot.load()
+    # Move everything allocated so far out of the GC's reach so collections in
+    # workers don't touch (and un-share) the model's pages.
+    gc.freeze()
+    server.log.info(
+        "Master ready in %.0f ms (AI engine import %s ms, load %s ms)",
+        (time.perf_counter() - _started) * 1000,
+        ai_bot.stats['import_ms'], ai_bot.stats['load_ms'],
+    )
+
+
+def post_worker_init(worker):
+    """Report per-worker boot time and peak RSS"""
+    from core.ai_model.engine import ai_bot
+    worker.log.info(
+        "Worker %s ready %.0f ms after master start, maxrss %d KB, AI engine %s",
+        worker.pid, (time.perf_counter() - _started) * 1000,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'shared from master' if ai_bot.loaded else 'lazy (loads on first predict)',
+    )